@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+"""Compare lookups of ImageCollection with linear scans at 100k+ tags.
+
+Usage:
+    python benchmarks/ecr_images.py [--tags 100000] [--tags-per-image 3] [--lookups 1000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import dataclasses
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from deploy2ecscli.aws.models.ecr import ImageCollection  # noqa: E402
+
+
+class LinearImageCollection(list):
+    '''ImageCollection as it was, a list of dataclasses scanned per lookup
+    '''
+
+    def __init__(self, json: dict):
+        for x in json['imageIds']:
+            if x.get('imageTag'):
+                self.append(LinearImage(x))
+
+    @property
+    def latest(self):
+        return next((x for x in self if x.tag == 'latest'), None)
+
+    def find_by_tag(self, tag):
+        return next((x for x in self if x.tag == tag), None)
+
+    def digest_is(self, digest):
+        return [x for x in self if x.digest == digest] or None
+
+
+@dataclasses.dataclass(init=False, frozen=True)
+class LinearImage:
+    tag: str
+    digest: str
+
+    def __init__(self, json: dict):
+        object.__setattr__(self, 'tag', json['imageTag'])
+        object.__setattr__(self, 'digest', json['imageDigest'])
+
+
+def build_response(tags: int, tags_per_image: int) -> dict:
+    image_ids = []
+    for index in range(tags):
+        # Digests are parsed from JSON, equal values are distinct strings
+        digest = 'sha256:%064x' % (index // tags_per_image)
+        image_ids.append({
+            'imageTag': '%040x' % random.getrandbits(160),
+            'imageDigest': ''.join(list(digest)),
+        })
+
+    image_ids[-1]['imageTag'] = 'latest'
+
+    return {'imageIds': image_ids}
+
+
+def measure(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def allocated(function) -> int:
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tags', type=int, default=100000)
+    parser.add_argument('--tags-per-image', type=int, default=3)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    response = build_response(args.tags, args.tags_per_image)
+    tags = [x['imageTag'] for x in
+            random.sample(response['imageIds'], args.lookups)]
+    digests = [x['imageDigest'] for x in
+               random.sample(response['imageIds'], args.lookups)]
+
+    print('tags: %d, tags per image: %d, lookups: %d' % (
+        args.tags, args.tags_per_image, args.lookups))
+    for name, collection_class in [('linear', LinearImageCollection),
+                                   ('indexed', ImageCollection)]:
+        images = collection_class(response)
+
+        def lookup():
+            for tag, digest in zip(tags, digests):
+                images.latest
+                images.find_by_tag(tag)
+                images.digest_is(digest)
+
+        print('%-8s build %8.1f ms, %d lookups %10.1f ms, memory %6.1f MiB' % (
+            name,
+            measure(lambda: collection_class(response)) * 1000,
+            args.lookups,
+            measure(lookup) * 1000,
+            allocated(lambda: collection_class(response)) / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
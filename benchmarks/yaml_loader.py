@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+"""Compare parse times of configs and templates.
+
+Usage:
+    python benchmarks/yaml_loader.py [--sections 40] [--services 50] [--repeat 5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from deploy2ecscli.yaml import SectionReader, Template, setup_loader  # noqa: E402
+
+
+def build_config(sections: int, services: int) -> str:
+    lines = []
+    for section in range(sections):
+        lines.append('feature/branch-%d:' % section)
+        lines.append('    images:')
+        for service in range(services):
+            lines += [
+                '        -   name: service-%d' % service,
+                '            repository_uri: !Sub ${REGISTRY}/service-%d' % service,
+                '            context: ./services/%d' % service,
+                '            docker_file: ./services/%d/Dockerfile' % service,
+                '            dependencies:',
+                '                -   services/%d/' % service,
+                '                -   lib/',
+            ]
+
+        lines.append('    services:')
+        for service in range(services):
+            lines += [
+                '        -   name: service-%d' % service,
+                '            task_family: !Ref TASK_FAMILY',
+                '            cluster: !Join ["-", [cluster, !Ref ENVIRONMENT]]',
+                '            template: ./config/service.yml',
+            ]
+
+    lines.append('master:')
+    lines.append('    services: []')
+
+    return '\n'.join(lines) + '\n'
+
+
+def build_template(containers: int) -> str:
+    return json.dumps({
+        'family': 'app',
+        'containerDefinitions': [
+            {
+                'name': 'container-%d' % x,
+                'image': 'registry/app:latest',
+                'environment': [
+                    {'name': 'KEY_%d' % y, 'value': str(y)} for y in range(20)],
+                'portMappings': [{'containerPort': 80}],
+            }
+            for x in range(containers)]
+    }, indent=2)
+
+
+def measure(function, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sections', type=int, default=40)
+    parser.add_argument('--services', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault('REGISTRY', 'registry')
+    os.environ.setdefault('TASK_FAMILY', 'app')
+    os.environ.setdefault('ENVIRONMENT', 'production')
+
+    config = build_config(args.sections, args.services)
+    template = build_template(args.services)
+
+    class PureLoader(yaml.SafeLoader):
+        pass
+
+    for tag, constructor in setup_loader().yaml_constructors.items():
+        if isinstance(tag, str) and tag.startswith('!'):
+            PureLoader.add_constructor(tag, constructor)
+
+    cases = [
+        ('config: SafeLoader, all sections',
+         lambda: yaml.load(config, Loader=PureLoader)),
+        ('config: setup_loader, all sections',
+         lambda: yaml.load(config, Loader=setup_loader())),
+        ('config: SectionReader, one section',
+         lambda: SectionReader(config).section('feature/branch-0')),
+        ('template: SafeLoader',
+         lambda: yaml.load(template, Loader=PureLoader)),
+        ('template: Template (YAML)',
+         lambda: Template(template)),
+        ('template: Template (JSON)',
+         lambda: Template(template, is_json=True)),
+    ]
+
+    print('config: %d lines, template: %d lines, libyaml: %s' % (
+        config.count('\n'), template.count('\n'), yaml.__with_libyaml__))
+    for name, function in cases:
+        print('%-40s %8.1f ms' % (name, measure(function, args.repeat) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,40 +7,52 @@
 """Overview:
 
 Usage:
-    deploy2ecs <task> --config=<config_file> [--force-update] [--dry-run] [--quiet] [--verbose] [--tag <tags>...]
-    deploy2ecs --config=<config_file> [--force-update] [--dry-run] [--quiet] [--verbose] [--tag <tags>...] [--task=<task>]
+    deploy2ecs <task> --config=<config_file> [--force-update] [--dry-run] [--quiet] [--verbose] [--fingerprint] [--cache-dir=<cache_dir>] [--deepen-limit=<deepen_limit>] [--branch=<branch>] [--prepare-repo] [--native-git] [--jobs=<jobs>] [--tag <tags>...]
+    deploy2ecs --config=<config_file> [--force-update] [--dry-run] [--quiet] [--verbose] [--fingerprint] [--cache-dir=<cache_dir>] [--deepen-limit=<deepen_limit>] [--branch=<branch>] [--prepare-repo] [--native-git] [--jobs=<jobs>] [--tag <tags>...] [--task=<task>]
     deploy2ecs --help
     deploy2ecs --version
 
 Arguments:
     task                      : Execute task
                                     - build-image
+                                    - promote-image
                                     - register-task-definition
                                     - register-service
+                                    - prepare-repo
 Options:
     --help -h                 : Show this help message and exit
     --version                 : Show version
-    --config -c <config_file> : Config file path
+    --config -c <config_file> : Config file path, or a directory or glob of config files to merge
     --force-update            : Force update
     --dry-run -n              : No build and deploy
     --quiet -q                : No logging
     --verbose -v              : Verbose logging
-    --tags <tags>...          : Add to docker image and push ECR
+    --tags <tags>...          : Add to docker image and push ECR, or to promoted images
+    --fingerprint             : Skip building images whose dependency trees are already tagged
+    --cache-dir <cache_dir>   : Keep git query results in this directory across runs, and ECR tokens
+                                encrypted with $DEPLOY2ECS_TOKEN_CACHE_KEY when it is set
+    --deepen-limit <deepen_limit>
+                              : Fetch up to this many commits of a shallow clone to find built commits
+    --branch <branch>         : Branch name to match config sections, instead of the detected one
+    --prepare-repo            : Run prepare-repo before build-image
+    --native-git              : Read git objects in process instead of running git where possible
+    --jobs -j <jobs>          : Build up to this many images at once
 """
 
 import sys
 import argparse
-import yaml
-import re
 import os
 
+from typing import Optional
+
 from deploy2ecscli import usecases
 from deploy2ecscli import logger
-from deploy2ecscli.config import Application as ApplicationConfig
+from deploy2ecscli.cache import DiskCache
+from deploy2ecscli.config import ApplicationLoader
 from deploy2ecscli.log import Level as LogLevel
 from deploy2ecscli.aws.client import Client as AwsClient
 from deploy2ecscli.git import Git
-from deploy2ecscli.yaml import setup_loader
+from deploy2ecscli.yaml import Resolver
 
 
 class App():
@@ -52,18 +64,29 @@ class App():
         if len(argv) > 1 and not argv[1].startswith('-'):
             accept_tasks = [
                 'build-image',
+                'promote-image',
                 'register-task-definition',
-                'register-service']
+                'register-service',
+                'prepare-repo']
             parser.add_argument('task', choices=accept_tasks)
         else:
             run_all = True
 
         parser.add_argument('--config', '-c', required=True,
-                            type=open, metavar='config_file')
+                            type=self.__open_config, metavar='config_file')
         parser.add_argument('--quiet', '-q', action='store_true')
         parser.add_argument('--verbose', '-v', action='store_true')
         parser.add_argument('--force-update', '-f', action='store_true')
         parser.add_argument('--dry-run', '-n', action='store_true')
+        parser.add_argument('--fingerprint', action='store_true')
+        parser.add_argument('--cache-dir', type=str, metavar='cache_dir')
+        parser.add_argument('--deepen-limit', type=int, default=0,
+                            metavar='deepen_limit')
+        parser.add_argument('--branch', type=str, metavar='branch')
+        parser.add_argument('--prepare-repo', action='store_true')
+        parser.add_argument('--native-git', action='store_true')
+        parser.add_argument('--jobs', '-j', type=int, default=1,
+                            metavar='jobs')
         parser.add_argument('--tags', '-t', type=str,
                             nargs='+', metavar='tags')
         parser.add_argument('--version', action='version',
@@ -78,30 +101,109 @@ class App():
         else:
             logger.level = LogLevel.INFO
 
-        git_client = Git()
-        current_branch = git_client.current_branch
-
-        configs = yaml.load(args.config, Loader=setup_loader())
-        config = next((v for x, v in configs.items()
-                       if re.match(x, current_branch, re.IGNORECASE)), None)
+        cache = None
+        if args.cache_dir:
+            cache = DiskCache(args.cache_dir)
+
+        git_client = Git(cache, native=args.native_git)
+        try:
+            return self.__deploy(args, run_all, git_client, cache)
+        finally:
+            git_client.close()
+
+            if cache is not None:
+                logger.verbose('Cache (%s) %s' % (
+                    cache.directory, cache.summary() or 'not used'))
+                cache.close()
+
+    @classmethod
+    def __open_config(cls, path: str):
+        # Files of a directory or a glob are merged
+        paths = ApplicationLoader.find(path)
+        if paths == []:
+            raise argparse.ArgumentTypeError(
+                'no config files match %s' % path)
+
+        if paths is not None:
+            return paths
+
+        return open(path)
+
+    def __deploy(
+            self,
+            args,
+            run_all: bool,
+            git_client: Git,
+            cache: Optional[DiskCache]):
+        current_branch = args.branch or git_client.current_branch
+
+        # Created on first use, skipping the deployment or preparing the
+        # repository does not need a region
+        aws_clients = []
+
+        def aws_client() -> AwsClient:
+            if not aws_clients:
+                client = AwsClient()
+                client.config.dry_run = args.dry_run
+                client.config.cache = cache
+                aws_clients.append(client)
+
+            return aws_clients[0]
+
+        Resolver.default = Resolver({
+            '!SSM': lambda names: aws_client().ssm.parameters.get_all(names),
+            '!Secret':
+                lambda names: aws_client().secretsmanager.secrets.get_all(names),
+        })
+
+        loader = ApplicationLoader(cache)
+        if isinstance(args.config, list):
+            config = loader.load_all(args.config, current_branch)
+        else:
+            config = loader.load(args.config, current_branch)
 
         if config is None:
             msg = '  We skip the deployment, because there is no setting for `{0}` branch'
             logger.warn(msg.format(current_branch))
             return 0
 
-        config = ApplicationConfig(**config)
+        run_build_image = run_all or args.task == 'build-image'
+        run_register = run_all or \
+            args.task in ['register-task-definition', 'register-service']
+        if run_build_image or run_register:
+            usecase = usecases.PreflightUseCase(
+                config,
+                run_build_image,
+                run_register)
+
+            usecase.execute()
+
+        if (not run_all and args.task == 'prepare-repo') or \
+                (args.prepare_repo and run_build_image):
+            usecase = usecases.PrepareRepositoryUseCase(config, git_client)
 
-        aws_client = AwsClient()
-        aws_client.config.dry_run = args.dry_run
+            usecase.execute()
 
-        if run_all or args.task == 'build-image':
+        if run_build_image:
             usecase = usecases.BuildImageUseCase(
                 config,
-                aws_client,
+                aws_client(),
                 git_client,
                 args.force_update,
                 args.dry_run,
+                args.tags,
+                args.fingerprint,
+                args.deepen_limit,
+                args.jobs)
+
+            usecase.execute()
+
+        if run_all or args.task == 'promote-image':
+            usecase = usecases.PromoteImageUseCase(
+                config,
+                aws_client(),
+                git_client,
+                args.dry_run,
                 args.tags)
 
             usecase.execute()
@@ -109,7 +211,7 @@ class App():
         if run_all or args.task == 'register-task-definition':
             usecase = usecases.RegisterTaskDefinitionUseCase(
                 config,
-                aws_client,
+                aws_client(),
                 git_client,
                 args.force_update)
 
@@ -118,8 +220,11 @@ class App():
         if run_all or args.task == 'register-service':
             usecase = usecases.RegisterServiceUseCase(
                 config,
-                aws_client,
+                aws_client(),
                 git_client,
                 args.force_update)
 
             usecase.execute()
+
+        if run_build_image:
+            logger.verbose(aws_client().ecr.repositories.summary())
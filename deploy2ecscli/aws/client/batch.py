@@ -0,0 +1,28 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Sequence, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def map_batches(
+        function: Callable[[List[T]], R],
+        items: Sequence[T],
+        batch_size: int,
+        max_workers: int = 4) -> List[R]:
+    '''Call function with items split into batches of batch_size,
+    batches running concurrently. Results are in batch order.
+    '''
+
+    batches = [list(items[i:i + batch_size])
+               for i in range(0, len(items), batch_size)]
+    if len(batches) <= 1:
+        return [function(x) for x in batches]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        return list(executor.map(function, batches))
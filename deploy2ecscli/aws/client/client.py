@@ -4,12 +4,16 @@ import dataclasses
 from deploy2ecscli.aws.client.config import Config
 from deploy2ecscli.aws.client.ecr import Client as EcrClient
 from deploy2ecscli.aws.client.ecs import Client as EcsClient
+from deploy2ecscli.aws.client.secretsmanager import Client as SecretsManagerClient
+from deploy2ecscli.aws.client.ssm import Client as SsmClient
 
 
 @dataclasses.dataclass(init=False, frozen=True)
 class Client():
     ecr: EcrClient
     ecs: EcsClient
+    ssm: SsmClient
+    secretsmanager: SecretsManagerClient
     config: Config
 
     def __init__(self, config: Config = None):
@@ -17,7 +21,11 @@ class Client():
 
         ecr = EcrClient(config)
         ecs = EcsClient(config)
+        ssm = SsmClient(config)
+        secretsmanager = SecretsManagerClient(config)
 
         object.__setattr__(self, 'config', config)
         object.__setattr__(self, 'ecr', ecr)
         object.__setattr__(self, 'ecs', ecs)
+        object.__setattr__(self, 'ssm', ssm)
+        object.__setattr__(self, 'secretsmanager', secretsmanager)
@@ -5,10 +5,16 @@
 
 import dataclasses
 
+from typing import Optional
+
+from deploy2ecscli.cache import DiskCache
+
 
 @dataclasses.dataclass()
 class Config():
     dry_run: bool = False
+    # Keeps authorization tokens across runs, encrypted
+    cache: Optional[DiskCache] = None
     default = None # type: Config
 
 Config.default = Config()
\ No newline at end of file
@@ -4,6 +4,7 @@ import boto3
 
 from deploy2ecscli.aws.client.config import Config
 from deploy2ecscli.aws.client.ecr.resources import AuthorizationToken
+from deploy2ecscli.aws.client.ecr.resources import ImageTransfer
 from deploy2ecscli.aws.client.ecr.resources import RepositoryCollection
 
 
@@ -13,9 +14,11 @@ class Client():
     Usage:
         Client().authorization_token
         Client().repositories[repository_name]]
+        Client().transfer.copy(source_uri, tag, destination_uri, tags)
     """
     authorization_token: AuthorizationToken
     repositories: RepositoryCollection
+    transfer: ImageTransfer
 
     def __init__(self, config: Config = None):
         config = config or Config.default
@@ -23,6 +26,8 @@ class Client():
 
         authorization_token = AuthorizationToken(aws_client, config)
         repositories = RepositoryCollection(aws_client, config)
+        transfer = ImageTransfer(aws_client, config)
 
         object.__setattr__(self, 'authorization_token', authorization_token)
         object.__setattr__(self, 'repositories', repositories)
+        object.__setattr__(self, 'transfer', transfer)
@@ -1,26 +1,151 @@
+import os
+import re
+import json
+import time
 import base64
+import hashlib
+import threading
+import collections
 import dataclasses
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import boto3
+
+from botocore.exceptions import ClientError
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = ValueError
 
 from deploy2ecscli import logger as log
+from deploy2ecscli.aws.client.batch import map_batches
 from deploy2ecscli.aws.models.ecr import ImageCollection
 from deploy2ecscli.aws.client.config import Config
 
 
 class AuthorizationToken():
+    '''Docker credentials of ECR registries, fetched on first use and kept
+    until shortly before they expire.
+
+    When the config has a disk cache and DEPLOY2ECS_TOKEN_CACHE_KEY is set,
+    tokens are kept across runs encrypted with the key, so concurrent jobs
+    do not call GetAuthorizationToken each.
+
+    Usage:
+        token = AuthorizationToken(ecr_client)
+        token.get('012345678910.dkr.ecr.us-east-1.amazonaws.com')
+    '''
+
+    NAMESPACE = 'ecr'
+    VERSION = 1
+    KEY_ENVIRONMENT = 'DEPLOY2ECS_TOKEN_CACHE_KEY'
+    # Tokens expiring sooner are fetched again
+    EXPIRY_MARGIN = 5 * 60
+
+    __REGISTRY = re.compile(r'^([0-9]{12})\.dkr\.ecr\.([a-z0-9-]+)\.')
+
     def __init__(self, ecr_client, config: Config = None):
         self.__ecr_client = ecr_client
         self.__config = config or Config.default
+        # registry: (username, password, expires at)
+        self.__tokens = {}  # type: Dict[Optional[str], Tuple[str, str, float]]
+        self.__lock = threading.Lock()
+
+    def get(self, registry: str = None):
+        '''Get credentials of a registry host, of the default registry of the
+        account when it is not given
+        '''
+
+        with self.__lock:
+            token = self.__tokens.get(registry)
+            if token is None or self.__is_expiring(token):
+                token = self.__load(registry) or self.__fetch(registry)
+
+        return {'username': token[0], 'password': token[1]}
+
+    def __fetch(self, registry: Optional[str]) -> Tuple[str, str, float]:
+        params = {}
+        match = self.__REGISTRY.match(registry or '')
+        if match is not None:
+            params['registryIds'] = [match.group(1)]
+
+        log.dump_aws_request('ecr', 'get-authorization-token', params=params)
+        auth_token = self.__ecr_client.get_authorization_token(**params)
+
+        result = None
+        for data in auth_token['authorizationData']:
+            username, password = self.__decode_auth_token(data)
+            expires_at = data.get('expiresAt')
+            expires_at = expires_at.timestamp() if expires_at else time.time()
+            token = (username, password, expires_at)
+
+            host = data.get('proxyEndpoint', '').split('://')[-1].rstrip('/')
+            self.__tokens[host] = token
+            self.__save(host, token)
+            if result is None or host == registry:
+                result = token
+
+        self.__tokens[registry] = result
+
+        return result
+
+    def __load(self, registry: Optional[str]) -> Optional[Tuple[str, str, float]]:
+        cipher = self.__cipher()
+        if cipher is None or self.__REGISTRY.match(registry or '') is None:
+            return None
 
-    def get(self):
-        auth_token = self.__ecr_client.get_authorization_token()
-        username, password = self.__decode_auth_token(auth_token)
+        value = self.__config.cache.get(self.NAMESPACE, self.__key(registry))
+        if value is None:
+            return None
 
-        return {'username': username, 'password': password}
+        try:
+            token = tuple(json.loads(cipher.decrypt(value).decode('utf8')))
+        except (InvalidToken, TypeError, ValueError):
+            return None
+
+        if self.__is_expiring(token):
+            return None
+
+        self.__tokens[registry] = token
+
+        return token
+
+    def __save(self, registry: str, token: Tuple[str, str, float]) -> None:
+        cipher = self.__cipher()
+        if cipher is None or self.__REGISTRY.match(registry) is None or \
+                self.__is_expiring(token):
+            return
+
+        value = cipher.encrypt(json.dumps(list(token)).encode('utf8'))
+        value = value.decode('ascii')
+        self.__config.cache.set(self.NAMESPACE, self.__key(registry), value)
+
+    def __cipher(self):
+        key = os.environ.get(self.KEY_ENVIRONMENT)
+        if Fernet is None or not key or self.__config.cache is None:
+            return None
+
+        # Any passphrase, Fernet takes 32 url-safe base64-encoded bytes
+        key = hashlib.sha256(key.encode('utf8')).digest()
+
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    @classmethod
+    def __key(cls, registry: str) -> list:
+        # Keyed by account and region
+        match = cls.__REGISTRY.match(registry)
+        return ['token', cls.VERSION, match.group(1), match.group(2)]
+
+    @classmethod
+    def __is_expiring(cls, token: Tuple[str, str, float]) -> bool:
+        return token[2] - cls.EXPIRY_MARGIN <= time.time()
 
     def __decode_auth_token(self, auth_token):
-        auth_token = auth_token['authorizationData']
-        auth_token = iter(auth_token)
-        auth_token = next(auth_token)
         auth_token = auth_token['authorizationToken']
         auth_token = base64.b64decode(auth_token)
         login, pwd = auth_token.split(b':', 1)
@@ -30,29 +155,216 @@ class AuthorizationToken():
 
 @dataclasses.dataclass(init=False, frozen=True)
 class Repository():
+    PAGE_SIZE = 1000
+    # Limit of imageIds of BatchGetImage and DescribeImages
+    BATCH_SIZE = 100
+    # Manifests are put back as they are, whatever their format
+    MANIFEST_MEDIA_TYPES = [
+        'application/vnd.docker.distribution.manifest.v2+json',
+        'application/vnd.docker.distribution.manifest.list.v2+json',
+        'application/vnd.oci.image.manifest.v1+json',
+        'application/vnd.oci.image.index.v1+json',
+    ]
+
     name: str
 
     def __init__(self, ecr_client, name: str, config: Config = None):
         object.__setattr__(self, 'ecr_client', ecr_client)
         object.__setattr__(self, 'name', name)
         object.__setattr__(self, 'config', config or Config.default)
+        object.__setattr__(self, '_images', None)
+        object.__setattr__(self, '_request_count', 0)
+        object.__setattr__(self, '_lock', threading.Lock())
 
     @property
-    def images(self):
+    def request_count(self) -> int:
+        '''ECR requests sent for the repository
+        '''
+
+        return object.__getattribute__(self, '_request_count')
+
+    def invalidate(self) -> None:
+        '''Forget images read so far, after pushing to the repository
+        '''
+
+        object.__setattr__(self, '_images', None)
+
+    @property
+    def images(self) -> ImageCollection:
+        '''Images of the repository, pages are read while they are looked up.
+
+        The collection is kept for the run, a page is not listed twice.
+        '''
+
+        images = object.__getattribute__(self, '_images')
+        if images is None:
+            images = ImageCollection(pages=self.image_pages())
+            object.__setattr__(self, '_images', images)
+
+        return images
+
+    def scan_images(self) -> ImageCollection:
+        '''All images of the repository, kept for the run
+        '''
+
+        return self.images.scan()
+
+    def find_images(self, tags: List[str]) -> ImageCollection:
+        '''Images of tags and every tag of their digests, without listing
+        the repository.
+
+        Only the given tags and tags sharing a digest with them are found.
+        '''
+
+        tags = sorted(set(x for x in tags if x))
+        digests = set()
+        for found in map_batches(self.__get_digests, tags, self.BATCH_SIZE):
+            digests |= found
+
+        try:
+            image_ids = []
+            for found in map_batches(
+                    self.__describe_images, sorted(digests), self.BATCH_SIZE):
+                image_ids += found
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ImageNotFoundException':
+                raise
+
+            # Deleted meanwhile
+            return self.images
+
+        return ImageCollection({'imageIds': image_ids})
+
+    def put_tags(self, source_tag: str, tags: List[str]) -> Optional[List[str]]:
+        '''Tag the image of source_tag on ECR, without pulling or pushing
+        layers.
+
+        Tags are written with the manifest of the image. None is returned
+        when the image of source_tag is not found.
+        '''
+
         ecr_client = object.__getattribute__(self, 'ecr_client')
-        result = ecr_client.list_images(repositoryName=self.name)
+        params = {
+            'repositoryName': self.name,
+            'imageIds': [{'imageTag': source_tag}],
+            'acceptedMediaTypes': self.MANIFEST_MEDIA_TYPES,
+        }
+
+        log.dump_aws_request('ecr', 'batch-get-image', params=params)
+
+        result = ecr_client.batch_get_image(**params)
+        self.__count_request()
+
+        images = result.get('images', [])
+        if len(images) == 0:
+            return None
+
+        image = images[0]
+        for tag in tags:
+            params = {
+                'repositoryName': self.name,
+                'imageManifest': image['imageManifest'],
+                'imageTag': tag,
+            }
+            if image.get('imageManifestMediaType'):
+                params['imageManifestMediaType'] = \
+                    image['imageManifestMediaType']
+
+            log.dump_aws_request(
+                'ecr',
+                'put-image',
+                params={'repositoryName': self.name, 'imageTag': tag})
+
+            try:
+                ecr_client.put_image(**params)
+            except ClientError as e:
+                # Tagged meanwhile with the same manifest
+                if e.response['Error']['Code'] != 'ImageAlreadyExistsException':
+                    raise
+            finally:
+                self.__count_request()
+
+        self.invalidate()
+
+        return list(tags)
+
+    def __get_digests(self, tags: List[str]) -> set:
+        ecr_client = object.__getattribute__(self, 'ecr_client')
+        params = {
+            'repositoryName': self.name,
+            'imageIds': [{'imageTag': x} for x in tags],
+        }
+
+        log.dump_aws_request(
+            'ecr',
+            'batch-get-image',
+            params={'repositoryName': self.name, 'imageTags': tags})
+
+        result = ecr_client.batch_get_image(**params)
+        self.__count_request()
+
+        # Missing tags are in failures
+        return set(x['imageId']['imageDigest']
+                   for x in result.get('images', []))
+
+    def __describe_images(self, digests: List[str]) -> List[dict]:
+        ecr_client = object.__getattribute__(self, 'ecr_client')
+        params = {
+            'repositoryName': self.name,
+            'imageIds': [{'imageDigest': x} for x in digests],
+        }
+
+        result = ecr_client.describe_images(**params)
+        self.__count_request()
 
         log.dump_aws_request(
-            'ecs',
-            'list-images',
-            params={'repositoryName': self.name},
+            'ecr',
+            'describe-images',
+            params={'repositoryName': self.name, 'imageDigests': digests},
             response=result)
 
-        return ImageCollection(result)
+        image_ids = []
+        for detail in result.get('imageDetails', []):
+            for tag in detail.get('imageTags', []):
+                image_ids.append(
+                    {'imageTag': tag, 'imageDigest': detail['imageDigest']})
+
+        return image_ids
+
+    def __count_request(self) -> None:
+        # Batches are sent concurrently
+        with object.__getattribute__(self, '_lock'):
+            object.__setattr__(self, '_request_count', self.request_count + 1)
+
+    def image_pages(self) -> Iterator[dict]:
+        ecr_client = object.__getattribute__(self, 'ecr_client')
+        params = {'repositoryName': self.name, 'maxResults': self.PAGE_SIZE}
+        while True:
+            result = ecr_client.list_images(**params)
+            self.__count_request()
+
+            log.dump_aws_request(
+                'ecr',
+                'list-images',
+                params=params,
+                response=result)
+
+            yield result
+
+            if not result.get('nextToken'):
+                return
+
+            params = dict(params, nextToken=result['nextToken'])
 
 
 @dataclasses.dataclass(frozen=True)
 class RepositoryCollection():
+    '''Repositories of the run.
+
+    Images listed from a repository are kept until it is invalidated after
+    pushing to it.
+    '''
+
     ecr_client: object
     config: Config = dataclasses.field(default_factory=lambda: Config.default)
     repositories: dict = dataclasses.field(init=False, default_factory=dict)
@@ -69,3 +381,286 @@ class RepositoryCollection():
             pass
 
         return repository
+
+    @property
+    def request_count(self) -> int:
+        return sum(x.request_count for x in self.repositories.values())
+
+    def find_images(self, tags: Dict[str, List[str]]) -> Dict[str, ImageCollection]:
+        '''Find images of tags by repository name, repositories are looked
+        up concurrently
+        '''
+
+        names = list(tags.keys())
+        repositories = [self[x] for x in names]
+        if len(names) <= 1:
+            images = [x.find_images(tags[x.name]) for x in repositories]
+            return dict(zip(names, images))
+
+        with ThreadPoolExecutor(max_workers=min(8, len(names))) as executor:
+            images = executor.map(
+                lambda x: x.find_images(tags[x.name]), repositories)
+
+            return dict(zip(names, images))
+
+    def put_tags(self, name: str, source_tag: str,
+                 tags: List[str]) -> Optional[List[str]]:
+        '''Tag an image of a repository on ECR, see Repository.put_tags
+        '''
+
+        return self[name].put_tags(source_tag, tags)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        '''Forget images of a repository, or of all repositories
+        '''
+
+        names = [name] if name is not None else list(self.repositories.keys())
+        for x in names:
+            if x in self.repositories:
+                self.repositories[x].invalidate()
+
+    def summary(self) -> str:
+        return 'ECR: {0} requests'.format(self.request_count)
+
+
+class ImageTransfer():
+    '''Copy images between ECR repositories by manifest, in any account or
+    region.
+
+    Layers are copied through ECR only when the destination repository
+    does not have them, nothing goes through the docker daemon.
+
+    Usage:
+        transfer = ImageTransfer(ecr_client)
+        transfer.copy(source_uri, 'abc123', destination_uri, ['abc123'])
+    '''
+
+    MANIFEST_MEDIA_TYPES = Repository.MANIFEST_MEDIA_TYPES
+    # Limit of layerDigests of BatchCheckLayerAvailability
+    BATCH_SIZE = 100
+
+    __URI = re.compile(
+        r'^([0-9]{12})\.dkr\.ecr\.([a-z0-9-]+)\.amazonaws\.com(?:\.cn)?/(.+)$')
+
+    def __init__(self, ecr_client, config: Config = None, opener=None):
+        self.__ecr_client = ecr_client
+        self.__config = config or Config.default
+        # Opens download URLs of layers, a file-like object is expected
+        self.__opener = opener or urllib.request.urlopen
+        self.__clients = {}  # type: Dict[str, object]
+        self.__lock = threading.Lock()
+        self.copied_layer_count = 0
+        self.skipped_layer_count = 0
+
+    def copy(self, source_uri: str, source_tag: str,
+             destination_uri: str, tags: List[str]) -> Optional[str]:
+        '''Copy the image of source_tag and tag it in the destination.
+
+        Get the digest of the image, None when source_tag is not found.
+        '''
+
+        source = self.__locate(source_uri)
+        destination = self.__locate(destination_uri)
+
+        image = self.__get_image(source, {'imageTag': source_tag})
+        if image is None:
+            return None
+
+        manifest = json.loads(image['imageManifest'])
+        for child in manifest.get('manifests', []):
+            # Images of a manifest list are copied untagged
+            child_image = \
+                self.__get_image(source, {'imageDigest': child['digest']})
+            self.__copy_layers(
+                source, destination, json.loads(child_image['imageManifest']))
+            self.__put_image(destination, child_image, None)
+
+        self.__copy_layers(source, destination, manifest)
+        for tag in tags:
+            self.__put_image(destination, image, tag)
+
+        return image['imageId']['imageDigest']
+
+    def copy_all(self, copies: List[Tuple[str, str, str, List[str]]]) -> List[Optional[str]]:
+        '''Copy images of (source uri, source tag, destination uri, tags),
+        destinations concurrently. Digests are in order of copies.
+        '''
+
+        # Copies to a repository run in turn, a layer is not uploaded twice
+        groups = collections.OrderedDict()  # type: Dict[str, List[int]]
+        for index, copy in enumerate(copies):
+            groups.setdefault(copy[2], []).append(index)
+
+        def copy_group(indexes: List[int]) -> List[Tuple[int, Optional[str]]]:
+            return [(x, self.copy(*copies[x])) for x in indexes]
+
+        groups = list(groups.values())
+        if len(groups) <= 1:
+            results = [copy_group(x) for x in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=min(8, len(groups))) as executor:
+                results = list(executor.map(copy_group, groups))
+
+        digests = dict(x for result in results for x in result)
+
+        return [digests[x] for x in range(len(copies))]
+
+    def summary(self) -> str:
+        msg = 'ECR: {0} layers copied, {1} already in destinations'
+        return msg.format(self.copied_layer_count, self.skipped_layer_count)
+
+    def __locate(self, repository_uri: str) -> Tuple[object, dict]:
+        '''Get (client of the region, parameters naming the repository)
+        '''
+
+        match = self.__URI.match(repository_uri)
+        if match is None:
+            name = '/'.join(repository_uri.split('/')[1:])
+            return (self.__ecr_client, {'repositoryName': name})
+
+        registry_id, region, name = match.groups()
+        params = {'registryId': registry_id, 'repositoryName': name}
+
+        return (self.__client(region), params)
+
+    def __client(self, region: str):
+        if self.__ecr_client.meta.region_name == region:
+            return self.__ecr_client
+
+        with self.__lock:
+            client = self.__clients.get(region)
+            if client is None:
+                client = boto3.client('ecr', region_name=region)
+                self.__clients[region] = client
+
+        return client
+
+    def __get_image(self, location: Tuple[object, dict], image_id: dict) -> Optional[dict]:
+        client, params = location
+        params = dict(params,
+                      imageIds=[image_id],
+                      acceptedMediaTypes=self.MANIFEST_MEDIA_TYPES)
+
+        log.dump_aws_request('ecr', 'batch-get-image', params=params)
+
+        images = client.batch_get_image(**params).get('images', [])
+
+        return images[0] if images else None
+
+    def __put_image(self, location: Tuple[object, dict], image: dict,
+                    tag: Optional[str]) -> None:
+        client, params = location
+        params = dict(params, imageManifest=image['imageManifest'])
+        if image.get('imageManifestMediaType'):
+            params['imageManifestMediaType'] = image['imageManifestMediaType']
+
+        if tag is None:
+            params['imageDigest'] = image['imageId']['imageDigest']
+        else:
+            params['imageTag'] = tag
+
+        log.dump_aws_request(
+            'ecr',
+            'put-image',
+            params=dict((x, params[x]) for x in params if x != 'imageManifest'))
+
+        if self.__config.dry_run:
+            return
+
+        try:
+            client.put_image(**params)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ImageAlreadyExistsException':
+                raise
+
+    def __copy_layers(self, source, destination, manifest: dict) -> None:
+        layers = [manifest['config']] if 'config' in manifest else []
+        # Foreign layers are not stored by registries
+        layers += [x for x in manifest.get('layers', []) if not x.get('urls')]
+        digests = list(collections.OrderedDict.fromkeys(
+            x['digest'] for x in layers))
+
+        missing = []
+        for found in map_batches(
+                lambda x: self.__missing_layers(destination, x),
+                digests,
+                self.BATCH_SIZE):
+            missing += found
+
+        with self.__lock:
+            self.skipped_layer_count += len(digests) - len(missing)
+
+        for digest in missing:
+            log.debug('      copying layer %s...' % digest)
+            if not self.__config.dry_run:
+                self.__copy_layer(source, destination, digest)
+
+            with self.__lock:
+                self.copied_layer_count += 1
+
+    def __missing_layers(self, location, digests: List[str]) -> List[str]:
+        client, params = location
+        params = dict(params, layerDigests=digests)
+
+        result = client.batch_check_layer_availability(**params)
+
+        log.dump_aws_request(
+            'ecr',
+            'batch-check-layer-availability',
+            params=params,
+            response=result)
+
+        available = set(x['layerDigest'] for x in result.get('layers', [])
+                        if x.get('layerAvailability') == 'AVAILABLE')
+
+        return [x for x in digests if x not in available]
+
+    def __copy_layer(self, source, destination, digest: str) -> None:
+        source_client, source_params = source
+        url = source_client.get_download_url_for_layer(
+            layerDigest=digest, **source_params)['downloadUrl']
+
+        client, params = destination
+        upload = client.initiate_layer_upload(**params)
+        upload_params = dict(params, uploadId=upload['uploadId'])
+
+        hasher = hashlib.sha256()
+        position = 0
+        with self.__opener(url) as stream:
+            while True:
+                part = self.__read_part(stream, upload['partSize'])
+                if not part:
+                    break
+
+                hasher.update(part)
+                client.upload_layer_part(
+                    partFirstByte=position,
+                    partLastByte=position + len(part) - 1,
+                    layerPartBlob=part,
+                    **upload_params)
+                position += len(part)
+
+        if 'sha256:' + hasher.hexdigest() != digest:
+            raise ValueError('Layer download does not match %s' % digest)
+
+        try:
+            client.complete_layer_upload(layerDigests=[digest], **upload_params)
+        except ClientError as e:
+            # Uploaded meanwhile by another job
+            if e.response['Error']['Code'] != 'LayerAlreadyExistsException':
+                raise
+
+    @classmethod
+    def __read_part(cls, stream, size: int) -> bytes:
+        # Responses may return less than asked before their end
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = stream.read(remaining)
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        return b''.join(chunks)
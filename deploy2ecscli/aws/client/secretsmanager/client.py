@@ -0,0 +1,23 @@
+import dataclasses
+
+import boto3
+
+from deploy2ecscli.aws.client.config import Config
+from deploy2ecscli.aws.client.secretsmanager.resources import SecretCollection
+
+
+@dataclasses.dataclass(init=False, frozen=True)
+class Client():
+    """
+    Usage:
+        Client().secrets.get_all(['app/database'])
+    """
+    secrets: SecretCollection
+
+    def __init__(self, config: Config = None):
+        config = config or Config.default
+        aws_client = boto3.client('secretsmanager')
+
+        secrets = SecretCollection(aws_client, config)
+
+        object.__setattr__(self, 'secrets', secrets)
@@ -0,0 +1,5 @@
+class SecretNotFoundException(Exception):
+    def __init__(self, errors):
+        message = 'Secrets not found: {0}'
+        message = message.format(', '.join(x['SecretId'] for x in errors))
+        super().__init__(message, errors)
@@ -0,0 +1,67 @@
+from typing import Dict, Iterable
+
+from deploy2ecscli import logger as log
+from deploy2ecscli.aws.client.batch import map_batches
+from deploy2ecscli.aws.client.config import Config
+from deploy2ecscli.aws.client.secretsmanager.exceptions import SecretNotFoundException
+
+
+class SecretCollection():
+    # Limit of BatchGetSecretValue
+    BATCH_SIZE = 20
+
+    def __init__(self, secretsmanager_client, config: Config = None):
+        self.__secretsmanager_client = secretsmanager_client
+        self.__config = config or Config.default
+
+    def get_all(self, secret_ids: Iterable[str]) -> Dict[str, str]:
+        '''Get secret strings by name or ARN, batches are fetched
+        concurrently.
+
+        Values are never logged and masked in logs.
+        '''
+
+        secret_ids = sorted(set(secret_ids))
+        values = {}
+        errors = []
+        for secrets, batch_errors in \
+                map_batches(self.__get_secrets, secret_ids, self.BATCH_SIZE):
+            values.update(secrets)
+            errors += batch_errors
+
+        if errors:
+            raise SecretNotFoundException(errors)
+
+        return values
+
+    def __get_secrets(self, secret_ids):
+        log.dump_aws_request(
+            'secretsmanager',
+            'batch-get-secret-value',
+            params={'secret-id-list': secret_ids})
+
+        result = self.__secretsmanager_client.batch_get_secret_value(
+            SecretIdList=secret_ids)
+
+        found = {}
+        for secret in result.get('SecretValues', []):
+            found[secret['Name']] = secret.get('SecretString')
+            found[secret['ARN']] = secret.get('SecretString')
+
+        values = {}
+        errors = list(result.get('Errors', []))
+        failed = set(x['SecretId'] for x in errors)
+        for secret_id in secret_ids:
+            if secret_id in failed:
+                continue
+
+            if found.get(secret_id) is None:
+                errors.append({
+                    'SecretId': secret_id,
+                    'ErrorCode': 'ResourceNotFoundException',
+                    'Message': 'No secret string'})
+            else:
+                log.add_secret(found[secret_id])
+                values[secret_id] = found[secret_id]
+
+        return (values, errors)
@@ -0,0 +1,6 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+from .client import Client
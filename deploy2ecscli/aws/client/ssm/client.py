@@ -0,0 +1,23 @@
+import dataclasses
+
+import boto3
+
+from deploy2ecscli.aws.client.config import Config
+from deploy2ecscli.aws.client.ssm.resources import ParameterCollection
+
+
+@dataclasses.dataclass(init=False, frozen=True)
+class Client():
+    """
+    Usage:
+        Client().parameters.get_all(['/app/database/password'])
+    """
+    parameters: ParameterCollection
+
+    def __init__(self, config: Config = None):
+        config = config or Config.default
+        aws_client = boto3.client('ssm')
+
+        parameters = ParameterCollection(aws_client, config)
+
+        object.__setattr__(self, 'parameters', parameters)
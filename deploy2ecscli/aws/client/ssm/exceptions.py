@@ -0,0 +1,5 @@
+class ParameterNotFoundException(Exception):
+    def __init__(self, names):
+        message = 'Parameters not found: {0}'
+        message = message.format(', '.join(names))
+        super().__init__(message, names)
@@ -0,0 +1,69 @@
+from typing import Dict, Iterable
+
+from deploy2ecscli import logger as log
+from deploy2ecscli.aws.client.batch import map_batches
+from deploy2ecscli.aws.client.config import Config
+from deploy2ecscli.aws.client.ssm.exceptions import ParameterNotFoundException
+
+
+class ParameterCollection():
+    # Limit of GetParameters
+    BATCH_SIZE = 10
+
+    def __init__(self, ssm_client, config: Config = None):
+        self.__ssm_client = ssm_client
+        self.__config = config or Config.default
+
+    def get_all(self, names: Iterable[str]) -> Dict[str, str]:
+        '''Get decrypted values by name, batches are fetched concurrently.
+
+        Values are never logged, SecureString values are masked in logs.
+        '''
+
+        names = sorted(set(names))
+        values = {}
+        invalid = []
+        for parameters, invalid_names in \
+                map_batches(self.__get_parameters, names, self.BATCH_SIZE):
+            values.update(parameters)
+            invalid += invalid_names
+
+        if invalid:
+            raise ParameterNotFoundException(sorted(invalid))
+
+        return values
+
+    def __get_parameters(self, names):
+        log.dump_aws_request(
+            'ssm',
+            'get-parameters',
+            params={'names': names, 'with-decryption': ''})
+
+        result = self.__ssm_client.get_parameters(
+            Names=names, WithDecryption=True)
+
+        # Names may be ARNs or have a version or label selector
+        found = {}
+        for parameter in result.get('Parameters', []):
+            value = parameter['Value']
+            if parameter.get('Type') == 'SecureString':
+                log.add_secret(value)
+
+            found[parameter['Name'] + parameter.get('Selector', '')] = value
+            found.setdefault(parameter['Name'], value)
+            if 'ARN' in parameter:
+                found[parameter['ARN']] = value
+
+        values = {}
+        invalid = list(result.get('InvalidParameters', []))
+        for name in names:
+            if name in invalid:
+                continue
+
+            value = found.get(name, found.get(name.rsplit(':', 1)[0]))
+            if value is None:
+                invalid.append(name)
+            else:
+                values[name] = value
+
+        return (values, invalid)
@@ -3,34 +3,105 @@
 # -*- coding: utf-8 -*-
 # vi: set ft=python :
 
+import sys
 import dataclasses
-from typing import List
+from typing import Dict, Iterator, List
 
 
 @dataclasses.dataclass(init=False, frozen=True)
 class Image:
+    # Repositories may have 100k+ tags, an instance has no __dict__
+    __slots__ = ('tag', 'digest')
+
     tag: str
     digest: str
 
     def __init__(self, json: dict):
         object.__setattr__(self, 'tag', json['imageTag'])
-        object.__setattr__(self, 'digest', json['imageDigest'])
+        # Tags of an image share a digest
+        object.__setattr__(self, 'digest', sys.intern(json['imageDigest']))
+
+    def __getstate__(self):
+        return (self.tag, self.digest)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, 'tag', state[0])
+        object.__setattr__(self, 'digest', sys.intern(state[1]))
 
 
 class ImageCollection(list):
-    def __init__(self, json: dict):
-        for x in json['imageIds']:
-            if not x.get('imageTag'):
-                continue
+    '''Tagged images of a repository, indexed by tag and by digest.
+
+    Pages of `list_images` are read only until a lookup is answered, the
+    list holds the images read so far. digest_is reads all pages, because
+    any page may have a tag of the digest.
 
-            self.append(Image(x))
+    Usage:
+        images = ImageCollection(pages=repository.image_pages())
+        images.find_by_tag('latest')
+    '''
+
+    def __init__(self, json: dict = None, pages: Iterator[dict] = None):
+        self.__tags = {}  # type: Dict[str, Image]
+        self.__digests = {}  # type: Dict[str, List[Image]]
+        self.__pages = pages
+
+        if json is not None:
+            self.__add(json['imageIds'])
+
+    @property
+    def complete(self) -> bool:
+        '''Whether all images of the repository are read
+        '''
+
+        return self.__pages is None
 
     @property
     def latest(self) -> Image:
-        return next((x for x in self if x.tag == 'latest'), None)
+        return self.find_by_tag('latest')
 
     def find_by_tag(self, tag) -> Image:
-        return next((x for x in self if x.tag == tag), None)
+        while tag not in self.__tags and self.__read_page():
+            pass
+
+        return self.__tags.get(tag)
 
     def digest_is(self, digest) -> List[Image]:
-        return [x for x in self if x.digest == digest] or None
+        self.scan()
+
+        images = self.__digests.get(digest)
+        return list(images) if images else None
+
+    def scan(self) -> 'ImageCollection':
+        '''Read all remaining pages
+        '''
+
+        while self.__read_page():
+            pass
+
+        return self
+
+    def __read_page(self) -> bool:
+        if self.__pages is None:
+            return False
+
+        page = next(self.__pages, None)
+        if page is None:
+            self.__pages = None
+            return False
+
+        self.__add(page['imageIds'])
+
+        return True
+
+    def __add(self, image_ids: List[dict]) -> None:
+        for x in image_ids:
+            if not x.get('imageTag'):
+                continue
+
+            image = Image(x)
+            self.append(image)
+
+            # The first image of a tag is found, like a linear search
+            self.__tags.setdefault(image.tag, image)
+            self.__digests.setdefault(image.digest, []).append(image)
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import json
+import sqlite3
+import threading
+import time
+
+from typing import Any, Dict, List, Optional
+
+
+class DiskCache:
+    '''Size bounded LRU key-value store kept in a sqlite file.
+
+    Keys and values are stored as JSON, the file may be shared between
+    users and loading it never runs code. Values which can not be decoded
+    are misses.
+
+    Usage:
+        cache = DiskCache('.deploy2ecs/cache')
+        cache.set('git', ['diff_files', a, b], files)
+        cache.get('git', ['diff_files', a, b])
+    '''
+
+    FILE_NAME = 'cache.sqlite3'
+
+    def __init__(self, directory: str, max_entries: int = 10000):
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.max_entries = max_entries
+        self.stats = {}  # type: Dict[str, List[int]]
+        self.__lock = threading.Lock()
+        self.__clock = 0.0
+        self.__connection = sqlite3.connect(
+            os.path.join(directory, self.FILE_NAME),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' value TEXT NOT NULL,'
+            ' accessed_at REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))')
+        self.__connection.execute(
+            'CREATE INDEX IF NOT EXISTS entries_accessed_at'
+            ' ON entries (accessed_at)')
+
+    def get(self, namespace: str, key: Any, default: Any = None) -> Any:
+        '''Get the cached value, default when it is not cached
+        '''
+
+        key = self.__serialize_key(key)
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT value FROM entries WHERE namespace = ? AND key = ?',
+                (namespace, key)).fetchone()
+
+            stats = self.stats.setdefault(namespace, [0, 0])
+            try:
+                value = json.loads(row[0]) if row is not None else None
+            except ValueError:
+                # Written by an older version, or not by this class
+                self.__connection.execute(
+                    'DELETE FROM entries WHERE namespace = ? AND key = ?',
+                    (namespace, key))
+                row = None
+
+            if row is None:
+                stats[1] += 1
+                return default
+
+            stats[0] += 1
+            self.__connection.execute(
+                'UPDATE entries SET accessed_at = ?'
+                ' WHERE namespace = ? AND key = ?',
+                (self.__tick(), namespace, key))
+
+        return value
+
+    def set(self, namespace: str, key: Any, value: Any) -> None:
+        key = self.__serialize_key(key)
+        value = json.dumps(value, separators=(',', ':'))
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO entries'
+                ' (namespace, key, value, accessed_at) VALUES (?, ?, ?, ?)',
+                (namespace, key, value, self.__tick()))
+            self.__evict()
+
+    def delete(self, namespace: str, key: Any) -> None:
+        key = self.__serialize_key(key)
+        with self.__lock:
+            self.__connection.execute(
+                'DELETE FROM entries WHERE namespace = ? AND key = ?',
+                (namespace, key))
+
+    def summary(self) -> Optional[str]:
+        '''Get hit and miss counters, e.g. `git: 12 hits, 3 misses`
+        '''
+
+        if len(self.stats) == 0:
+            return None
+
+        summary = ['{0}: {1} hits, {2} misses'.format(namespace, *stats)
+                   for namespace, stats in sorted(self.stats.items())]
+        return ' / '.join(summary)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
+
+    def __tick(self) -> float:
+        # Strictly increasing, so entries touched in a row keep their order
+        self.__clock = max(time.time(), self.__clock + 1e-6)
+        return self.__clock
+
+    def __evict(self) -> None:
+        count = self.__connection.execute(
+            'SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count <= self.max_entries:
+            return
+
+        self.__connection.execute(
+            'DELETE FROM entries WHERE rowid IN ('
+            ' SELECT rowid FROM entries ORDER BY accessed_at LIMIT ?)',
+            (count - self.max_entries,))
+
+    @classmethod
+    def __serialize_key(cls, key: Any) -> str:
+        return json.dumps(key, sort_keys=True, separators=(',', ':'))
@@ -4,13 +4,68 @@
 # vi: set ft=python :
 
 from abc import ABC, abstractmethod
-import yaml
 import os
 import re
+import glob
+import hashlib
+import collections
 import dataclasses
 
-from typing import List, Optional, Tuple
-from deploy2ecscli.yaml import setup_loader
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, TextIO, Tuple
+from deploy2ecscli.cache import DiskCache
+from deploy2ecscli.exceptions import UnknownImageException
+from deploy2ecscli.yaml import Resolver, SectionReader, Template
+
+
+class TemplateCache:
+    '''Compiled templates, kept until their file is modified.
+
+    Usage:
+        templates = TemplateCache()
+        templates.render('task_definition.yml', {'TASK_FAMILY': 'app'})
+    '''
+
+    def __init__(self):
+        self.__templates = {}  # type: Dict[str, Tuple[tuple, Template]]
+
+    def render(self, path: str, bind_variables: dict = None):
+        return self.get(path).render(bind_variables)
+
+    def get(self, path: str) -> Template:
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+
+        entry = self.__templates.get(path)
+        if entry is not None and stamp is not None and entry[0] == stamp:
+            return entry[1]
+
+        with open(path) as file:
+            template = Template(file, is_json=path.lower().endswith('.json'))
+
+        if stamp is not None:
+            self.__templates[path] = (stamp, template)
+
+        return template
+
+    def prefetch(self, paths: List[str]) -> None:
+        '''Fetch !SSM and !Secret of all templates together
+        '''
+
+        if Resolver.default is None:
+            return
+
+        references = set()
+        for path in paths:
+            references |= self.get(path).remote_references
+
+        Resolver.default.prefetch(references)
+
+
+templates = TemplateCache()
 
 
 @dataclasses.dataclass(frozen=True)
@@ -23,6 +78,8 @@ class Image:
     dependencies: List[str]
     buildargs: dict = dataclasses.field(default_factory=dict)
     excludes: List[str] = dataclasses.field(default_factory=list)
+    # Repository URI the image is copied from instead of being built
+    promote_from: Optional[str] = None
 
     def __post_init__(self):
         repository_name = '/'.join(self.repository_uri.split('/')[1:])
@@ -102,8 +159,7 @@ class Task:
             'CLUSTER_NAME': self.cluster,
         }
 
-        with open(self.template) as file:
-            return yaml.load(file, Loader=setup_loader(bind_variables))
+        return templates.render(self.template, bind_variables)
 
 
 @dataclasses.dataclass(init=False, frozen=True)
@@ -144,8 +200,7 @@ class Service:
         bind_variables = dict(bind_variables, **default_bind_variables)
         bind_variables = dict(bind_variables, **self.bind_variables.asdict())
 
-        with open(self.template) as file:
-            return yaml.load(file, Loader=setup_loader(bind_variables))
+        return templates.render(self.template, bind_variables)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -175,8 +230,7 @@ class TaskDefinition:
         bind_variables = dict(bind_variables, **default_bind_variables)
         bind_variables = dict(bind_variables, **self.bind_variables.asdict())
 
-        with open(self.template) as file:
-            return yaml.load(file, Loader=setup_loader(bind_variables))
+        return templates.render(self.template, bind_variables)
 
 
 @dataclasses.dataclass(init=False, frozen=True)
@@ -193,13 +247,24 @@ class Application:
         images = [Image(**image) for image in images]  # type: List[Image]
         services = [Service(**service) for service in services]
 
+        # The first image of a name is bound, like a linear search
+        image_index = {}  # type: Dict[str, Image]
+        for image in images:
+            image_index.setdefault(image.name, image)
+
+        image_fields = {}  # type: Dict[str, dict]
         for task_definition in task_definitions:
             for bind_image in task_definition['images']:
-                image = (x for x in images if bind_image['name'] == x.name)
-                image = next(image, {})
-                image = dataclasses.asdict(image)
-                image.pop('repository_name')
-                bind_image.update(image)
+                name = bind_image['name']
+                if name not in image_index:
+                    raise UnknownImageException(name)
+
+                if name not in image_fields:
+                    image = dataclasses.asdict(image_index[name])
+                    image.pop('repository_name')
+                    image_fields[name] = image
+
+                bind_image.update(image_fields[name])
 
         task_definitions = \
             [TaskDefinition(**task_definition)
@@ -208,3 +273,195 @@ class Application:
         object.__setattr__(self, 'images', images)
         object.__setattr__(self, 'task_definitions', task_definitions)
         object.__setattr__(self, 'services', services)
+
+    @property
+    def templates(self) -> List[str]:
+        '''Paths of all templates, in order of appearance
+        '''
+
+        paths = [x.template for x in self.task_definitions]
+        for service in self.services:
+            paths.append(service.template)
+            if service.before_deploy is not None:
+                paths += [x.template for x in service.before_deploy.tasks]
+
+        return list(collections.OrderedDict.fromkeys(paths))
+
+
+def parse_fragment(content: str, branch: str) -> tuple:
+    '''Get (patterns, pattern, section) of the section of branch in a
+    config file. Runs in worker processes.
+
+    The section is compiled into a Template and nothing is resolved yet,
+    None when no pattern matches.
+    '''
+
+    reader = SectionReader(content)
+    pattern = next((x for x in reader.keys
+                    if re.match(x, branch, re.IGNORECASE)), None)
+    if pattern is None:
+        return (reader.keys, None, None)
+
+    return (reader.keys, pattern, reader.compile(pattern))
+
+
+class ApplicationLoader:
+    '''Load the Application of a branch from a config file.
+
+    Configs are keyed by branch patterns, the first pattern matching the
+    branch is used and other sections are not evaluated. With a cache, the
+    section is kept compiled, keyed by the digest of the file and the
+    pattern, so unchanged configs are not parsed. !Ref, !Sub, !SSM and
+    !Secret are resolved on each load, their values are never cached.
+
+    A config can also be split into files, see load_all.
+
+    Usage:
+        loader = ApplicationLoader(DiskCache('.deploy2ecs/cache'))
+        config = loader.load(open('deploy2ecs.yml'), 'master')
+        config = loader.load_all(ApplicationLoader.find('config/'), 'master')
+    '''
+
+    EXTENSIONS = ['.yml', '.yaml']
+
+    NAMESPACE = 'config'
+
+    # Bump when cached classes change
+    VERSION = 4
+
+    def __init__(self, cache: Optional[DiskCache] = None):
+        self.__cache = cache
+
+    def load(self, file: TextIO, branch: str) -> Optional[Application]:
+        '''Get the Application of branch, None when no pattern matches
+        '''
+
+        return self.__load([file.read()], branch)
+
+    @classmethod
+    def find(cls, path: str) -> Optional[List[str]]:
+        '''Get config files of a directory or a glob pattern, None when path
+        is a single file
+        '''
+
+        if os.path.isdir(path):
+            paths = [os.path.join(directory, x)
+                     for directory, _, names in os.walk(path)
+                     for x in names
+                     if os.path.splitext(x)[1] in cls.EXTENSIONS]
+        elif re.search(r'[*?[]', path):
+            paths = glob.glob(path, recursive=True)
+        else:
+            return None
+
+        return sorted(x for x in paths if os.path.isfile(x))
+
+    def load_all(self, paths: List[str], branch: str) -> Optional[Application]:
+        '''Get the Application of branch merged from config files, None when
+        no pattern of any file matches.
+
+        Each file is keyed by branch patterns like a whole config, and the
+        first of its patterns matching the branch is used. Lists of matched
+        sections are concatenated in path order. Files are parsed in worker
+        processes, and with a cache, sections are kept per file digest.
+        '''
+
+        contents = []
+        for path in paths:
+            with open(path) as file:
+                contents.append(file.read())
+
+        return self.__load(contents, branch)
+
+    def __load(self, contents: List[str], branch: str) -> Optional[Application]:
+        digests = [hashlib.sha256(x.encode('utf8')).hexdigest()
+                   for x in contents]
+        sections = [self.__get_cached_section(x, branch) for x in digests]
+
+        pending = [i for i, x in enumerate(sections) if x is False]
+        workers = min(len(pending), os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    parse_fragment,
+                    [contents[i] for i in pending],
+                    [branch] * len(pending)))
+        else:
+            results = [parse_fragment(contents[i], branch) for i in pending]
+
+        for index, result in zip(pending, results):
+            patterns, pattern, section = result
+            if self.__cache is not None:
+                self.__set_cached_section(
+                    digests[index], patterns, pattern, section)
+
+            sections[index] = section
+
+        if all(x is None for x in sections):
+            return None
+
+        # Fetched together, then resolved with the environment
+        references = set()
+        for section in sections:
+            if section is not None:
+                references |= section.remote_references
+
+        if references and Resolver.default is not None:
+            Resolver.default.prefetch(references)
+
+        config = collections.OrderedDict()
+        for section in sections:
+            if section is None:
+                continue
+
+            for key, values in (section.render() or {}).items():
+                config.setdefault(key, []).extend(values or [])
+
+        return Application(**config)
+
+    def __get_cached_section(self, digest: str, branch: str):
+        '''Get the cached section of branch, None when no pattern matches,
+        False when not cached
+        '''
+
+        if self.__cache is None:
+            return False
+
+        patterns = self.__cache.get(
+            self.NAMESPACE, ['patterns', self.VERSION, digest])
+        if patterns is None:
+            return False
+
+        pattern = self.__match(patterns, branch)
+        if pattern is None:
+            return None
+
+        section = self.__cache.get(
+            self.NAMESPACE, ['section', self.VERSION, digest, pattern])
+        if section is None:
+            return False
+
+        try:
+            return Template.load(section)
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def __set_cached_section(self, digest, patterns, pattern, section):
+        self.__cache.set(
+            self.NAMESPACE, ['patterns', self.VERSION, digest], patterns)
+        if pattern is None:
+            return
+
+        try:
+            value = section.dump()
+        except TypeError:
+            # Like timestamps and binaries, compiled again on each run
+            return
+
+        self.__cache.set(
+            self.NAMESPACE, ['section', self.VERSION, digest, pattern], value)
+
+    @classmethod
+    def __match(cls, patterns, branch: str) -> Optional[str]:
+        return next((x for x in patterns
+                     if re.match(x, branch, re.IGNORECASE)), None)
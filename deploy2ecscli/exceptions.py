@@ -3,4 +3,40 @@ class TaskFailedException(Exception):
         message = '{0} is failed.'
         message = message.format(task_arn)
         
-        super().__init__(message, failed_containers)
\ No newline at end of file
+        super().__init__(message, failed_containers)
+
+class UnresolvedVariableException(Exception):
+    def __init__(self, name):
+        message = '${{{0}}} is not given as a bind variable or an environment variable.'
+        message = message.format(name)
+
+        super().__init__(message, name)
+        self.name = name
+
+    def __reduce__(self):
+        # Raised in worker processes which load config files
+        return (self.__class__, (self.name,))
+
+
+class UnknownImageException(Exception):
+    def __init__(self, name):
+        message = 'Image `{0}` is not defined in images.'
+        message = message.format(name)
+
+        super().__init__(message, name)
+
+
+class PreflightFailedException(Exception):
+    def __init__(self, problems):
+        message = '{0} problem(s) found in the config.'
+        message = message.format(len(problems))
+
+        super().__init__(message, problems)
+
+
+class ImageNotFoundException(Exception):
+    def __init__(self, image_uri):
+        message = '{0} is not found.'
+        message = message.format(image_uri)
+
+        super().__init__(message, image_uri)
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import mmap
+import struct
+
+from typing import Dict, List, Optional, Tuple
+
+
+class CommitGraphFile:
+    '''One `commit-graph` file, memory mapped.
+
+    See Documentation/gitformat-commit-graph.txt of git for the format.
+    '''
+
+    SIGNATURE = b'CGPH'
+    CHUNK_OID_FANOUT = b'OIDF'
+    CHUNK_OID_LOOKUP = b'OIDL'
+    CHUNK_COMMIT_DATA = b'CDAT'
+    CHUNK_EXTRA_EDGES = b'EDGE'
+    CHUNK_BLOOM_INDEXES = b'BIDX'
+    CHUNK_BLOOM_DATA = b'BDAT'
+
+    __HASH_LENGTHS = {1: 20, 2: 32}
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self.__data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, version, hash_version, chunk_count, base_count = \
+            struct.unpack_from('>4sBBBB', self.__data, 0)
+        if signature != self.SIGNATURE or version != 1 or \
+                hash_version not in self.__HASH_LENGTHS:
+            self.close()
+            raise ValueError('Unsupported commit-graph file: %s' % path)
+
+        self.hash_length = self.__HASH_LENGTHS[hash_version]
+        self.base_count = base_count
+
+        self.chunks = {}  # type: Dict[bytes, int]
+        for index in range(chunk_count):
+            chunk_id, offset = \
+                struct.unpack_from('>4sQ', self.__data, 8 + index * 12)
+            self.chunks[chunk_id] = offset
+
+        self.__fanout = self.chunks[self.CHUNK_OID_FANOUT]
+        self.__lookup = self.chunks[self.CHUNK_OID_LOOKUP]
+        self.__commit_data = self.chunks[self.CHUNK_COMMIT_DATA]
+        self.__extra_edges = self.chunks.get(self.CHUNK_EXTRA_EDGES)
+        self.commit_count = self.__fanout_at(255)
+
+    @property
+    def changed_paths(self) -> bool:
+        '''Whether changed-path Bloom filters are written
+        '''
+
+        return self.CHUNK_BLOOM_INDEXES in self.chunks and \
+            self.CHUNK_BLOOM_DATA in self.chunks
+
+    def position(self, object_id: bytes) -> Optional[int]:
+        '''Get the lexicographic position of a commit in this file
+        '''
+
+        first = object_id[0]
+        low = self.__fanout_at(first - 1) if first > 0 else 0
+        high = self.__fanout_at(first)
+        while low < high:
+            middle = (low + high) // 2
+            current = self.object_id(middle)
+            if current == object_id:
+                return middle
+
+            if current < object_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def object_id(self, position: int) -> bytes:
+        offset = self.__lookup + position * self.hash_length
+        return self.__data[offset:offset + self.hash_length]
+
+    def commit_data(self, position: int) -> Tuple[bytes, int, int, int]:
+        '''Get (tree, first parent, second parent, commit time) at position.
+
+        Parents are positions in the whole chain, see CommitGraph.
+        '''
+
+        offset = self.__commit_data + position * (self.hash_length + 16)
+        tree = self.__data[offset:offset + self.hash_length]
+        first, second, date_high, date_low = \
+            struct.unpack_from('>IIII', self.__data, offset + self.hash_length)
+
+        return (tree, first, second, ((date_high & 0x3) << 32) | date_low)
+
+    def extra_edge(self, index: int) -> int:
+        return struct.unpack_from(
+            '>I', self.__data, self.__extra_edges + index * 4)[0]
+
+    def close(self) -> None:
+        self.__data.close()
+
+    def __fanout_at(self, index: int) -> int:
+        return struct.unpack_from('>I', self.__data, self.__fanout + index * 4)[0]
+
+
+class CommitGraph:
+    '''The commit-graph of a repository, a single file or a split chain.
+
+    Usage:
+        graph = CommitGraph.open('.git/objects/info')
+        graph.contains(head_object)
+    '''
+
+    NO_PARENT = 0x70000000
+    EXTRA_EDGES = 0x80000000
+
+    def __init__(self, files: List[CommitGraphFile]):
+        self.files = files
+
+        # Positions are global, base layers come first
+        self.__offsets = []
+        offset = 0
+        for graph_file in files:
+            self.__offsets.append(offset)
+            offset += graph_file.commit_count
+
+    @classmethod
+    def open(cls, info_directory: str) -> Optional['CommitGraph']:
+        '''Read the commit-graph in an `objects/info` directory, None when
+        there is none
+        '''
+
+        path = os.path.join(info_directory, 'commit-graph')
+        if os.path.isfile(path):
+            return cls([CommitGraphFile(path)])
+
+        directory = os.path.join(info_directory, 'commit-graphs')
+        chain = os.path.join(directory, 'commit-graph-chain')
+        if not os.path.isfile(chain):
+            return None
+
+        with open(chain) as f:
+            names = [x.strip() for x in f if x.strip()]
+
+        files = [CommitGraphFile(os.path.join(directory, 'graph-%s.graph' % x))
+                 for x in names]
+
+        return cls(files)
+
+    @property
+    def commit_count(self) -> int:
+        return sum(x.commit_count for x in self.files)
+
+    @property
+    def changed_paths(self) -> bool:
+        '''Whether every layer has changed-path Bloom filters
+        '''
+
+        return all(x.changed_paths for x in self.files)
+
+    def contains(self, object_id: str) -> bool:
+        object_id = bytes.fromhex(object_id)
+        return any(x.position(object_id) is not None for x in self.files)
+
+    def commit(self, object_id: str) -> Optional[Tuple[str, List[str], int]]:
+        '''Get (tree, parents, commit time) of a commit, None when the
+        commit is not in the graph
+        '''
+
+        object_id = bytes.fromhex(object_id)
+        for graph_file in self.files:
+            position = graph_file.position(object_id)
+            if position is None:
+                continue
+
+            tree, first, second, date = graph_file.commit_data(position)
+
+            parents = []
+            if first != self.NO_PARENT:
+                parents.append(self.__object_id_at(first))
+
+            if second & self.EXTRA_EDGES:
+                index = second & ~self.EXTRA_EDGES
+                while True:
+                    edge = graph_file.extra_edge(index)
+                    edge_position = edge & ~self.EXTRA_EDGES
+                    parents.append(self.__object_id_at(edge_position))
+                    if edge & self.EXTRA_EDGES:
+                        break
+
+                    index += 1
+            elif second != self.NO_PARENT:
+                parents.append(self.__object_id_at(second))
+
+            return (tree.hex(), parents, date)
+
+        return None
+
+    def close(self) -> None:
+        for graph_file in self.files:
+            graph_file.close()
+
+    def __object_id_at(self, position: int) -> str:
+        layers = list(zip(self.files, self.__offsets))
+        for graph_file, offset in reversed(layers):
+            if position >= offset:
+                return graph_file.object_id(position - offset).hex()
+
+        raise ValueError('Invalid commit-graph position: %d' % position)
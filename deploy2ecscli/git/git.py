@@ -3,133 +3,797 @@
 # -*- coding: utf-8 -*-
 # vi: set ft=python :
 
+import os
+import time
+import codecs
+import hashlib
 import subprocess
 
-from typing import List, Union, Optional
+from typing import Dict, Iterator, List, Tuple, Union, Optional
 
 from deploy2ecscli import logger
+from deploy2ecscli.cache import DiskCache
 from deploy2ecscli.log import Level as LogLevel
+from deploy2ecscli.git import history
 from deploy2ecscli.git.exceptions import NotGitRepositoryException
+from deploy2ecscli.git.process import CatFile, DiffTree
+from deploy2ecscli.git.commitgraph import CommitGraph
+from deploy2ecscli.git.native import Repository
+from deploy2ecscli.git.pathspec import Pathspec, PathTrie
 
 
 class Git:
     '''Execute a Git command in subprocess.
+
+    Commands are passed as argv lists, no shell is involved.
+    Object lookups are multiplexed over a long-lived `git cat-file` process.
+    When a cache is given, answers keyed by immutable object ids are kept
+    on disk and reused by later runs.
+    When native is true, read-only queries are answered by reading the
+    object store in process, git is run only for what it cannot answer.
     '''
 
+    CACHE_NAMESPACE = 'git'
+    # Bumped when cached answers of latest_object may be wrong
+    LATEST_OBJECT_VERSION = 2
+    DEEPEN_STEP = 50
+    # Merges diffed per `git diff-tree` query, doubled up to the maximum.
+    # Queries stay smaller than a pipe buffer, so writing never blocks.
+    MERGE_BATCH_SIZE = (16, 256)
+
+    # Checked in order, the first one set names the branch
+    BRANCH_ENVIRONMENTS = [
+        'GITHUB_HEAD_REF',                      # GitHub Actions (pull request)
+        'GITHUB_REF',                           # GitHub Actions
+        'CI_MERGE_REQUEST_SOURCE_BRANCH_NAME',  # GitLab CI (merge request)
+        'CI_COMMIT_BRANCH',                     # GitLab CI
+        'CIRCLE_BRANCH',                        # CircleCI
+        'BRANCH_NAME',                          # Jenkins (multibranch)
+        'GIT_LOCAL_BRANCH',                     # Jenkins
+        'GIT_BRANCH',                           # Jenkins
+        'CODEBUILD_WEBHOOK_HEAD_REF',           # AWS CodeBuild
+    ]
+
     __NOT_GIT_REPOSITORY_ERROR = \
         'fatal: not a git repository (or any of the parent directories): .git'
     __RUN_OPTION = {
-        'shell': True,
         'stdout': subprocess.PIPE,
         'stderr': subprocess.PIPE
     }
 
-    def __init__(self):
-        command = 'git rev-parse --is-inside-work-tree'
-        self.__run(command)
+    def __init__(self, cache: Optional[DiskCache] = None, native: bool = False):
+        command = ['git', 'rev-parse', '--is-inside-work-tree',
+                   '--is-shallow-repository', '--show-toplevel',
+                   '--show-prefix']
+        result = self.__run(command).splitlines()
+
+        self.__shallow = len(result) > 1 and result[1] == 'true'
+        self.__top = result[2] if len(result) > 2 else None
+        self.__prefix = result[3] if len(result) > 3 else ''
+        self.__cat_file = CatFile()
+        self.__cache = cache
+        self.__latest_objects = {}  # type: Dict[tuple, str]
+        self.__changed_files = {}  # type: Dict[tuple, PathTrie]
+        self.__pathspecs = {}  # type: Dict[tuple, Optional[Pathspec]]
+        self.__native = self.__open_native() if native else None
 
     @property
     def head_object(self) -> str:
         '''Get object of HEAD
         '''
 
-        command = 'git --no-pager rev-parse HEAD'
-        return self.__run(command)
+        return self.resolve('HEAD')
 
     @property
     def current_branch(self):
         '''Get current brunch
+
+        CI environment variables are checked first, then the symbolic ref
+        of HEAD. `git name-rev`, which scans every ref, is the last resort.
         '''
 
-        command = 'git --no-pager name-rev --name-only HEAD'
+        branch = self.__branch_from_environment(os.environ)
+        if branch:
+            return branch
+
+        command = ['git', 'symbolic-ref', '--short', '-q', 'HEAD']
+        try:
+            branch = self.__run(command)
+        except Exception:
+            # Detached HEAD
+            branch = None
+
+        if branch:
+            return branch
+
+        command = ['git', '--no-pager', 'name-rev', '--name-only', 'HEAD']
         return self.__run(command)
 
+    @property
+    def is_shallow(self) -> bool:
+        '''Whether the repository is a shallow clone
+        '''
+
+        return self.__shallow
+
+    @property
+    def commit_graph(self) -> Optional[CommitGraph]:
+        '''Get the commit-graph of the repository, None when it is not written
+        '''
+
+        command = ['git', 'rev-parse', '--git-path', 'objects/info']
+        return CommitGraph.open(self.__run(command))
+
+    def write_commit_graph(self) -> None:
+        '''Write the commit-graph of every ref with changed-path Bloom filters
+        '''
+
+        command = ['git', 'commit-graph', 'write', '--reachable',
+                   '--changed-paths']
+        self.__run(command)
+
+    def resolve(self, name: str) -> Optional[str]:
+        '''Get object id of name, None when it does not exist
+        '''
+
+        result = self.__resolve_object(name)
+        if result is None:
+            return None
+
+        return result[0]
+
+    def deepen(self, name: str, limit: int) -> bool:
+        '''Fetch more history of a shallow clone until name is a commit.
+
+        History is deepened in doubling steps, by limit commits at most.
+        Returns whether name could be resolved.
+        '''
+
+        rev = '%s^{commit}' % name
+        depth = 0
+        step = self.DEEPEN_STEP
+        while self.resolve(rev) is None:
+            if not self.__shallow or depth >= limit:
+                return False
+
+            step = min(step, limit - depth)
+            command = ['git', 'fetch', '--quiet', '--deepen=%d' % step]
+            try:
+                self.__run(command)
+            except Exception as e:
+                logger.verbose('Could not deepen history: %s' % e)
+                return False
+
+            depth += step
+            step *= 2
+
+            command = ['git', 'rev-parse', '--is-shallow-repository']
+            self.__shallow = self.__run(command) == 'true'
+
+            # Answers computed against the old shallow boundary are stale
+            self.__latest_objects.clear()
+            self.__changed_files.clear()
+            if self.__native is not None:
+                self.__native.refresh()
+
+        return True
+
+    def close(self) -> None:
+        '''Stop the persistent git processes
+        '''
+
+        self.__cat_file.close()
+        if self.__native is not None:
+            self.__native.close()
+
     def latest_object(
             self,
             files: Union[str, list, None] = None,
             excludes: Union[str, list, None] = None) -> Optional[str]:
-        files = self.__to_git_files(files)
-        excludes = self.__to_git_exclude(excludes)
+        key = self.__pathspec_key(files, excludes)
+        if key in self.__latest_objects:
+            return self.__latest_objects[key]
 
-        command = 'git --no-pager log -n 1 --pretty=oneline'
-        command = (command + ' ' + files).strip()
-        command = (command + ' ' + excludes).strip()
-        command = command.strip()
+        cache_key = self.__latest_object_cache_key(key)
+        result = self.__cache_get(cache_key)
+        if result is not None:
+            self.__latest_objects[key] = result
+            return result
 
-        result = self.__run(command)
+        result = self.__native_latest_object(files, excludes)
+        if result is None:
+            result = self.__log_latest_object(files, excludes)
 
-        if result:
-            result = result.split()[0]
+        self.__latest_objects[key] = result
+        self.__cache_set(cache_key, result)
 
         return result
 
+    def time_latest_objects(
+            self,
+            pathspecs: List[Tuple[Union[str, list, None], Union[str, list, None]]]) -> float:
+        '''Run `latest_object` for (files, excludes) pairs against git itself,
+        bypassing memo and cache, and get the elapsed seconds.
+        '''
+
+        started_at = time.monotonic()
+        for files, excludes in pathspecs:
+            self.__log_latest_object(files, excludes)
+
+        return time.monotonic() - started_at
+
+    def prefetch_latest_objects(
+            self,
+            pathspecs: List[Tuple[Union[str, list, None], Union[str, list, None]]]) -> None:
+        '''Resolve `latest_object` for many (files, excludes) pairs at once.
+
+        History is read a single time from HEAD, only as far as the walks
+        need it. Each pathspec is walked like `git log -n 1`, simplifying
+        history at TREESAME parents. Later `latest_object` calls with the
+        same arguments are answered without running git.
+        With the native reader, each pathspec is resolved in process instead.
+        '''
+
+        if self.__native is not None:
+            for files, excludes in pathspecs:
+                self.latest_object(files, excludes)
+
+            return
+
+        pending = {}  # type: Dict[tuple, Optional[Pathspec]]
+        for files, excludes in pathspecs:
+            key = self.__pathspec_key(files, excludes)
+            if key in self.__latest_objects or key in pending:
+                continue
+
+            result = self.__cache_get(self.__latest_object_cache_key(key))
+            if result is not None:
+                self.__latest_objects[key] = result
+                continue
+
+            if not key[0] and not key[1]:
+                pending[key] = None
+                continue
+
+            pathspec = self.__compile(files, excludes)
+            if pathspec is None:
+                # Left to `git log` itself
+                continue
+
+            pending[key] = pathspec
+
+        if len(pending) == 0:
+            return
+
+        # Merges are listed without changed files. When the walk reaches
+        # one, it and the merges read ahead are diffed against their first
+        # parent at once by a single `git diff-tree`, other parents are
+        # diffed when needed.
+        command = [
+            'git', '--no-pager', '-c', 'core.quotepath=off',
+            '-c', 'log.showRoot=true',
+            'log', '--no-renames', '--name-only', '--format=%x01%H %P %ct']
+
+        stream = self.__walk(command)
+        # Only files some pathspec includes are diffed
+        includes = [key[0] for key, x in pending.items() if x is not None]
+        paths = None
+        if all(includes):
+            paths = sorted(set(x for files in includes for x in files))
+        diff_tree = DiffTree(paths)
+
+        # commit: (parents, commit time, changed files)
+        commits = {}  # type: Dict[str, Tuple[List[str], int, List[str]]]
+
+        # (parent, merge): changed files
+        merges = {}  # type: Dict[Tuple[str, str], List[str]]
+        undiffed = []  # type: List[Tuple[str, str]]
+        batch_size = [self.MERGE_BATCH_SIZE[0]]
+
+        def add(header: str, changed_files: List[str]) -> str:
+            fields = header.split()
+            if fields[0] not in commits and len(fields) > 3:
+                undiffed.append((fields[1], fields[0]))
+
+            commits.setdefault(
+                fields[0], (fields[1:-1], int(fields[-1]), changed_files))
+
+            return fields[0]
+
+        def read(commit: str) -> Tuple[List[str], int, List[str]]:
+            while commit not in commits:
+                entry = next(stream, None)
+                if entry is None:
+                    raise ValueError('Missing commit: %s' % commit)
+
+                add(*entry)
+
+            return commits[commit]
+
+        def diff_merge(parent: str, merge: str) -> List[str]:
+            if (parent, merge) in merges:
+                return merges[(parent, merge)]
+
+            pairs = [(parent, merge)]
+            if parent == commits[merge][0][0]:
+                for _ in range(batch_size[0]):
+                    entry = next(stream, None)
+                    if entry is None:
+                        break
+
+                    add(*entry)
+
+                pairs += [x for x in undiffed[:batch_size[0]]
+                          if x != pairs[0] and x not in merges]
+                del undiffed[:batch_size[0]]
+                batch_size[0] = min(
+                    batch_size[0] * 2, self.MERGE_BATCH_SIZE[1])
+
+            for pair, files in zip(pairs, diff_tree.changed_files(pairs)):
+                merges[pair] = [self.__unquote(x) for x in files]
+
+            return merges[(parent, merge)]
+
+        def walk(pathspec: Pathspec) -> str:
+            def treesame(commit: str, parent: Optional[str]) -> bool:
+                parents, _, changed_files = read(commit)
+                if len(parents) > 1:
+                    changed_files = diff_merge(parent, commit)
+
+                return pathspec.match_any(changed_files) is None
+
+            return history.latest_commit(
+                head, lambda x: read(x)[:2], treesame)
+
+        try:
+            entry = next(stream, None)
+            head = add(*entry) if entry is not None else None
+
+            for key, pathspec in pending.items():
+                if head is None:
+                    result = ''
+                elif pathspec is None:
+                    result = head
+                else:
+                    result = walk(pathspec)
+
+                self.__latest_objects[key] = result
+                self.__cache_set(self.__latest_object_cache_key(key), result)
+        except Exception as e:
+            # Unresolved pathspecs are left to `latest_object`
+            logger.verbose('Could not walk history: %s' % e)
+        finally:
+            stream.close()
+            diff_tree.close()
+
+    def tree_fingerprint(
+            self,
+            files: Union[str, list, None] = None,
+            excludes: Union[str, list, None] = None,
+            rev: str = 'HEAD') -> str:
+        '''Hash the git objects matched by files minus excludes at rev.
+
+        Paths which are not affected by an exclude are resolved to their tree
+        or blob id like `git cat-file`, other paths are listed like `ls-tree`.
+        The result depends only on content, not on history.
+        '''
+
+        pathspec = Pathspec(files, excludes, self.__prefix, self.__top)
+        includes = pathspec.includes
+        if len(includes) == 0:
+            includes = Pathspec('.', prefix='').includes
+
+        entries = []
+        listed = []
+        for item in includes:
+            if not self.__is_resolvable(item, pathspec.excludes):
+                listed.append(item)
+                continue
+
+            object_type, object_id = 'missing', ''
+            result = self.__resolve_object('%s:%s' % (rev, item.pattern))
+            if result is not None:
+                object_id, object_type = result
+
+            if item.directory and object_type != 'tree':
+                object_type, object_id = 'missing', ''
+
+            entries.append('%s %s\t%s' % (object_type, object_id, item.pattern))
+
+        if len(listed) > 0:
+            for object_type, object_id, path in self.__list_tree(rev, listed):
+                if not any(x.match(path) for x in listed):
+                    continue
+
+                if any(x.match(path) for x in pathspec.excludes):
+                    continue
+
+                entries.append('%s %s\t%s' % (object_type, object_id, path))
+
+        digest = hashlib.sha1('\n'.join(sorted(entries)).encode('utf8'))
+
+        return 'tree-' + digest.hexdigest()
+
     def latest_log(self, files: Union[str, list, None] = None):
-        files = self.__to_git_files(files)[3:]
+        files = self.__to_git_files(files)[1:]
 
-        command = 'git --no-pager log -n 1 {0}'
-        command = command.format(files)
-        command = command.strip()
+        cache_key = self.__commits_cache_key('latest_log', files)
+        result = self.__cache_get(cache_key)
+        if result is not None:
+            return result
 
-        return self.__run(command)
+        command = ['git', '--no-pager', 'log', '-n', '1']
+        command = command + files
+
+        result = self.__run(command)
+        self.__cache_set(cache_key, result)
+
+        return result
 
     def diff_files(
             self, a, b,
             files: Union[str, list, None] = None,
             excludes: Union[str, list, None] = None) -> List[str]:
+        '''Get files changed between a and b which match the pathspec.
+
+        The changed files of a range are listed once, every pathspec is
+        evaluated against that list in process.
+        '''
+
+        pathspec = self.__compile(files, excludes)
+        if pathspec is None:
+            return self.__diff_files(a, b, files, excludes)
+
+        return pathspec.filter(self.__list_changed_files(a, b))
+
+    def diff(
+            self, a, b,
+            files: Union[str, list, None] = None,
+            excludes: Union[str, list, None] = None,
+            patch: bool = False) -> Tuple[List[str], Optional[str]]:
+        '''Get (changed files, patch) between a and b.
+
+        The patch is generated only when asked for, and then comes from the
+        same git invocation as the file list.
+        '''
+
+        if not patch:
+            return (self.diff_files(a, b, files, excludes), None)
+
         files = self.__to_git_files(files)
         excludes = self.__to_git_exclude(excludes)
 
-        command = 'git --no-pager diff --name-only {0}..{1}'
-        command = command.format(a, b)
-        command = (command + ' ' + files).strip()
-        command = (command + ' ' + excludes).strip()
-        command = command.strip()
+        command = ['git', '--no-pager', '-c', 'core.quotepath=off', 'diff',
+                   '--no-renames', '--patch-with-raw']
+        command = command + ['{0}..{1}'.format(a, b)] + files + excludes
+
+        # Files changed may not be UTF-8 text, the patch is only printed
+        output = self.__run(command, errors='replace') or ''
+        raw, _, patch = output.partition('\n\n')
+        if not raw.startswith(':'):
+            raw, patch = '', output
 
-        result = self.__run(command.format(a, b, files, excludes))
-        return result.splitlines()
+        changed_files = [self.__unquote(x.split('\t', 1)[1])
+                         for x in raw.splitlines()]
+
+        return (changed_files, patch)
 
     def print_diff(self, a, b, files=None, excludes=None) -> None:
+        if not logger.is_enabled(LogLevel.VERBOSE):
+            return
+
         files = self.__to_git_files(files)
         excludes = self.__to_git_exclude(excludes)
 
-        command = 'git --no-pager diff {0}..{1}'
-        command = command.format(a, b)
-        command = (command + ' ' + files).strip()
-        command = (command + ' ' + excludes).strip()
-        command = command.strip()
-        diff = self.__run(command)
+        command = ['git', '--no-pager', 'diff']
+        command = command + ['{0}..{1}'.format(a, b)] + files + excludes
+        diff = self.__run(command, errors='replace')
 
         logger.dump_diff(diff, level=LogLevel.VERBOSE)
 
+    def __open_native(self) -> Optional[Repository]:
+        command = ['git', 'rev-parse', '--git-dir', '--git-common-dir']
+        try:
+            git_directory, common_directory = \
+                [os.path.abspath(x) for x in self.__run(command).splitlines()]
+
+            return Repository(git_directory, common_directory)
+        except (ValueError, OSError) as e:
+            logger.verbose('Could not read the repository natively: %s' % e)
+            return None
+
+    def __resolve_object(self, name: str) -> Optional[Tuple[str, str]]:
+        if self.__native is not None:
+            try:
+                result = self.__native.resolve(name)
+            except (ValueError, OSError) as e:
+                logger.verbose('Could not resolve %s natively: %s' % (name, e))
+                result = None
+
+            if result is not None:
+                return result
+
+        return self.__cat_file.resolve(name)
+
+    def __native_latest_object(
+            self,
+            files: Union[str, list, None],
+            excludes: Union[str, list, None]) -> Optional[str]:
+        if self.__native is None:
+            return None
+
+        pathspec = None
+        key = self.__pathspec_key(files, excludes)
+        if key[0] or key[1]:
+            pathspec = self.__compile(files, excludes)
+            if pathspec is None:
+                return None
+
+        try:
+            return self.__native.latest_commit(pathspec)
+        except (ValueError, OSError) as e:
+            logger.verbose('Could not walk history natively: %s' % e)
+            return None
+
+    def __list_tree(self, rev: str, items: list) -> Iterator[Tuple[str, str, str]]:
+        '''Get (type, object id, path) of files at rev like `ls-tree -r`
+        '''
+
+        if self.__native is not None:
+            try:
+                result = self.__native.list_tree(
+                    rev, lambda x: any(y.may_match_under(x) for y in items))
+                if result is not None:
+                    return list(result)
+            except (ValueError, OSError) as e:
+                logger.verbose('Could not list tree natively: %s' % e)
+
+        command = ['git', '--no-pager', '-c', 'core.quotepath=off',
+                   'ls-tree', '-r', '--full-tree', rev]
+        if all(x.pattern and not x.wildcard and not x.icase for x in items):
+            command += ['--'] + [x.pattern for x in items]
+
+        result = []
+        for line in (self.__run(command) or '').splitlines():
+            meta, path = line.split('\t', 1)
+            _, object_type, object_id = meta.split(' ')
+            result.append((object_type, object_id, self.__unquote(path)))
+
+        return result
+
+    def __log_latest_object(
+            self,
+            files: Union[str, list, None],
+            excludes: Union[str, list, None]) -> str:
+        files = self.__to_git_files(files)
+        excludes = self.__to_git_exclude(excludes)
+
+        command = ['git', '--no-pager', 'log', '-n', '1', '--pretty=oneline']
+        command = command + files + excludes
+
+        result = self.__run(command)
+
+        return result.split()[0] if result else ''
+
+    def __list_changed_files(self, a, b) -> PathTrie:
+        key = (a, b)
+        if key in self.__changed_files:
+            return self.__changed_files[key]
+
+        cache_key = self.__commits_cache_key('changed_files', [a, b])
+        result = self.__cache_get(cache_key)
+        if result is None:
+            command = ['git', '--no-pager', 'diff', '--name-only',
+                       '--no-renames', '{0}..{1}'.format(a, b)]
+
+            result = (self.__run(command) or '').splitlines()
+            result = [self.__unquote(x) for x in result]
+            self.__cache_set(cache_key, result)
+
+        self.__changed_files[key] = PathTrie(result)
+
+        return self.__changed_files[key]
+
+    def __diff_files(self, a, b, files, excludes) -> List[str]:
+        cache_key = self.__commits_cache_key('diff_files', [a, b])
+        if cache_key is not None:
+            cache_key.append(self.__pathspec_key(files, excludes))
+
+        result = self.__cache_get(cache_key)
+        if result is not None:
+            return result
+
+        files = self.__to_git_files(files)
+        excludes = self.__to_git_exclude(excludes)
+
+        command = ['git', '--no-pager', 'diff', '--name-only']
+        command = command + ['{0}..{1}'.format(a, b)] + files + excludes
+
+        result = self.__run(command).splitlines()
+        self.__cache_set(cache_key, result)
+
+        return result
+
+    def __compile(
+            self,
+            files: Union[str, list, None],
+            excludes: Union[str, list, None]) -> Optional[Pathspec]:
+        '''Get the Pathspec, None when git has to evaluate it itself
+        '''
+
+        key = self.__pathspec_key(files, excludes)
+        if key not in self.__pathspecs:
+            try:
+                self.__pathspecs[key] = \
+                    Pathspec(files, excludes, self.__prefix, self.__top)
+            except ValueError:
+                self.__pathspecs[key] = None
+
+        return self.__pathspecs[key]
+
+    def __latest_object_cache_key(self, key: tuple) -> Optional[list]:
+        # History of a shallow clone ends early, the answer may change
+        if self.__cache is None or self.__shallow:
+            return None
+
+        return ['latest_object', self.LATEST_OBJECT_VERSION,
+                self.head_object, self.__prefix, key]
+
+    def __commits_cache_key(self, name: str, revs: List[str]) -> Optional[list]:
+        '''Build a cache key from revs, None unless all of them are commits
+        '''
+
+        if self.__cache is None or len(revs) == 0:
+            return None
+
+        commits = [self.resolve('%s^{commit}' % x) for x in revs]
+        if None in commits:
+            return None
+
+        return [name] + commits
+
+    def __cache_get(self, cache_key: Optional[list]):
+        if cache_key is None:
+            return None
+
+        return self.__cache.get(self.CACHE_NAMESPACE, cache_key)
+
+    def __cache_set(self, cache_key: Optional[list], value) -> None:
+        if cache_key is None or value is None:
+            return
+
+        self.__cache.set(self.CACHE_NAMESPACE, cache_key, value)
+
     @classmethod
-    def __to_git_files(cls, files: Union[str, list, None] = None) -> str:
+    def __pathspec_key(
+            cls,
+            files: Union[str, list, None],
+            excludes: Union[str, list, None]) -> tuple:
+        files = files or []
+        if not type(files) == list:
+            files = [files]
+
+        excludes = excludes or []
+        if not type(excludes) == list:
+            excludes = [excludes]
+
+        return (tuple(files), tuple(excludes))
+
+    @classmethod
+    def __branch_from_environment(cls, environ) -> Optional[str]:
+        for name in cls.BRANCH_ENVIRONMENTS:
+            value = (environ.get(name) or '').strip()
+            if value.startswith('refs/heads/'):
+                value = value[len('refs/heads/'):]
+            elif value.startswith('refs/'):
+                # Tags and pull request refs are not branches
+                continue
+
+            if name == 'GIT_BRANCH' and value.startswith('origin/'):
+                value = value[len('origin/'):]
+
+            if value:
+                return value
+
+        return None
+
+    @classmethod
+    def __is_resolvable(cls, item, excludes: list) -> bool:
+        '''Whether item can be fingerprinted with a single object id
+        '''
+
+        if item.wildcard or item.icase:
+            return False
+
+        for exclude in excludes:
+            if exclude.wildcard or exclude.icase:
+                return False
+
+            if not item.pattern or \
+                    exclude.pattern == item.pattern or \
+                    exclude.pattern.startswith(item.pattern + '/') or \
+                    item.pattern.startswith(exclude.pattern + '/'):
+                return False
+
+        return True
+
+    @classmethod
+    def __walk(cls, command: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        '''Stream `(header, changed files)` from `git log --format=%x01...`.
+
+        The git process is stopped when the caller stops iterating.
+        '''
+
+        logger.verbose('`%s`' % ' '.join(command))
+
+        proc = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        completed = False
+        try:
+            commit = None
+            changed_files = []
+            for line in proc.stdout:
+                line = line.decode('utf8').rstrip('\n')
+                if line.startswith('\x01'):
+                    if commit is not None:
+                        yield (commit, changed_files)
+
+                    commit = line[1:]
+                    changed_files = []
+                elif line:
+                    changed_files.append(cls.__unquote(line))
+
+            if commit is not None:
+                yield (commit, changed_files)
+
+            completed = True
+        finally:
+            if not completed:
+                proc.kill()
+
+            _, stderr = proc.communicate()
+
+        if proc.returncode != 0:
+            stderr = (stderr or b'').decode('utf8').strip()
+            if stderr == cls.__NOT_GIT_REPOSITORY_ERROR:
+                raise NotGitRepositoryException()
+
+            raise Exception(stderr)
+
+    @classmethod
+    def __unquote(cls, path: str) -> str:
+        if not path.startswith('"'):
+            return path
+
+        path = codecs.escape_decode(path[1:-1].encode('utf8'))[0]
+        return path.decode('utf8')
+
+    @classmethod
+    def __to_git_files(cls, files: Union[str, list, None] = None) -> List[str]:
         files = files or []
         if not type(files) == list:
             files = [files]
 
         if len(files) > 0:
-            files = '-- %s' % ' '.join(files)
-        else:
-            files = ''
+            files = ['--'] + files
 
-        return files.strip()
+        return files
 
     @classmethod
-    def __to_git_exclude(cls, excludes: Union[str, list, None] = None) -> str:
+    def __to_git_exclude(cls, excludes: Union[str, list, None] = None) -> List[str]:
         excludes = excludes or []
 
         if not type(excludes) == list:
             excludes = [excludes]
 
-        excludes = ['":(exclude)%s"' % x for x in excludes]
-        excludes = ' '.join(excludes)
-
-        return excludes.strip()
+        return [':(exclude)%s' % x for x in excludes]
 
     @classmethod
-    def __run(cls, command: str):
+    def __run(cls, command: List[str], errors: str = 'strict'):
 
-        logger.verbose('`%s`' % command)
+        logger.verbose('`%s`' % ' '.join(command))
 
         proc = subprocess.run(command, **cls.__RUN_OPTION)
         result = None
@@ -139,7 +803,7 @@ class Git:
             result = proc.stderr
 
         if result:
-            result = result.decode('utf8').strip()
+            result = result.decode('utf8', errors).strip()
 
         if proc.returncode != 0:
             if not result:
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import heapq
+
+from typing import Callable, List, Optional, Tuple
+
+
+def latest_commit(
+        head: str,
+        commit: Callable[[str], Tuple[List[str], int]],
+        treesame: Callable[[str, Optional[str]], bool]) -> str:
+    '''Get the commit `git log -n 1 -- <pathspec>` shows, '' when no commit
+    is shown.
+
+    commit gives (parents, commit time) of a commit. treesame tells whether
+    no path matched by the pathspec changed between a commit and a parent,
+    None for a root commit.
+
+    History is simplified like the default mode of git log: a commit which
+    is TREESAME to a parent is not shown and only that parent is followed.
+    Commits are visited in commit date order.
+    '''
+
+    order = 0
+    queue = [(-commit(head)[1], order, head)]
+    seen = {head}
+    while queue:
+        _, _, current = heapq.heappop(queue)
+        parents = commit(current)[0]
+
+        is_treesame = False
+        if len(parents) == 0:
+            is_treesame = treesame(current, None)
+
+        for parent in parents:
+            if treesame(current, parent):
+                parents = [parent]
+                is_treesame = True
+                break
+
+        for parent in parents:
+            if parent in seen:
+                continue
+
+            seen.add(parent)
+            order += 1
+            heapq.heappush(queue, (-commit(parent)[1], order, parent))
+
+        if not is_treesame:
+            return current
+
+    return ''
@@ -0,0 +1,389 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import re
+import collections
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from deploy2ecscli.git import history
+from deploy2ecscli.git.commitgraph import CommitGraph
+from deploy2ecscli.git.objects import ObjectStore
+from deploy2ecscli.git.pathspec import Pathspec
+
+
+class Repository:
+    '''Answer read-only git queries in process, without the git binary.
+
+    Every answer must be identical to the one of the git CLI. When the
+    repository uses a feature which is not supported here (replace refs,
+    grafts, reftable, SHA-256, ...), None is returned and the caller falls
+    back to the CLI.
+    '''
+
+    MODE_TREE = '40000'
+    MODE_GITLINK = '160000'
+
+    __HEX = re.compile(r'[0-9a-f]{40}')
+    __PEEL = re.compile(r'\^\{(commit|tree|)\}$')
+    __CACHE_SIZE = 8192
+
+    def __init__(self, git_directory: str, common_directory: str):
+        self.git_directory = git_directory
+        self.common_directory = common_directory
+        self.objects = ObjectStore(os.path.join(common_directory, 'objects'))
+        self.__trees = collections.OrderedDict()  # type: Dict[str, dict]
+        self.__commits = {}  # type: Dict[str, Tuple[str, List[str], int]]
+        self.__packed_refs = None  # type: Dict[str, str]
+        self.__graph = None  # type: CommitGraph
+        self.__shallow = set()  # type: set
+        self.supported = self.__is_supported()
+        self.refresh()
+
+    def refresh(self) -> None:
+        '''Forget what may have been changed by a fetch
+        '''
+
+        self.__commits.clear()
+        self.__packed_refs = None
+        if self.__graph is not None:
+            self.__graph.close()
+            self.__graph = None
+
+        self.__shallow = set()
+        path = os.path.join(self.common_directory, 'shallow')
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.__shallow = set(x.strip() for x in f if x.strip())
+
+        # Like git, the commit-graph is not used in shallow clones
+        if self.supported and not self.__shallow:
+            info = os.path.join(self.common_directory, 'objects', 'info')
+            try:
+                self.__graph = CommitGraph.open(info)
+            except (ValueError, OSError):
+                self.__graph = None
+
+    def close(self) -> None:
+        if self.__graph is not None:
+            self.__graph.close()
+
+        self.objects.close()
+
+    def resolve(self, name: str) -> Optional[Tuple[str, str]]:
+        '''Get (object id, object type) like `git cat-file --batch-check`.
+
+        Supports `HEAD`, `refs/...`, full object ids, `<rev>^{commit}`,
+        `<rev>^{tree}`, `<rev>^{}` and `<rev>:<path>`.
+        '''
+
+        if not self.supported:
+            return None
+
+        path = None
+        if ':' in name:
+            name, path = name.split(':', 1)
+            if path.startswith('./') or path.startswith('../') or \
+                    path.endswith('/') or '//' in path:
+                return None
+
+        peel = self.__PEEL.search(name)
+        if peel is not None:
+            name = name[:peel.start()]
+
+        object_id = self.__resolve_name(name)
+        if object_id is None:
+            return None
+
+        object_type = self.objects.type_of(object_id)
+        if object_type is None:
+            return None
+
+        if peel is not None:
+            object_id, object_type = \
+                self.__peel(object_id, object_type, peel.group(1))
+        elif path is not None:
+            object_id, object_type = self.__peel(object_id, object_type, 'tree')
+
+        if path is not None and object_id is not None:
+            object_id, object_type = self.__lookup_path(object_id, path)
+
+        if object_id is None:
+            return None
+
+        return (object_id, object_type)
+
+    def latest_commit(self, pathspec: Optional[Pathspec]) -> Optional[str]:
+        '''Get the commit `git log -n 1 -- <pathspec>` shows, '' when no
+        commit is shown. History is simplified like git log, see
+        history.latest_commit.
+        '''
+
+        if not self.supported:
+            return None
+
+        head = self.resolve('HEAD^{commit}')
+        if head is None:
+            return None
+
+        head = head[0]
+        if pathspec is None:
+            return head
+
+        def commit(x):
+            return self.__commit(x)[1:]
+
+        def treesame(x, parent):
+            tree = self.__commit(parent)[0] if parent is not None else None
+            return not self.__differs(tree, self.__commit(x)[0], pathspec)
+
+        return history.latest_commit(head, commit, treesame)
+
+    def list_tree(
+            self,
+            rev: str,
+            descend: Callable[[str], bool]) -> Optional[Iterator[Tuple[str, str, str]]]:
+        '''Get (type, object id, path) of non-tree entries like
+        `git ls-tree -r`, None when rev is unknown.
+
+        Directories for which descend is false are skipped.
+        '''
+
+        tree = self.resolve('%s^{tree}' % rev)
+        if tree is None:
+            return None
+
+        return self.__walk_tree(tree[0], '', descend)
+
+    def __walk_tree(self, tree: str, base: str, descend):
+        for name, (mode, object_id) in sorted(self.__tree(tree).items()):
+            path = base + name
+            if mode == self.MODE_TREE:
+                if descend(path):
+                    yield from self.__walk_tree(object_id, path + '/', descend)
+            elif mode == self.MODE_GITLINK:
+                yield ('commit', object_id, path)
+            else:
+                yield ('blob', object_id, path)
+
+    def __differs(
+            self,
+            tree_a: Optional[str],
+            tree_b: Optional[str],
+            pathspec: Pathspec,
+            base: str = '') -> bool:
+        '''Whether a path matched by pathspec differs between two trees
+        '''
+
+        if tree_a == tree_b:
+            return False
+
+        entries_a = self.__tree(tree_a) if tree_a else {}
+        entries_b = self.__tree(tree_b) if tree_b else {}
+        for name in set(entries_a) | set(entries_b):
+            entry_a = entries_a.get(name)
+            entry_b = entries_b.get(name)
+            if entry_a == entry_b:
+                continue
+
+            path = base + name
+            subtree_a = subtree_b = None
+            leaf_changed = False
+            for entry in [entry_a, entry_b]:
+                if entry is None:
+                    continue
+
+                if entry[0] != self.MODE_TREE:
+                    leaf_changed = True
+
+            if entry_a is not None and entry_a[0] == self.MODE_TREE:
+                subtree_a = entry_a[1]
+
+            if entry_b is not None and entry_b[0] == self.MODE_TREE:
+                subtree_b = entry_b[1]
+
+            if leaf_changed and pathspec.match(path):
+                return True
+
+            if (subtree_a or subtree_b) and \
+                    pathspec.may_match_under(path) and \
+                    self.__differs(subtree_a, subtree_b, pathspec, path + '/'):
+                return True
+
+        return False
+
+    def __tree(self, tree: str) -> Dict[str, Tuple[str, str]]:
+        if tree in self.__trees:
+            self.__trees.move_to_end(tree)
+            return self.__trees[tree]
+
+        data = self.objects.read(tree)
+        if data is None or data[0] != 'tree':
+            raise ValueError('Missing tree: %s' % tree)
+
+        data = data[1]
+        entries = {}
+        position = 0
+        hash_length = self.objects.hash_length
+        while position < len(data):
+            space = data.index(b' ', position)
+            end = data.index(b'\0', space)
+            mode = data[position:space].decode('ascii')
+            name = data[space + 1:end].decode('utf8')
+            object_id = data[end + 1:end + 1 + hash_length].hex()
+            entries[name] = (mode, object_id)
+            position = end + 1 + hash_length
+
+        self.__trees[tree] = entries
+        if len(self.__trees) > self.__CACHE_SIZE:
+            self.__trees.popitem(last=False)
+
+        return entries
+
+    def __commit(self, commit: str) -> Tuple[str, List[str], int]:
+        '''Get (tree, parents, commit time) of a commit
+        '''
+
+        if commit in self.__commits:
+            return self.__commits[commit]
+
+        result = None
+        if self.__graph is not None:
+            result = self.__graph.commit(commit)
+
+        if result is None:
+            result = self.__parse_commit(commit)
+
+        if commit in self.__shallow:
+            result = (result[0], [], result[2])
+
+        self.__commits[commit] = result
+
+        return result
+
+    def __parse_commit(self, commit: str) -> Tuple[str, List[str], int]:
+        data = self.objects.read(commit)
+        if data is None or data[0] != 'commit':
+            raise ValueError('Missing commit: %s' % commit)
+
+        tree = None
+        parents = []
+        date = 0
+        for line in data[1].split(b'\n'):
+            if not line:
+                break
+
+            key, _, value = line.partition(b' ')
+            if key == b'tree':
+                tree = value.decode('ascii')
+            elif key == b'parent':
+                parents.append(value.decode('ascii'))
+            elif key == b'committer':
+                date = int(value.rsplit(b' ', 2)[1])
+
+        return (tree, parents, date)
+
+    def __peel(self, object_id: str, object_type: str, target: str):
+        while object_type == 'tag':
+            data = self.objects.read(object_id)[1]
+            object_id = data.split(b'\n', 1)[0].split(b' ', 1)[1].decode('ascii')
+            object_type = self.objects.type_of(object_id)
+
+        if target == 'tree' and object_type == 'commit':
+            object_id = self.__commit(object_id)[0]
+            object_type = 'tree'
+
+        if target and object_type != target:
+            return (None, None)
+
+        return (object_id, object_type)
+
+    def __lookup_path(self, tree: str, path: str):
+        object_id, object_type = tree, 'tree'
+        for name in path.split('/') if path else []:
+            if object_type != 'tree':
+                return (None, None)
+
+            entry = self.__tree(object_id).get(name)
+            if entry is None:
+                return (None, None)
+
+            object_id = entry[1]
+            object_type = self.objects.type_of(object_id)
+            if object_type is None:
+                return (None, None)
+
+        return (object_id, object_type)
+
+    def __resolve_name(self, name: str) -> Optional[str]:
+        if self.__HEX.fullmatch(name):
+            return name
+
+        if name == 'HEAD' or name.startswith('refs/'):
+            return self.__resolve_ref(name)
+
+        return None
+
+    def __resolve_ref(self, name: str, depth: int = 0) -> Optional[str]:
+        if depth > 5:
+            return None
+
+        directory = self.git_directory if name == 'HEAD' \
+            else self.common_directory
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path) as f:
+                value = f.read().strip()
+
+            if value.startswith('ref: '):
+                return self.__resolve_ref(value[len('ref: '):], depth + 1)
+
+            return value if self.__HEX.fullmatch(value) else None
+
+        return self.__read_packed_refs().get(name)
+
+    def __read_packed_refs(self) -> Dict[str, str]:
+        if self.__packed_refs is not None:
+            return self.__packed_refs
+
+        self.__packed_refs = {}
+        path = os.path.join(self.common_directory, 'packed-refs')
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    if line.startswith('#') or line.startswith('^'):
+                        continue
+
+                    object_id, _, name = line.strip().partition(' ')
+                    self.__packed_refs[name] = object_id
+
+        return self.__packed_refs
+
+    def __is_supported(self) -> bool:
+        common = self.common_directory
+        if os.path.isdir(os.path.join(common, 'reftable')) or \
+                os.path.isfile(os.path.join(common, 'info', 'grafts')):
+            return False
+
+        replace = os.path.join(common, 'refs', 'replace')
+        if os.path.isdir(replace) and os.listdir(replace):
+            return False
+
+        packed_refs = os.path.join(common, 'packed-refs')
+        if os.path.isfile(packed_refs):
+            with open(packed_refs) as f:
+                if any(' refs/replace/' in x for x in f):
+                    return False
+
+        config = os.path.join(common, 'config')
+        if os.path.isfile(config):
+            with open(config) as f:
+                content = f.read().lower()
+
+            if 'objectformat' in content or 'refstorage' in content:
+                return False
+
+        return True
@@ -0,0 +1,403 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import mmap
+import zlib
+import struct
+import collections
+
+from typing import Dict, List, Optional, Tuple
+
+
+class PackIndex:
+    '''A pack `.idx` file (version 1 or 2), memory mapped.
+    '''
+
+    __V2_SIGNATURE = b'\377tOc'
+
+    def __init__(self, path: str, hash_length: int = 20):
+        self.path = path
+        self.hash_length = hash_length
+
+        with open(path, 'rb') as f:
+            self.__data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.__data[:4] == self.__V2_SIGNATURE:
+            version = struct.unpack_from('>I', self.__data, 4)[0]
+            if version != 2:
+                self.close()
+                raise ValueError('Unsupported pack index version: %s' % path)
+
+            self.version = 2
+            self.__fanout = 8
+        else:
+            self.version = 1
+            self.__fanout = 0
+
+        self.count = self.__fanout_at(255)
+
+        names = self.__fanout + 256 * 4
+        if self.version == 1:
+            self.__names = names + 4
+            self.__name_stride = hash_length + 4
+        else:
+            self.__names = names
+            self.__name_stride = hash_length
+            self.__offsets = names + self.count * (hash_length + 4)
+            self.__large_offsets = self.__offsets + self.count * 4
+
+    def offset(self, object_id: bytes) -> Optional[int]:
+        '''Get the pack offset of an object, None when it is not in the pack
+        '''
+
+        first = object_id[0]
+        low = self.__fanout_at(first - 1) if first > 0 else 0
+        high = self.__fanout_at(first)
+        while low < high:
+            middle = (low + high) // 2
+            start = self.__names + middle * self.__name_stride
+            current = self.__data[start:start + self.hash_length]
+            if current == object_id:
+                return self.__offset_at(middle)
+
+            if current < object_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def close(self) -> None:
+        self.__data.close()
+
+    def __offset_at(self, position: int) -> int:
+        if self.version == 1:
+            start = self.__names + position * self.__name_stride - 4
+            return struct.unpack_from('>I', self.__data, start)[0]
+
+        offset = struct.unpack_from(
+            '>I', self.__data, self.__offsets + position * 4)[0]
+        if offset & 0x80000000:
+            index = offset & 0x7fffffff
+            offset = struct.unpack_from(
+                '>Q', self.__data, self.__large_offsets + index * 8)[0]
+
+        return offset
+
+    def __fanout_at(self, index: int) -> int:
+        return struct.unpack_from('>I', self.__data, self.__fanout + index * 4)[0]
+
+
+class Pack:
+    '''A `.pack` file and its index, memory mapped.
+    '''
+
+    TYPE_NAMES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+    OFS_DELTA = 6
+    REF_DELTA = 7
+
+    __CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path: str, hash_length: int = 20):
+        self.path = path
+        self.index = PackIndex(path[:-len('.pack')] + '.idx', hash_length)
+
+        with open(path, 'rb') as f:
+            self.__data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.__data[:4] != b'PACK':
+            self.close()
+            raise ValueError('Invalid pack file: %s' % path)
+
+    def header(self, offset: int) -> Tuple[int, int, Optional[object]]:
+        '''Get (type, data position, delta base) of the entry at offset.
+
+        The delta base is a pack offset for OFS_DELTA and an object id for
+        REF_DELTA entries, None otherwise.
+        '''
+
+        data = self.__data
+        byte = data[offset]
+        object_type = (byte >> 4) & 0x7
+        position = offset + 1
+        while byte & 0x80:
+            byte = data[position]
+            position += 1
+
+        base = None
+        if object_type == self.OFS_DELTA:
+            byte = data[position]
+            position += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = data[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+
+            base = offset - distance
+        elif object_type == self.REF_DELTA:
+            hash_length = self.index.hash_length
+            base = data[position:position + hash_length]
+            position += hash_length
+
+        return (object_type, position, base)
+
+    def inflate(self, position: int) -> bytes:
+        decompressor = zlib.decompressobj()
+        result = []
+        while not decompressor.eof:
+            chunk = self.__data[position:position + self.__CHUNK_SIZE]
+            if not chunk:
+                raise ValueError('Truncated pack file: %s' % self.path)
+
+            result.append(decompressor.decompress(chunk))
+            position += self.__CHUNK_SIZE
+
+        return b''.join(result)
+
+    def close(self) -> None:
+        self.index.close()
+        self.__data.close()
+
+
+class ObjectStore:
+    '''Read objects of a repository without git.
+
+    Loose objects, packfiles and alternates are looked up, deltas are
+    resolved in process.
+
+    Usage:
+        store = ObjectStore('.git/objects')
+        object_type, data = store.read(object_id)
+    '''
+
+    __CACHE_SIZE = 4096
+
+    # Raised reading corrupt objects, reported as ValueError
+    __CORRUPT_ERRORS = (zlib.error, struct.error, KeyError, IndexError)
+
+    def __init__(self, directory: str, hash_length: int = 20):
+        self.directory = directory
+        self.hash_length = hash_length
+        self.__packs = None  # type: List[Pack]
+        self.__packs_stamp = None
+        self.__cache = collections.OrderedDict()  # type: Dict[tuple, tuple]
+        self.__alternates = [
+            ObjectStore(x, hash_length) for x in self.__read_alternates()]
+
+    def read(self, object_id: str) -> Optional[Tuple[str, bytes]]:
+        '''Get (type, content) of an object, None when it does not exist
+        '''
+
+        binary_id = bytes.fromhex(object_id)
+        if len(binary_id) != self.hash_length:
+            return None
+
+        try:
+            result = self.__read(binary_id)
+            if result is not None:
+                return result
+
+            # A fetch may have added packs meanwhile
+            if self.__reload_packs():
+                return self.__read(binary_id)
+        except self.__CORRUPT_ERRORS as e:
+            raise ValueError('Corrupt object %s: %r' % (object_id, e)) from e
+
+        return None
+
+    def type_of(self, object_id: str) -> Optional[str]:
+        '''Get the type of an object without reading all of it
+        '''
+
+        binary_id = bytes.fromhex(object_id)
+        if len(binary_id) != self.hash_length:
+            return None
+
+        try:
+            result = self.__type_of(binary_id)
+            if result is None and self.__reload_packs():
+                result = self.__type_of(binary_id)
+        except self.__CORRUPT_ERRORS as e:
+            raise ValueError('Corrupt object %s: %r' % (object_id, e)) from e
+
+        return result
+
+    def close(self) -> None:
+        for pack in self.__packs or []:
+            pack.close()
+
+        for alternate in self.__alternates:
+            alternate.close()
+
+        self.__packs = None
+        self.__cache.clear()
+
+    def __read(self, binary_id: bytes) -> Optional[Tuple[str, bytes]]:
+        if self.__packs is None:
+            self.__reload_packs()
+
+        for pack in self.__packs:
+            offset = pack.index.offset(binary_id)
+            if offset is not None:
+                return self.__read_packed(pack, offset)
+
+        result = self.__read_loose(binary_id.hex())
+        if result is not None:
+            return result
+
+        for alternate in self.__alternates:
+            result = alternate.__read(binary_id)
+            if result is not None:
+                return result
+
+        return None
+
+    def __type_of(self, binary_id: bytes) -> Optional[str]:
+        if self.__packs is None:
+            self.__reload_packs()
+
+        for pack in self.__packs:
+            offset = pack.index.offset(binary_id)
+            while offset is not None:
+                object_type, _, base = pack.header(offset)
+                if object_type == Pack.OFS_DELTA:
+                    offset = base
+                elif object_type == Pack.REF_DELTA:
+                    return self.type_of(base.hex())
+                else:
+                    return Pack.TYPE_NAMES[object_type]
+
+        path = self.__loose_path(binary_id.hex())
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                header = zlib.decompressobj().decompress(f.read(64), 32)
+
+            return header.split(b' ', 1)[0].decode('ascii')
+
+        for alternate in self.__alternates:
+            result = alternate.__type_of(binary_id)
+            if result is not None:
+                return result
+
+        return None
+
+    def __loose_path(self, object_id: str) -> str:
+        return os.path.join(self.directory, object_id[:2], object_id[2:])
+
+    def __read_loose(self, object_id: str) -> Optional[Tuple[str, bytes]]:
+        path = self.__loose_path(object_id)
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+        header, content = data.split(b'\0', 1)
+        object_type = header.split(b' ', 1)[0].decode('ascii')
+
+        return (object_type, content)
+
+    def __read_packed(self, pack: Pack, offset: int) -> Tuple[str, bytes]:
+        key = (pack.path, offset)
+        if key in self.__cache:
+            self.__cache.move_to_end(key)
+            return self.__cache[key]
+
+        object_type, position, base = pack.header(offset)
+        data = pack.inflate(position)
+        if object_type == Pack.OFS_DELTA:
+            base_type, base_data = self.__read_packed(pack, base)
+            result = (base_type, self.__apply_delta(base_data, data))
+        elif object_type == Pack.REF_DELTA:
+            base_object = self.read(base.hex())
+            if base_object is None:
+                raise ValueError('Missing delta base: %s' % base.hex())
+
+            result = (base_object[0], self.__apply_delta(base_object[1], data))
+        else:
+            result = (Pack.TYPE_NAMES[object_type], data)
+
+        self.__cache[key] = result
+        if len(self.__cache) > self.__CACHE_SIZE:
+            self.__cache.popitem(last=False)
+
+        return result
+
+    def __reload_packs(self) -> bool:
+        '''Open packs again when the pack directory changed
+        '''
+
+        directory = os.path.join(self.directory, 'pack')
+        try:
+            names = sorted(x for x in os.listdir(directory)
+                           if x.endswith('.pack'))
+        except FileNotFoundError:
+            names = []
+
+        if self.__packs is not None and names == self.__packs_stamp:
+            return False
+
+        for pack in self.__packs or []:
+            pack.close()
+
+        packs = []
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path[:-len('.pack')] + '.idx'):
+                packs.append(Pack(path, self.hash_length))
+
+        self.__packs = packs
+        self.__packs_stamp = names
+
+        return True
+
+    def __read_alternates(self) -> List[str]:
+        path = os.path.join(self.directory, 'info', 'alternates')
+        if not os.path.isfile(path):
+            return []
+
+        with open(path) as f:
+            lines = [x.strip() for x in f]
+
+        return [os.path.join(self.directory, x) for x in lines
+                if x and not x.startswith('#')]
+
+    @classmethod
+    def __apply_delta(cls, base: bytes, delta: bytes) -> bytes:
+        position = 0
+        for _ in range(2):
+            # Source and target sizes
+            while delta[position] & 0x80:
+                position += 1
+
+            position += 1
+
+        result = bytearray()
+        while position < len(delta):
+            opcode = delta[position]
+            position += 1
+            if opcode & 0x80:
+                offset = 0
+                for shift in range(4):
+                    if opcode & (1 << shift):
+                        offset |= delta[position] << (shift * 8)
+                        position += 1
+
+                size = 0
+                for shift in range(3):
+                    if opcode & (1 << (4 + shift)):
+                        size |= delta[position] << (shift * 8)
+                        position += 1
+
+                result += base[offset:offset + (size or 0x10000)]
+            elif opcode:
+                result += delta[position:position + opcode]
+                position += opcode
+            else:
+                raise ValueError('Invalid delta opcode')
+
+        return bytes(result)
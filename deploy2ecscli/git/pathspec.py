@@ -0,0 +1,346 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import re
+import fnmatch
+import posixpath
+
+from typing import Dict, List, Pattern, Union, Optional
+
+
+class PathspecItem:
+    '''One git pathspec element, e.g. `app/`, `*.rb` or `:(exclude)config/deploy`.
+
+    Supported magic: exclude (`!`, `^`), top (`/`), glob, icase, literal.
+    Absolute paths are made relative to top, the root of the working tree.
+    '''
+
+    __WILDCARDS = re.compile(r'[*?\[]')
+    __SHORT_MAGIC = {'!': 'exclude', '^': 'exclude', '/': 'top'}
+    __LONG_MAGIC = ['exclude', 'top', 'glob', 'icase', 'literal']
+
+    def __init__(
+            self,
+            spec: str,
+            prefix: str = '',
+            exclude: bool = False,
+            top: Optional[str] = None):
+        magic, pattern = self.__parse_magic(spec)
+
+        self.exclude = exclude or 'exclude' in magic
+        self.icase = 'icase' in magic
+        self.literal = 'literal' in magic
+        self.glob = 'glob' in magic and not self.literal
+
+        if pattern.startswith('/'):
+            pattern = self.__relative_to(pattern, top)
+        elif 'top' not in magic:
+            pattern = prefix + pattern
+
+        self.pattern = self.__normalize(pattern, self.icase)
+        self.directory = pattern.endswith('/')
+        self.wildcard = not self.literal and \
+            self.__WILDCARDS.search(self.pattern) is not None
+
+        # Every path this item can match starts with literal_prefix
+        self.literal_prefix = self.pattern
+        if self.wildcard:
+            wildcard = self.__WILDCARDS.search(self.pattern)
+            self.literal_prefix = self.pattern[:wildcard.start()]
+
+        self.__regex = None
+        self.__rest_regexes = {}  # type: Dict[str, Pattern]
+        if self.wildcard:
+            self.__regex = re.compile(self.__translate(self.pattern, self.glob))
+
+    def match(self, path: str) -> bool:
+        if self.icase:
+            path = path.lower()
+
+        if self.pattern == '':
+            return True
+
+        # Like git, a wildcard pattern is tried literally first, so `foo[1]`
+        # matches `foo[1]/z` too
+        if path == self.pattern:
+            return not self.directory
+
+        if path.startswith(self.pattern + '/'):
+            return True
+
+        if not self.wildcard:
+            return False
+
+        # Wildcards are matched against the whole path and `*` crosses
+        # directory boundaries unless glob magic is given.
+        if self.__regex.match(path) is not None:
+            return True
+
+        # Walking trees, git also matches the name against the rest of the
+        # pattern when the directories are the pattern literally, so
+        # `foo[1]/*` matches `foo[1]/z`
+        directory, _, name = path.rpartition('/')
+        if directory == '' or not self.pattern.startswith(directory + '/'):
+            return False
+
+        rest = self.pattern[len(directory) + 1:]
+        if rest not in self.__rest_regexes:
+            self.__rest_regexes[rest] = re.compile(
+                self.__translate(rest, self.glob))
+
+        return self.__rest_regexes[rest].match(name) is not None
+
+    def may_match_under(self, directory: str) -> bool:
+        '''Whether a path under directory may match
+        '''
+
+        if self.icase or self.literal_prefix == '':
+            return True
+
+        directory += '/'
+        if self.wildcard:
+            return self.literal_prefix.startswith(directory) or \
+                directory.startswith(self.literal_prefix)
+
+        return self.pattern.startswith(directory) or \
+            directory.startswith(self.pattern + '/')
+
+    @classmethod
+    def __parse_magic(cls, spec: str):
+        if not spec.startswith(':'):
+            return ([], spec)
+
+        if spec.startswith(':('):
+            end = spec.find(')')
+            if end < 0:
+                raise ValueError('Invalid pathspec magic: %s' % spec)
+
+            magic = [x.strip() for x in spec[2:end].split(',') if x.strip()]
+            unsupported = [x for x in magic if x not in cls.__LONG_MAGIC]
+            if unsupported:
+                raise ValueError(
+                    'Unsupported pathspec magic: %s' % ', '.join(unsupported))
+
+            return (magic, spec[end + 1:])
+
+        magic = []
+        index = 1
+        while index < len(spec) and spec[index] in cls.__SHORT_MAGIC:
+            magic.append(cls.__SHORT_MAGIC[spec[index]])
+            index += 1
+
+        if index < len(spec) and spec[index] == ':':
+            index += 1
+
+        return (magic, spec[index:])
+
+    @classmethod
+    def __relative_to(cls, pattern: str, top: Optional[str]) -> str:
+        if top is None:
+            raise ValueError('Pathspec is outside repository: %s' % pattern)
+
+        # Like git, the path is also tried with symbolic links resolved
+        for path in [pattern, os.path.realpath(pattern)]:
+            relative = posixpath.relpath(posixpath.normpath(path), top)
+            if relative == '.':
+                return ''
+
+            if relative != '..' and not relative.startswith('../'):
+                return relative + '/' if pattern.endswith('/') else relative
+
+        raise ValueError('Pathspec is outside repository: %s' % pattern)
+
+    @classmethod
+    def __normalize(cls, pattern: str, icase: bool) -> str:
+        pattern = posixpath.normpath(pattern) if pattern else '.'
+        if pattern == '.':
+            pattern = ''
+
+        if pattern.startswith('../') or pattern == '..':
+            raise ValueError('Pathspec is outside repository: %s' % pattern)
+
+        pattern = pattern.lstrip('/')
+
+        return pattern.lower() if icase else pattern
+
+    @classmethod
+    def __translate(cls, pattern: str, glob: bool) -> str:
+        if not glob:
+            return fnmatch.translate(pattern)
+
+        result = ''
+        index = 0
+        while index < len(pattern):
+            if pattern.startswith('**/', index):
+                result += '(?:.*/)?'
+                index += 3
+            elif pattern.startswith('/**', index) and \
+                    index + 3 == len(pattern):
+                result += '/.*'
+                index += 3
+            elif pattern[index] == '*':
+                result += '[^/]*'
+                index += 1
+            elif pattern[index] == '?':
+                result += '[^/]'
+                index += 1
+            elif pattern[index] == '[':
+                end = pattern.find(']', index + 2)
+                if end < 0:
+                    result += re.escape('[')
+                    index += 1
+                    continue
+
+                chars = pattern[index + 1:end]
+                if chars[0] in '!^':
+                    chars = '^' + chars[1:]
+
+                result += '[%s]' % chars.replace('\\', '\\\\')
+                index = end + 1
+            else:
+                result += re.escape(pattern[index])
+                index += 1
+
+        return '(?s:%s)\\Z' % result
+
+
+class PathTrie:
+    '''Index paths by their directories.
+
+    Pathspec items only visit the subtree under their literal prefix,
+    instead of every indexed path.
+    '''
+
+    def __init__(self, paths: List[str]):
+        self.paths = list(paths)
+        self.__root = {}  # type: dict
+        for path in self.paths:
+            node = self.__root
+            for name in path.split('/'):
+                node = node.setdefault(name, {})
+
+            # None marks the end of a path
+            node[None] = path
+
+    def candidates(self, item: PathspecItem) -> List[str]:
+        '''Get the paths which item may match
+        '''
+
+        if item.icase or item.literal_prefix == '':
+            return self.paths
+
+        if not item.wildcard:
+            node = self.__find(item.pattern.split('/'))
+            return self.__collect([node] if node is not None else [])
+
+        directories = item.literal_prefix.split('/')
+        name = directories.pop()
+        node = self.__find(directories)
+        if node is None:
+            return []
+
+        nodes = [child for key, child in node.items()
+                 if key is not None and key.startswith(name)]
+        return self.__collect(nodes)
+
+    def __find(self, names: List[str]) -> Optional[dict]:
+        node = self.__root
+        for name in names:
+            node = node.get(name)
+            if node is None:
+                return None
+
+        return node
+
+    @classmethod
+    def __collect(cls, nodes: List[dict]) -> List[str]:
+        paths = []
+        while nodes:
+            node = nodes.pop()
+            for key, child in node.items():
+                if key is None:
+                    paths.append(child)
+                else:
+                    nodes.append(child)
+
+        return paths
+
+
+class Pathspec:
+    '''Evaluate git pathspecs in process.
+
+    A path matches when it matches any include item (or there is no include
+    item at all) and does not match any exclude item.
+    '''
+
+    def __init__(
+            self,
+            files: Union[str, list, None] = None,
+            excludes: Union[str, list, None] = None,
+            prefix: str = '',
+            top: Optional[str] = None):
+        files = files or []
+        if not type(files) == list:
+            files = [files]
+
+        excludes = excludes or []
+        if not type(excludes) == list:
+            excludes = [excludes]
+
+        items = [PathspecItem(x, prefix, top=top) for x in files]
+        items += [PathspecItem(x, prefix, exclude=True, top=top)
+                  for x in excludes]
+
+        self.includes = [x for x in items if not x.exclude]
+        self.excludes = [x for x in items if x.exclude]
+
+    def match(self, path: str) -> bool:
+        if self.includes and not any(x.match(path) for x in self.includes):
+            return False
+
+        return not any(x.match(path) for x in self.excludes)
+
+    def match_any(self, paths: List[str]) -> Optional[str]:
+        '''Get the first path which matches, None when nothing matches.
+        '''
+
+        return next((x for x in paths if self.match(x)), None)
+
+    def may_match_under(self, directory: str) -> bool:
+        '''Whether a path under directory may match
+        '''
+
+        if self.includes and \
+                not any(x.may_match_under(directory) for x in self.includes):
+            return False
+
+        for item in self.excludes:
+            if item.wildcard or item.icase:
+                continue
+
+            if item.pattern == '' or item.pattern == directory or \
+                    directory.startswith(item.pattern + '/'):
+                return False
+
+        return True
+
+    def filter(self, paths: Union[PathTrie, List[str]]) -> List[str]:
+        '''Get the matching paths in sorted order
+        '''
+
+        if not isinstance(paths, PathTrie):
+            paths = PathTrie(paths)
+
+        if len(self.includes) == 0:
+            matched = set(paths.paths)
+        else:
+            matched = set()
+            for item in self.includes:
+                matched.update(x for x in paths.candidates(item)
+                               if item.match(x))
+
+        return sorted(x for x in matched
+                      if not any(e.match(x) for e in self.excludes))
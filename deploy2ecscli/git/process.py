@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import subprocess
+import threading
+
+from typing import List, Optional, Tuple
+
+from deploy2ecscli import logger
+
+
+class BatchProcess:
+    '''Keep a git command alive and exchange line based queries over its pipes.
+    '''
+
+    __POPEN_OPTION = {
+        'stdin': subprocess.PIPE,
+        'stdout': subprocess.PIPE,
+        'stderr': subprocess.DEVNULL,
+        'bufsize': 0
+    }
+
+    def __init__(self, command: List[str]):
+        self.__command = command
+        self.__proc = None  # type: subprocess.Popen
+        self.__lock = threading.Lock()
+
+    @property
+    def command(self) -> List[str]:
+        return self.__command
+
+    def query(self, line: str) -> str:
+        with self.__lock:
+            proc = self.__open()
+            proc.stdin.write((line + '\n').encode('utf8'))
+            proc.stdin.flush()
+
+            result = proc.stdout.readline()
+            if not result:
+                self.__proc = None
+                raise Exception('`%s` exited unexpectedly' %
+                                ' '.join(self.__command))
+
+            return result.decode('utf8').rstrip('\n')
+
+    def query_until(self, line: str, end: str) -> List[str]:
+        '''Get lines answered to line, up to the line end which git echoes
+        back after the answer.
+        '''
+
+        with self.__lock:
+            proc = self.__open()
+            proc.stdin.write((line + '\n' + end + '\n').encode('utf8'))
+            proc.stdin.flush()
+
+            # Read in chunks, the pipe is unbuffered
+            terminator = (end + '\n').encode('utf8')
+            output = b''
+            while not (output == terminator or
+                       output.endswith(b'\n' + terminator)):
+                chunk = proc.stdout.read(65536)
+                if not chunk:
+                    self.__proc = None
+                    raise Exception('`%s` exited unexpectedly' %
+                                    ' '.join(self.__command))
+
+                output += chunk
+
+            return output[:-len(terminator)].decode('utf8').splitlines()
+
+    def close(self) -> None:
+        with self.__lock:
+            proc, self.__proc = self.__proc, None
+            if proc is None:
+                return
+
+            proc.stdin.close()
+            proc.wait()
+
+    def __open(self) -> subprocess.Popen:
+        if self.__proc is None or self.__proc.poll() is not None:
+            logger.verbose('`%s` (persistent)' % ' '.join(self.__command))
+            self.__proc = subprocess.Popen(
+                self.__command, **self.__POPEN_OPTION)
+
+        return self.__proc
+
+
+class CatFile(BatchProcess):
+    '''Resolve object names with a single `git cat-file --batch-check`.
+    '''
+
+    def __init__(self):
+        super(CatFile, self).__init__(
+            ['git', 'cat-file', '--batch-check'])
+
+    def resolve(self, name: str) -> Optional[Tuple[str, str]]:
+        '''Get object id and object type of name, None when missing.
+        '''
+
+        if not name or '\n' in name:
+            return None
+
+        result = self.query(name)
+        if result.endswith(' missing') or result.endswith(' ambiguous'):
+            return None
+
+        object_id, object_type = result.split()[:2]
+
+        return (object_id, object_type)
+
+
+class DiffTree(BatchProcess):
+    '''List files changed between commits with a single
+    `git diff-tree --stdin`.
+    '''
+
+    # Not an object name, so git echoes it back. Paths never contain it,
+    # control characters are quoted.
+    __END = '\x01'
+
+    def __init__(self, paths: Optional[List[str]] = None):
+        '''paths limit the diff like pathspecs of `git diff-tree`
+        '''
+
+        command = ['git', '-c', 'core.quotepath=off', 'diff-tree', '--stdin',
+                   '-r', '--always', '--name-only', '--no-renames']
+        if paths:
+            command += ['--'] + paths
+
+        super(DiffTree, self).__init__(command)
+
+    def changed_files(self, pairs: List[Tuple[str, str]]) -> List[List[str]]:
+        '''Get paths changed from commit a to commit b for each (a, b),
+        quoted like `git diff --name-only`.
+        '''
+
+        if len(pairs) == 0:
+            return []
+
+        lines = self.query_until(
+            '\n'.join('%s %s' % (b, a) for a, b in pairs), self.__END)
+
+        # Each answer starts with the line of b itself
+        result = []  # type: List[List[str]]
+        for line in lines:
+            if len(result) < len(pairs) and line == pairs[len(result)][1]:
+                result.append([])
+            elif len(result) > 0:
+                result[-1].append(line)
+
+        if len(result) != len(pairs):
+            raise ValueError('Could not diff %s' % ', '.join(
+                '%s..%s' % x for x in pairs[len(result):]))
+
+        return result
@@ -23,8 +23,34 @@ class Level(IntEnum):
 
 
 class Logger():
+    MASK = '********'
+    # Shorter values are masked only as whole words, not to mask unrelated
+    # text like digits in every line
+    SHORT_SECRET_LENGTH = 4
+
     def __init__(self, level: Optional[Level] = None):
         self.level = level
+        self.__secrets = set()
+        self.__secrets_pattern = None
+
+    def add_secret(self, value: str) -> None:
+        '''Print value masked from now on, a short value only where it is a
+        whole word
+        '''
+
+        if not value:
+            return
+
+        self.__secrets.add(value)
+        # As it appears in dumped JSON
+        self.__secrets.add(json_parser.dumps(value)[1:-1])
+        self.__secrets_pattern = None
+
+    def is_enabled(self, level: Level) -> bool:
+        '''Whether messages of level are printed
+        '''
+
+        return self.__should_print(level)
 
     def newline(self, level: Level = Level.INFO, file: TextIO = sys.stdout) -> None:
         if not self.__should_print(level):
@@ -97,6 +123,7 @@ class Logger():
         if type(json) in [dict, list]:
             formatted_json = json_parser.dumps(
                 json, sort_keys=True, indent=2, default=self.__json_serial)
+            formatted_json = self.__mask(formatted_json)
         else:
             return
 
@@ -112,7 +139,7 @@ class Logger():
             return
 
         colorful_diff = highlight(
-            diff,
+            self.__mask(diff),
             lexers.find_lexer_class('Diff')(),
             formatters.find_formatter_class('terminal')())
 
@@ -157,6 +184,24 @@ class Logger():
     def __should_print(self, level: Level):
         return self.level is not None and self.level <= level
 
+    def __mask(self, msg: str) -> str:
+        if not self.__secrets:
+            return msg
+
+        if self.__secrets_pattern is None:
+            # Longest first, a secret may contain another one
+            patterns = []
+            for secret in sorted(self.__secrets, key=len, reverse=True):
+                pattern = re.escape(secret)
+                if len(secret) < self.SHORT_SECRET_LENGTH:
+                    pattern = r'(?<!\w)' + pattern + r'(?!\w)'
+
+                patterns.append(pattern)
+
+            self.__secrets_pattern = re.compile('|'.join(patterns))
+
+        return self.__secrets_pattern.sub(lambda x: self.MASK, msg)
+
     def __print(
             self,
             msg: str,
@@ -165,6 +210,7 @@ class Logger():
             indent: Optional[str],
             margin_prefix: Optional[str]) -> None:
 
+        msg = self.__mask(str(msg))
         lines = msg.splitlines()
         indent = indent or ''
         if len(lines) == 1:
@@ -3,11 +3,18 @@
 # -*- coding: utf-8 -*-
 # vi: set ft=python :
 
+import os
 import re
 import json
+import time
+import functools
+import threading
+import collections
 
-from typing import List
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
 
+import yaml
 import difflib
 import docker
 
@@ -15,6 +22,10 @@ from deploy2ecscli import logger as log
 from deploy2ecscli.log import Level as LogLevel
 from deploy2ecscli.git import Git
 from deploy2ecscli.exceptions import TaskFailedException
+from deploy2ecscli.exceptions import UnresolvedVariableException
+from deploy2ecscli.exceptions import PreflightFailedException
+from deploy2ecscli.exceptions import ImageNotFoundException
+from deploy2ecscli.config import templates
 from deploy2ecscli.config import Application as ApplicationConfig
 from deploy2ecscli.config import Task as TaskConfig
 from deploy2ecscli.config import Image as ImageConfig
@@ -27,18 +38,228 @@ from deploy2ecscli.aws.models.ecs import TaskDefinition as EcsTaskDefinition
 from deploy2ecscli.aws.models.ecs import Service as EcsService
 
 
+class PreflightUseCase():
+    '''Validate the whole config before building or deploying anything.
+
+    Templates must exist, and image contexts and docker files when images
+    are built. Templates are rendered with placeholders of the values known
+    at deploy time when they are deployed, so an unresolved ${VAR} is found
+    before the first docker build.
+    '''
+
+    PLACEHOLDER_COMMIT = '0' * 40
+    PLACEHOLDER_TASK_DEFINITION_ARN = \
+        'arn:aws:ecs:us-east-1:000000000000:task-definition/{0}:1'
+
+    def __init__(self, config: ApplicationConfig, check_images: bool = True,
+                 render_templates: bool = True):
+        self.__config = config
+        self.__check_images = check_images
+        self.__render_templates = render_templates
+
+    def execute(self) -> None:
+        started_at = time.time()
+
+        problems = []
+        if self.__check_images:
+            problems += self.__find_images()
+
+        paths, template_problems = self.__compile_templates()
+        problems += template_problems
+        if self.__render_templates:
+            problems += self.__render(paths)
+
+        if len(problems) == 0:
+            msg = '  Preflight passed in {0:.2f}s'
+            log.verbose(msg.format(time.time() - started_at))
+            return
+
+        log.newline()
+        log.error('  Preflight failed, nothing is built or deployed.')
+        for problem in problems:
+            log.error('    - ' + problem)
+        log.newline()
+
+        raise PreflightFailedException(problems)
+
+    def __find_images(self) -> List[str]:
+        problems = []
+        for image in self.__config.images:
+            if image.promote_from is not None:
+                continue
+
+            if not os.path.isdir(image.context):
+                msg = 'Image `{0}`: context {1} is not found'
+                problems.append(msg.format(image.name, image.context))
+                continue
+
+            docker_file = os.path.join(image.context, image.docker_file)
+            if not os.path.isfile(docker_file):
+                msg = 'Image `{0}`: docker file {1} is not found'
+                problems.append(msg.format(image.name, docker_file))
+
+        return problems
+
+    def __compile_templates(self) -> Tuple[List[str], List[str]]:
+        '''Get (compiled paths, problems), templates are compiled once and
+        kept for the deployment
+        '''
+
+        paths = []
+        problems = []
+        for path in self.__config.templates:
+            try:
+                templates.get(path)
+                paths.append(path)
+            except OSError:
+                problems.append('Template {0} is not found'.format(path))
+            except yaml.YAMLError as e:
+                problems.append('Template {0}: {1}'.format(path, e))
+
+        return (paths, problems)
+
+    def __render(self, paths: List[str]) -> List[str]:
+        problems = []
+
+        # !SSM and !Secret of all templates in a call per tag
+        templates.prefetch(paths)
+
+        for config in self.__config.task_definitions:
+            if config.template not in paths:
+                continue
+
+            bind_variables = {'JSON_COMMIT_HASH': self.PLACEHOLDER_COMMIT}
+            for image in config.images:
+                bind_variables[image.bind_variable] = \
+                    image.tagged_uri(self.PLACEHOLDER_COMMIT)
+
+            problems += self.__check_template(
+                config.template,
+                lambda: EcsTaskDefinition(config.render(bind_variables)))
+
+        for config in self.__config.services:
+            tasks = config.before_deploy.tasks \
+                if config.before_deploy is not None else []
+            for task in tasks:
+                if task.template in paths:
+                    problems += self.__check_template(
+                        task.template, task.render_json)
+
+            if config.template not in paths:
+                continue
+
+            bind_variables = {
+                'TASK_DEFINITION_ARN':
+                    self.PLACEHOLDER_TASK_DEFINITION_ARN.format(
+                        config.task_family),
+                'JSON_COMMIT_HASH': self.PLACEHOLDER_COMMIT,
+            }
+
+            problems += self.__check_template(
+                config.template,
+                lambda: EcsService(config.render_json(bind_variables)))
+
+        return problems
+
+    def __check_template(self, path: str, render) -> List[str]:
+        try:
+            render()
+        except UnresolvedVariableException as e:
+            msg = 'Template {0}: ${{{1}}} is not resolved'
+            return [msg.format(path, e.name)]
+        except KeyError as e:
+            msg = 'Template {0}: {1} is missing'
+            return [msg.format(path, e)]
+        except (TypeError, ValueError, AttributeError) as e:
+            return ['Template {0}: {1}'.format(path, e)]
+
+        return []
+
+
+class PrepareRepositoryUseCase():
+    def __init__(self, config: ApplicationConfig, git_client: Git):
+        self.__config = config
+        self.__git = git_client
+
+    def execute(self) -> None:
+        msg = """
+        ################################################################################
+        ##
+        ##  Prepare Repository !!!
+        ##
+        ################################################################################"""
+        log.info(msg)
+
+        pathspecs = \
+            [(None, None)] + \
+            [(x.dependencies, x.excludes) for x in self.__config.images]
+
+        state = self.__commit_graph_state()
+        if state is None:
+            log.newline()
+            log.info('  Commit-graph is up to date.')
+            log.newline()
+            return
+
+        # Queries are timed only to show what writing the graph saves
+        before = self.__git.time_latest_objects(pathspecs)
+
+        log.newline()
+        log.info('  Writing commit-graph, because it is {0}...'.format(state))
+        self.__git.write_commit_graph()
+
+        after = self.__git.time_latest_objects(pathspecs)
+        msg = '  Git queries took {0:.2f}s before, {1:.2f}s after'
+        log.info(msg.format(before, after))
+        log.newline()
+
+    def __commit_graph_state(self) -> Optional[str]:
+        '''Get why the commit-graph should be written, None when it is fresh
+        '''
+
+        try:
+            graph = self.__git.commit_graph
+        except (ValueError, OSError) as e:
+            # Like a graph file of the chain which is gone
+            log.verbose('    %s' % e)
+            return 'unreadable'
+
+        if graph is None:
+            return 'missing'
+
+        try:
+            if not graph.changed_paths:
+                return 'missing changed paths'
+
+            if not graph.contains(self.__git.head_object):
+                return 'stale'
+        finally:
+            graph.close()
+
+        return None
+
+
 class BuildImageUseCase():
     def __init__(self, config: ApplicationConfig, aws_client: AwsClient,
                  git_client: Git, force_update: bool, dyr_run: bool,
-                 additional_tags: List[str]):
+                 additional_tags: List[str], fingerprint: bool = False,
+                 deepen_limit: int = 0, jobs: int = 1):
         self.__config = config
         self.__aws = aws_client
         self.__git = git_client
         self.__force_update = force_update
         self.__dyr_run = dyr_run
         self.__additional_tags = additional_tags or []
+        self.__fingerprint = fingerprint
+        self.__deepen_limit = deepen_limit
+        self.__jobs = max(jobs or 1, 1)
         self.__latest_object = None  # type: str
         self.__docker = None  # type: docker.DockerClient
+        self.__retagged_tags = []  # type: List[str]
+        # Docker API connections of workers, one each
+        self.__local = threading.local()
+        self.__docker_clients = []  # type: List[docker.DockerClient]
+        self.__lock = threading.Lock()
 
     def execute(self) -> None:
         msg = """
@@ -49,43 +270,77 @@ class BuildImageUseCase():
         ################################################################################"""
         log.info(msg)
 
+        self.__git.prefetch_latest_objects(
+            [(None, None)] +
+            [(x.dependencies, x.excludes) for x in self.__buildable_images()])
+
         self.__latest_object = self.__git.latest_object()
         self.__docker = docker.from_env()
-        self.__auth_config = self.__aws.ecr.authorization_token.get()
+        self.__local.docker = self.__docker
+        self.__images = self.__find_images()
 
-        builded_tags = []
         msg = """
         |  ==============================================================================
         |    Build Docker Image
         |  =============================================================================="""
         log.info(msg, margin_prefix='|')
-        for image in self.__config.images:
 
-            builded_tags += self.__build_image(image) or []
+        # Git and image collections are read in turn, docker runs in workers
+        images = self.__buildable_images()
+        jobs = [self.__build_image(x) for x in images]
+        try:
+            image_tags = self.__run_jobs(
+                [x or (lambda: []) for x in jobs])
+        finally:
+            self.__close_docker_clients()
+
+        builded_tags = []
+        pushed_repositories = []
+        for image, tags in zip(images, image_tags):
+            if tags:
+                pushed_repositories.append(image.repository_name)
+
+            builded_tags += tags
 
         if len(builded_tags) == 0:
             log.newline()
-            log.info('  Not yet modified.')
-            log.newline()
+            if len(self.__retagged_tags) == 0:
+                log.info('  Not yet modified.')
+                log.newline()
             return
 
-        self.__push_images(builded_tags)
+        self.__push_images([x for x in image_tags if x])
+        if not self.__dyr_run:
+            # Listed images do not have the pushed tags
+            for name in collections.OrderedDict.fromkeys(pushed_repositories):
+                self.__aws.ecr.repositories.invalidate(name)
 
         log.newline()
 
-    def __build_image(self, config: ImageConfig) -> List[str]:
+    def __build_image(self, config: ImageConfig) -> Optional[Callable[[], List[str]]]:
+        '''Decide whether the image is built or tagged, get the job doing
+        it, None when there is nothing to do
+        '''
+
         latest_dependency_commit = \
             self.__git.latest_object(
                 config.dependencies,
                 config.excludes)
 
+        fingerprint = None
+        if self.__fingerprint:
+            fingerprint = \
+                self.__git.tree_fingerprint(
+                    config.dependencies,
+                    config.excludes)
+
         if self.__force_update:
             msg = '    Will do a force build {0}'
             log.newline()
             log.warn(msg.format(config.repository_name))
             log.newline()
         else:
-            images = self.__aws.ecr.repositories[config.repository_name].images
+            images = self.__images[config.repository_name]
 
         builded_at = None
         if not self.__force_update:
@@ -93,14 +348,32 @@ class BuildImageUseCase():
                 config,
                 images,
                 self.__latest_object,
-                latest_dependency_commit)
+                latest_dependency_commit,
+                fingerprint)
+
+            # Shallow history may have been deepened meanwhile
+            latest_dependency_commit = \
+                self.__git.latest_object(
+                    config.dependencies,
+                    config.excludes)
+
+        required_tags = self.__additional_tags
+        if self.__fingerprint:
+            required_tags = \
+                [latest_dependency_commit, fingerprint] + required_tags
 
         should_build = \
             self.__force_update or builded_at is None
 
         if not should_build:
-            return self.__taging_latest_dependency(config, images, builded_at)
+            return self.__taging_latest_dependency(
+                config, images, builded_at, required_tags)
+
+        return functools.partial(
+            self.__docker_build, config, latest_dependency_commit, fingerprint)
 
+    def __docker_build(self, config: ImageConfig, latest_dependency_commit: str,
+                       fingerprint: Optional[str]) -> List[str]:
         log.newline(level=LogLevel.VERBOSE)
         log.newline(level=LogLevel.VERBOSE)
         log.debug('    %s building...' % config.repository_name)
@@ -111,9 +384,12 @@ class BuildImageUseCase():
             config.tagged_uri(latest_dependency_commit)
         additional_tags = \
             [config.tagged_uri(x) for x in self.__additional_tags]
+        if fingerprint is not None:
+            additional_tags.insert(0, config.tagged_uri(fingerprint))
+
         tags = [image_uri_latest, image_uri] + additional_tags
         if not self.__dyr_run:
-            image, output = self.__docker.images.build(
+            image, output = self.__docker_client().images.build(
                 path=config.context,
                 dockerfile=config.docker_file,
                 tag=image_uri_latest,
@@ -121,8 +397,10 @@ class BuildImageUseCase():
                 buildargs=config.buildargs)
 
             output = [x for x in output if (x.get('stream') or '').strip()]
-            for line in output:
-                log.verbose(line['stream'].strip())
+            # Outputs of concurrent builds are not mixed
+            with self.__lock:
+                for line in output:
+                    log.verbose(line['stream'].strip())
 
             for tag in tags[1:]:
                 image.tag(tag)
@@ -133,47 +411,170 @@ class BuildImageUseCase():
 
         return tags
 
-    def __taging_latest_dependency(self, config, images, builded_at) -> None:
-        untagged_tags = self.__untagged_tags(images, builded_at)
-        if len(untagged_tags) == 0:
-            return
+    def __buildable_images(self) -> List[ImageConfig]:
+        # Promoted images are copied by PromoteImageUseCase
+        return [x for x in self.__config.images if x.promote_from is None]
 
-        additional_tags = \
-            [config.tagged_uri(x) for x in untagged_tags or []]
+    def __find_images(self) -> Dict[str, ImageCollection]:
+        '''Ask ECR only about the tags a build decision needs, all
+        repositories at once
+        '''
+
+        if self.__force_update:
+            return {}
+
+        tags = collections.OrderedDict()  # type: Dict[str, List[str]]
+        for config in self.__buildable_images():
+            wanted = tags.setdefault(config.repository_name, [])
+            if self.__fingerprint:
+                wanted.append(
+                    self.__git.tree_fingerprint(
+                        config.dependencies,
+                        config.excludes))
+
+            wanted.append(
+                self.__git.latest_object(
+                    config.dependencies,
+                    config.excludes))
+            wanted += ['latest'] + self.__additional_tags
+
+        return self.__aws.ecr.repositories.find_images(tags)
+
+    def __taging_latest_dependency(
+            self, config, images, builded_at,
+            required_tags: List[str]) -> Optional[Callable[[], List[str]]]:
+        untagged_tags = \
+            self.__untagged_tags(images, builded_at, required_tags)
+        if len(untagged_tags) == 0:
+            return None
 
         log.info('      There is a tag that is not tagged in latest image.')
         for tag in untagged_tags:
             log.info('        {0}:{1}'.format(config.repository_name, tag))
 
+        return functools.partial(
+            self.__tag_image, config, builded_at, untagged_tags)
+
+    def __tag_image(self, config: ImageConfig, builded_at: str,
+                    untagged_tags: List[str]) -> List[str]:
+        additional_tags = \
+            [config.tagged_uri(x) for x in untagged_tags]
+
+        if self.__dyr_run:
+            with self.__lock:
+                self.__retagged_tags += additional_tags
+            return []
+
+        # Only the manifest is written, no layer is pulled nor pushed
+        log.debug('    %s tagging on ECR...' % config.repository_name)
+        tagged = self.__aws.ecr.repositories.put_tags(
+            config.repository_name, builded_at, untagged_tags)
+        if tagged is not None:
+            # Retagged by concurrent workers
+            with self.__lock:
+                self.__retagged_tags += additional_tags
+            return []
+
         log.debug('    %s pulling...' % config.repository_name)
         image_uri = \
             config.tagged_uri(builded_at)
-        latest = self.__docker.images.pull(
+        latest = self.__docker_client().images.pull(
             image_uri,
-            auth_config=self.__auth_config)
-        if not self.__dyr_run:
-            for tag in additional_tags:
-                latest.tag(tag)
+            auth_config=self.__auth_config(image_uri))
+        for tag in additional_tags:
+            latest.tag(tag)
 
         return additional_tags
 
-    def __push_images(self, tags: List[str]) -> None:
+    def __push_images(self, image_tags: List[List[str]]) -> None:
         msg = """
         |  ==============================================================================
         |    Push Docker Image
         |  =============================================================================="""
         log.info(msg, margin_prefix='|')
-        for tag in tags:
-            log.debug('    %s uploading...' % tag)
-            if not self.__dyr_run:
-                self.__docker.images.push(tag, auth_config=self.__auth_config)
+
+        def push(tags: List[str]) -> List[str]:
+            for tag in tags:
+                log.debug('    %s uploading...' % tag)
+                if not self.__dyr_run:
+                    self.__docker_client().images.push(
+                        tag, auth_config=self.__auth_config(tag))
+
+            return tags
+
+        # Images are pushed once all of them are built
+        try:
+            self.__run_jobs([functools.partial(push, x) for x in image_tags])
+        finally:
+            self.__close_docker_clients()
 
         log.newline(level=LogLevel.VERBOSE)
         log.newline(level=LogLevel.VERBOSE)
         log.newline(level=LogLevel.VERBOSE)
 
+    def __run_jobs(self, jobs: List[Callable[[], List[str]]]) -> List[List[str]]:
+        '''Run jobs in a pool of --jobs workers, results are in order of
+        jobs.
+
+        When a job fails, jobs not started yet are cancelled and the error
+        is raised once running jobs finish.
+        '''
+
+        if self.__jobs <= 1 or len(jobs) <= 1:
+            return [x() for x in jobs]
+
+        with ThreadPoolExecutor(max_workers=min(self.__jobs, len(jobs))) as executor:
+            futures = [executor.submit(x) for x in jobs]
+            _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+
+        cancelled = [x for x in futures if x.cancelled()]
+        errors = [x.exception() for x in futures
+                  if not x.cancelled() and x.exception() is not None]
+        if len(errors) != 0:
+            if len(cancelled) != 0:
+                msg = '    {0} job(s) cancelled, because a job failed.'
+                log.warn(msg.format(len(cancelled)))
+
+            raise errors[0]
+
+        return [x.result() for x in futures]
+
+    def __docker_client(self) -> docker.DockerClient:
+        # A connection is not shared between workers
+        client = getattr(self.__local, 'docker', None)
+        if client is None:
+            client = docker.from_env()
+            self.__local.docker = client
+            with self.__lock:
+                self.__docker_clients.append(client)
+
+        return client
+
+    def __close_docker_clients(self) -> None:
+        # Workers have exited, their connections are not used anymore
+        with self.__lock:
+            clients, self.__docker_clients = self.__docker_clients, []
+
+        for client in clients:
+            client.close()
+
+    def __auth_config(self, image_uri: str) -> dict:
+        # Fetched on first use, kept by the client until it expires
+        registry = image_uri.split('/')[0]
+        return self.__aws.ecr.authorization_token.get(registry)
+
     def __get_builded_at(self, config: ImageConfig, images: ImageCollection,
-                         current_commit: str, latest_dependency_commit: str) -> bool:
+                         current_commit: str, latest_dependency_commit: str,
+                         fingerprint: str = None) -> bool:
+        if fingerprint is not None and \
+                images.find_by_tag(fingerprint) is not None:
+            msg = '    {0} is already builded. ({1})'
+            log.newline()
+            log.info(msg.format(config.repository_name, fingerprint))
+            return fingerprint
+
         if images.find_by_tag(latest_dependency_commit) is not None:
             msg = '    {0} is already builded. ({1})'
             log.newline()
@@ -198,18 +599,17 @@ class BuildImageUseCase():
             log.warn(msg.format(config.repository_name))
             return None
 
-        try:
-            self.__git.latest_log(latest_image_commit)
-        except:
+        if not self.__is_reachable(config, latest_image_commit):
             log.newline()
             msg = '    Will do a force update {0}, because could not find the latest commit ({1}).'
             log.warn(msg.format(config.repository_name, latest_image_commit))
             return None
 
-        modified_files = \
-            self.__git.diff_files(
+        modified_files, patch = \
+            self.__git.diff(
                 latest_image_commit, current_commit,
-                config.dependencies, config.excludes)
+                config.dependencies, config.excludes,
+                patch=log.is_enabled(LogLevel.VERBOSE))
         should_build = len(modified_files) != 0
         if should_build:
             msg = """
@@ -233,14 +633,8 @@ class BuildImageUseCase():
                 log.info('        => %s' % file)
             log.newline()
 
-            try:
-                self.__git.print_diff(
-                    latest_image_commit,
-                    current_commit,
-                    config.dependencies,
-                    config.excludes)
-            except:
-                pass
+            if patch:
+                log.dump_diff(patch, level=LogLevel.VERBOSE)
 
             return None
 
@@ -266,16 +660,102 @@ class BuildImageUseCase():
 
         return latest_image_commit
 
-    def __untagged_tags(self, images: ImageCollection, builded_at: str) -> List[str]:
+    def __is_reachable(self, config: ImageConfig, commit: str) -> bool:
+        try:
+            self.__git.latest_log(commit)
+            return True
+        except:
+            pass
+
+        if self.__deepen_limit <= 0 or not self.__git.is_shallow:
+            return False
+
+        msg = '    {0} deepening shallow history to find {1}...'
+        log.debug(msg.format(config.repository_name, commit))
+        if not self.__git.deepen(commit, self.__deepen_limit):
+            return False
+
+        try:
+            self.__git.latest_log(commit)
+            return True
+        except:
+            return False
+
+    def __untagged_tags(self, images: ImageCollection, builded_at: str,
+                        required_tags: List[str]) -> List[str]:
         image = images.find_by_tag(builded_at)  # Always not None
-        latest_images = images.digest_is(image.digest)
-        tagged_tags = [x.tag for x in latest_images]
-        untagged_tags = self.__additional_tags
-        untagged_tags = [x for x in untagged_tags if x not in tagged_tags]
+
+        # Looking up only the required tags stops listing images early
+        untagged_tags = []
+        for tag in required_tags:
+            tagged_image = images.find_by_tag(tag)
+            if tagged_image is None or tagged_image.digest != image.digest:
+                untagged_tags.append(tag)
 
         return untagged_tags
 
 
+class PromoteImageUseCase():
+    '''Copy images of the dependency commit from the repositories of
+    `promote_from` to the repositories of the images, through ECR.
+
+    Usage:
+        PromoteImageUseCase(config, aws_client, git_client, False, []).execute()
+    '''
+
+    def __init__(self, config: ApplicationConfig, aws_client: AwsClient,
+                 git_client: Git, dyr_run: bool, additional_tags: List[str]):
+        self.__config = config
+        self.__aws = aws_client
+        self.__git = git_client
+        self.__dyr_run = dyr_run
+        self.__additional_tags = additional_tags or []
+
+    def execute(self) -> None:
+        images = [x for x in self.__config.images if x.promote_from is not None]
+        if len(images) == 0:
+            return
+
+        msg = """
+        ################################################################################
+        ##
+        ##  Promote Images !!!
+        ##
+        ################################################################################"""
+        log.info(msg)
+
+        self.__git.prefetch_latest_objects(
+            [(x.dependencies, x.excludes) for x in images])
+
+        copies = []
+        for image in images:
+            commit = self.__git.latest_object(image.dependencies, image.excludes)
+            tags = [commit, 'latest'] + self.__additional_tags
+            copies.append((image.promote_from, commit, image.repository_uri, tags))
+
+            msg = '    {0}:{1} => {2}'
+            log.info(msg.format(image.promote_from, commit, image.repository_uri))
+
+        digests = self.__aws.ecr.transfer.copy_all(copies)
+
+        missing = [x for x, y in zip(copies, digests) if y is None]
+        if not self.__dyr_run:
+            # Listed images do not have the copied tags
+            for image, digest in zip(images, digests):
+                if digest is not None:
+                    self.__aws.ecr.repositories.invalidate(image.repository_name)
+
+        log.newline()
+        log.verbose(self.__aws.ecr.transfer.summary())
+
+        for source_uri, commit, _, _ in missing:
+            log.error('    {0}:{1} is not found'.format(source_uri, commit))
+
+        if len(missing) != 0:
+            source_uri, commit, _, _ = missing[0]
+            raise ImageNotFoundException('{0}:{1}'.format(source_uri, commit))
+
+
 class RegisterTaskDefinitionUseCase():
     def __init__(self, config: ApplicationConfig, aws_client: AwsClient, git_client: Git, force_update: bool):
         self.__config = config
@@ -291,6 +771,15 @@ class RegisterTaskDefinitionUseCase():
         ##
         ################################################################################"""
         log.info(msg)
+
+        pathspecs = [(None, None)]
+        for task_definition in self.__config.task_definitions:
+            pathspecs.append((task_definition.template, None))
+            pathspecs += [(x.dependencies, x.excludes)
+                          for x in task_definition.images]
+
+        self.__git.prefetch_latest_objects(pathspecs)
+
         for task_definition in self.__config.task_definitions:
             self.__register_task_definition(task_definition)
 
@@ -436,6 +925,10 @@ class RegisterServiceUseCase():
         ################################################################################"""
         log.info(msg)
 
+        self.__git.prefetch_latest_objects(
+            [(None, None)] +
+            [(x.template, None) for x in self.__config.services])
+
         for service_config in self.__config.services:
             msg = """
             |  ==============================================================================
@@ -6,26 +6,127 @@
 import yaml
 import os
 import re
+import json
+import threading
+import collections
+
+from typing import Any, Callable, Dict, Iterable, List, Set, TextIO, Tuple, Union
+
+from deploy2ecscli.exceptions import UnresolvedVariableException
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+SUB_PATTERN = re.compile(r'\$\{ *([a-zA-Z0-9_]+ *)\}')
+
+# Tags whose values are kept in AWS
+REMOTE_TAGS = ['!SSM', '!Secret']
+
+
+class Resolver:
+    '''Values of !SSM and !Secret tags, kept for the run.
+
+    References are fetched in batches by the fetcher of their tag. Fetchers
+    mask secret values in logs.
+
+    Usage:
+        Resolver.default = Resolver({'!SSM': ssm.parameters.get_all})
+        Resolver.default.prefetch([('!SSM', '/app/token')])
+        Resolver.default.get('!SSM', '/app/token')
+    '''
+
+    default = None  # type: Resolver
+
+    def __init__(self, fetchers: Dict[str, Callable[[List[str]], Dict[str, str]]]):
+        self.__fetchers = fetchers
+        self.__values = {}  # type: Dict[Tuple[str, str], str]
+        self.__lock = threading.Lock()
+
+    def prefetch(self, references: Iterable[Tuple[str, str]]) -> None:
+        '''Fetch references which are not fetched yet, one batch call per
+        fetcher
+        '''
+
+        with self.__lock:
+            missing = {}  # type: Dict[str, Set[str]]
+            for tag, name in references:
+                if (tag, name) not in self.__values:
+                    missing.setdefault(tag, set()).add(name)
+
+            for tag, names in sorted(missing.items()):
+                for name, value in self.__fetchers[tag](sorted(names)).items():
+                    self.__values[(tag, name)] = value
+
+    def get(self, tag: str, name: str) -> str:
+        if (tag, name) not in self.__values:
+            self.prefetch([(tag, name)])
+
+        return self.__values[(tag, name)]
+
+
+def resolve_remote(tag: str, name: str) -> str:
+    if Resolver.default is None:
+        raise ValueError('%s %s can not be resolved here' % (tag, name))
+
+    return Resolver.default.get(tag, name)
+
+
+def find_remote_references(node: yaml.Node) -> Set[Tuple[str, str]]:
+    '''Get (tag, name) of !SSM and !Secret under a node, without
+    constructing it
+    '''
+
+    references = set()
+    nodes = [node]
+    seen = set()
+    while nodes:
+        node = nodes.pop()
+        if id(node) in seen:
+            continue
+
+        seen.add(id(node))
+        if node.tag in REMOTE_TAGS and isinstance(node, yaml.ScalarNode):
+            references.add((node.tag, node.value))
+        elif isinstance(node, yaml.SequenceNode):
+            nodes += node.value
+        elif isinstance(node, yaml.MappingNode):
+            for key, value in node.value:
+                nodes += [key, value]
+
+    return references
 
 
 def setup_loader(params: dict = None):
-    class Loader(yaml.SafeLoader):
-        pass
+    class Loader(SafeLoader):
+        # Names looked up by !Ref and !Sub, what the result depends on
+        references = set()
+        remote_references = set()
 
     def get_value(key):
+        Loader.references.add(key)
         return (params or {}).get(key, os.environ.get(key, None))
 
     def sub(loader, node):
         text = loader.construct_scalar(node)
-        pattern = re.compile(r'\$\{ *([a-zA-Z0-9_]+ *)\}')
-        for x in pattern.finditer(text):
+        for x in SUB_PATTERN.finditer(text):
             value = get_value(x.group(1))
+            if value is None:
+                raise UnresolvedVariableException(x.group(1).strip())
+
             text = text.replace(x.group(0), value)
         return text
 
     def ref(loader, node):
         return get_value(loader.construct_scalar(node))
 
+    def remote(loader, node):
+        name = loader.construct_scalar(node)
+        Loader.remote_references.add((node.tag, name))
+        return resolve_remote(node.tag, name)
+
     def split(loader, node):
         values = loader.construct_sequence(node)
         text = values[1] or ''
@@ -39,5 +140,295 @@ def setup_loader(params: dict = None):
     Loader.add_constructor('!Split', split)
     Loader.add_constructor('!Sub', sub)
     Loader.add_constructor('!Join', join)
+    for tag in REMOTE_TAGS:
+        Loader.add_constructor(tag, remote)
 
     return Loader
+
+
+class SectionReader:
+    '''Read a document whose top level is a mapping of sections, and
+    construct a section only when it is asked for.
+
+    Tags of other sections are never resolved, so they neither cost time
+    nor fail on environment variables they refer to. !SSM and !Secret of a
+    section are fetched together before it is constructed.
+
+    Usage:
+        reader = SectionReader(open('deploy2ecs.yml'))
+        reader.keys
+        reader.section('master')
+    '''
+
+    def __init__(self, stream, params: dict = None):
+        self.__loader_class = setup_loader(params)
+        self.__loader = self.__loader_class(stream)
+        self.__sections = collections.OrderedDict()
+        try:
+            root = self.__loader.get_single_node()
+        finally:
+            self.__loader.dispose()
+
+        if root is None:
+            return
+
+        if not isinstance(root, yaml.MappingNode):
+            raise yaml.constructor.ConstructorError(
+                None, None,
+                'expected a mapping of sections, but found %s' % root.id,
+                root.start_mark)
+
+        for key, value in root.value:
+            self.__sections[self.__loader.construct_object(key)] = value
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self.__sections)
+
+    @property
+    def references(self) -> Set[str]:
+        '''Names looked up by !Ref and !Sub of constructed sections
+        '''
+
+        return set(self.__loader_class.references)
+
+    @property
+    def remote_references(self) -> Set[Tuple[str, str]]:
+        '''(tag, name) of !SSM and !Secret of constructed sections
+        '''
+
+        return set(self.__loader_class.remote_references)
+
+    def node(self, key: str) -> yaml.Node:
+        return self.__sections[key]
+
+    def compile(self, key: str) -> 'Template':
+        '''Get a section as a Template, nothing is resolved until it is
+        rendered
+        '''
+
+        return Template(self.__sections[key])
+
+    def section(self, key: str):
+        node = self.__sections[key]
+        references = find_remote_references(node)
+        if references and Resolver.default is not None:
+            Resolver.default.prefetch(references)
+
+        return self.__loader.construct_object(node, deep=True)
+
+
+class Expression:
+    '''A value of a compiled template which depends on bind variables.
+
+    Only the tag and its arguments are kept, a compiled document can be
+    pickled to worker processes and dumped as JSON.
+    '''
+
+    def __init__(self, tag: str, *arguments):
+        self.tag = tag
+        self.arguments = arguments
+
+    def render(self, get_value: Callable[[str], Any]) -> Any:
+        arguments = [render(x, get_value) for x in self.arguments]
+        return EXPRESSIONS[self.tag](get_value, *arguments)
+
+
+def _sub(get_value, parts: List[str]) -> str:
+    # Literals at even, names at odd positions
+    values = [x if i % 2 == 0 else get_value(x) for i, x in enumerate(parts)]
+    if None in values:
+        name = parts[values.index(None)]
+        raise UnresolvedVariableException(name.strip())
+
+    return ''.join(values)
+
+
+def _split(get_value, values: list) -> List[str]:
+    text = values[1] or ''
+    return [x.strip() for x in text.split(values[0])]
+
+
+EXPRESSIONS = {
+    '!Ref': lambda get_value, key: get_value(key),
+    '!Sub': _sub,
+    '!Split': _split,
+    '!Join': lambda get_value, values: values[0].join(values[1]),
+    '!SSM': lambda get_value, name: resolve_remote('!SSM', name),
+    '!Secret': lambda get_value, name: resolve_remote('!Secret', name),
+}  # type: Dict[str, Callable[..., Any]]
+
+
+def render(value, get_value: Callable[[str], Any]):
+    '''Get a copy of a compiled value with expressions evaluated
+    '''
+
+    if isinstance(value, Expression):
+        return value.render(get_value)
+
+    if isinstance(value, dict):
+        return dict((render(k, get_value), render(v, get_value))
+                    for k, v in value.items())
+
+    if isinstance(value, list):
+        return [render(x, get_value) for x in value]
+
+    if isinstance(value, set):
+        return set(render(x, get_value) for x in value)
+
+    return value
+
+
+def _dump(value):
+    '''Get a compiled value as a value which JSON can encode. Mappings,
+    sets and expressions are tagged, so they are told from each other
+    '''
+
+    if isinstance(value, Expression):
+        arguments = [_dump(x) for x in value.arguments]
+        return {'expression': [value.tag] + arguments}
+
+    if isinstance(value, dict):
+        return {'mapping': [[_dump(k), _dump(v)] for k, v in value.items()]}
+
+    if isinstance(value, set):
+        return {'set': [_dump(x) for x in value]}
+
+    if isinstance(value, list):
+        return [_dump(x) for x in value]
+
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+
+    raise TypeError('%s can not be dumped' % type(value).__name__)
+
+
+def _load(value):
+    '''Get a compiled value from the value of dump
+    '''
+
+    if isinstance(value, list):
+        return [_load(x) for x in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    (tag, values), = value.items()
+    if tag == 'expression':
+        return Expression(values[0], *[_load(x) for x in values[1:]])
+
+    if tag == 'mapping':
+        return dict((_load(k), _load(v)) for k, v in values)
+
+    if tag == 'set':
+        return set(_load(x) for x in values)
+
+    raise ValueError('unknown tag %s' % tag)
+
+
+class Template:
+    '''A YAML template parsed once, rendered with any bind variables.
+
+    !Ref, !Sub, !Split, !Join, !SSM and !Secret are compiled into
+    expressions, rendering evaluates them without parsing the document
+    again. JSON documents, which can not have tags, are parsed by the json
+    module. A node, like a section of SectionReader, can be compiled too.
+
+    Usage:
+        template = Template(open('task_definition.yml'))
+        template.render({'TASK_FAMILY': 'app'})
+        Template.load(template.dump()).render({'TASK_FAMILY': 'app'})
+    '''
+
+    def __init__(
+            self,
+            stream: Union[str, TextIO, yaml.Node],
+            is_json: bool = False):
+        # (tag, name) of !SSM and !Secret
+        self.remote_references = set()  # type: Set[Tuple[str, str]]
+
+        if is_json:
+            content = stream if isinstance(stream, str) else stream.read()
+            try:
+                self.document = json.loads(content)
+                return
+            except ValueError:
+                # YAML in a .json file
+                stream = content
+
+        class Loader(SafeLoader):
+            pass
+
+        Loader.add_constructor('!Ref', self.__ref)
+        Loader.add_constructor('!Sub', self.__sub)
+        Loader.add_constructor('!Split', self.__split)
+        Loader.add_constructor('!Join', self.__join)
+        for tag in REMOTE_TAGS:
+            Loader.add_constructor(tag, self.__remote)
+
+        if not isinstance(stream, yaml.Node):
+            self.document = yaml.load(stream, Loader=Loader)
+            return
+
+        loader = Loader('')
+        try:
+            self.document = loader.construct_document(stream)
+        finally:
+            loader.dispose()
+
+    def dump(self) -> dict:
+        '''Get the compiled template as a value which JSON can encode, to be
+        kept in a cache without pickle
+        '''
+
+        references = sorted(list(x) for x in self.remote_references)
+        return {'document': _dump(self.document), 'remote_references': references}
+
+    @classmethod
+    def load(cls, value: dict) -> 'Template':
+        '''Get a template from the value of dump, without parsing it again
+        '''
+
+        template = cls.__new__(cls)
+        template.document = _load(value['document'])
+        template.remote_references = set(
+            tuple(x) for x in value['remote_references'])
+
+        return template
+
+    def render(self, params: dict = None):
+        if self.remote_references and Resolver.default is not None:
+            Resolver.default.prefetch(self.remote_references)
+
+        def get_value(key):
+            return (params or {}).get(key, os.environ.get(key, None))
+
+        return render(self.document, get_value)
+
+    def __remote(self, loader, node) -> Expression:
+        tag, name = node.tag, loader.construct_scalar(node)
+        self.remote_references.add((tag, name))
+
+        return Expression(tag, name)
+
+    @classmethod
+    def __ref(cls, loader, node) -> Expression:
+        return Expression('!Ref', loader.construct_scalar(node))
+
+    @classmethod
+    def __sub(cls, loader, node) -> Union[str, Expression]:
+        text = loader.construct_scalar(node)
+
+        parts = SUB_PATTERN.split(text)
+        if len(parts) == 1:
+            return text
+
+        return Expression('!Sub', parts)
+
+    @classmethod
+    def __split(cls, loader, node) -> Expression:
+        return Expression('!Split', loader.construct_sequence(node, deep=True))
+
+    @classmethod
+    def __join(cls, loader, node) -> Expression:
+        return Expression('!Join', loader.construct_sequence(node, deep=True))
@@ -1,5 +1,7 @@
 import mimesis
 
+from unittest.mock import MagicMock
+
 
 def ecr_image(tag='', digest=''):
     if tag == '':
@@ -14,6 +16,41 @@ def ecr_image(tag='', digest=''):
     }
 
 
+def ecr_client(**attrs) -> MagicMock:
+    '''An ECR client whose batch_get_image and describe_images answer
+    from the images of list_images.return_value, put_image succeeds
+    '''
+
+    client = MagicMock(**attrs)
+    image_ids = client.list_images.return_value['imageIds']
+
+    def batch_get_image(repositoryName, imageIds, acceptedMediaTypes=None):
+        tags = [x['imageTag'] for x in imageIds]
+        return {
+            'images': [{'imageId': x, 'imageManifest': '{}'} for x in image_ids
+                       if x.get('imageTag') in tags],
+            'failures': [],
+        }
+
+    def describe_images(repositoryName, imageIds):
+        digests = [x['imageDigest'] for x in imageIds]
+        return {
+            'imageDetails': [
+                {
+                    'imageDigest': digest,
+                    'imageTags': [x['imageTag'] for x in image_ids
+                                  if x['imageDigest'] == digest],
+                }
+                for digest in digests
+            ]
+        }
+
+    client.batch_get_image.side_effect = batch_get_image
+    client.describe_images.side_effect = describe_images
+
+    return client
+
+
 def authorization_token():
     return {
         'username': mimesis.Person().username(),
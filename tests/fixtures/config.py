@@ -1,13 +1,14 @@
 from tests.fixtures import config_params as params_fixtures
 
 
-def image(excludes=[], buildargs=None):
+def image(excludes=[], buildargs=None, promote_from=None):
     from deploy2ecscli.config import Image
     return Image(
         **params_fixtures.image(
             excludes=excludes,
             buildargs=buildargs,
-            exclude_repository_name=True))
+            exclude_repository_name=True,
+            promote_from=promote_from))
 
 
 def task_definition():
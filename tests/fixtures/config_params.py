@@ -27,7 +27,7 @@ def task():
     }
 
 
-def image(context=None, excludes=[], buildargs=None, exclude_repository_name: bool = False) -> dict:
+def image(context=None, excludes=[], buildargs=None, exclude_repository_name: bool = False, promote_from=None) -> dict:
     repository_name = mimesis.Person().username()
     context = context or mimesis.Path().project_dir()
     context = context.replace('\\', '/')
@@ -40,7 +40,8 @@ def image(context=None, excludes=[], buildargs=None, exclude_repository_name: bo
         'docker_file': context + mimesis.File().file_name(),
         'dependencies': [mimesis.File().file_name() for x in range(10)],
         'excludes': excludes,
-        'buildargs': buildargs
+        'buildargs': buildargs,
+        'promote_from': promote_from
     }
 
     if exclude_repository_name:
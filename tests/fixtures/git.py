@@ -0,0 +1,11 @@
+from unittest.mock import MagicMock
+
+
+def unsupported_process(*args, **kwargs):
+    '''Stand-in for `subprocess.Popen` which makes git fall back to `subprocess.run`
+    '''
+
+    return MagicMock(
+        stdout=[],
+        returncode=1,
+        communicate=MagicMock(return_value=(b'', b'unsupported')))
@@ -13,7 +13,11 @@ import mimesis
 
 from deploy2ecscli.app import App
 
+from tests.fixtures import aws as aws_fixtures
+from tests.fixtures import git as git_fixtures
 
+
+@mock.patch('subprocess.Popen', new=git_fixtures.unsupported_process)
 class TestBuildImage(unittest.TestCase):
     DEFAULT_YAML = """
         integration:
@@ -35,6 +39,17 @@ class TestBuildImage(unittest.TestCase):
                         -   config/deploy.yml
         """
 
+    def setUp(self):
+        # Preflight checks the image context and the docker file
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+
+        os.makedirs('project_dir')
+        with open('project_dir/Dockerfile', 'w') as f:
+            f.write('FROM scratch')
+
     def __build_mock_docker(self, stack: ExitStack):
         mock_docker = stack.enter_context(mock.patch('docker.from_env'))
         mock_docker.return_value.images.build.return_value = (
@@ -85,13 +100,15 @@ class TestBuildImage(unittest.TestCase):
         """Should build and push to ECR
         """
 
-        def subprocer_run(command: str, **kwargs):
+        def subprocer_run(command: list, **kwargs):
+            command = ' '.join(command)
             result = self.__default_subprocer_run(command)
             if result is not None:
                 return result
 
             if command.startswith('git --no-pager diff --name-only'):
-                stdout = [mimesis.File().file_name() for x in range(10)]
+                stdout = ['app/' + mimesis.File().file_name()
+                          for x in range(10)]
                 stdout = '\r\n'.join(stdout)
                 return MagicMock(returncode=0, stdout=stdout.encode('utf8'))
 
@@ -189,7 +206,7 @@ class TestBuildImage(unittest.TestCase):
                 }
             }
 
-            mock_ecr = MagicMock(**mock_attrs)
+            mock_ecr = aws_fixtures.ecr_client(**mock_attrs)
             return mock_ecr
 
         with ExitStack() as stack:
@@ -235,7 +252,8 @@ class TestBuildImage(unittest.TestCase):
         """Should build and push to ECR
         """
 
-        def subprocer_run(command: str, **kwargs):
+        def subprocer_run(command: list, **kwargs):
+            command = ' '.join(command)
             result = self.__default_subprocer_run(command)
             if result is not None:
                 return result
@@ -252,7 +270,7 @@ class TestBuildImage(unittest.TestCase):
                 }
             }
 
-            mock_ecr = MagicMock(**mock_attrs)
+            mock_ecr = aws_fixtures.ecr_client(**mock_attrs)
             return mock_ecr
 
         with ExitStack() as stack:
@@ -300,7 +318,8 @@ class TestBuildImage(unittest.TestCase):
 
         commit_hash = mimesis.Cryptographic().token_hex()
 
-        def subprocer_run(command: str, **kwargs):
+        def subprocer_run(command: list, **kwargs):
+            command = ' '.join(command)
 
             if command.startswith('git --no-pager log -n 1 --pretty=oneline'):
                 stdout = '{0} {1}'
@@ -339,7 +358,7 @@ class TestBuildImage(unittest.TestCase):
                 }
             }
 
-            mock_ecr = MagicMock(**mock_attrs)
+            mock_ecr = aws_fixtures.ecr_client(**mock_attrs)
             return mock_ecr
 
         with ExitStack() as stack:
@@ -380,7 +399,8 @@ class TestBuildImage(unittest.TestCase):
         """Should build and push to ECR
         """
 
-        def subprocer_run(command: str, **kwargs):
+        def subprocer_run(command: list, **kwargs):
+            command = ' '.join(command)
             result = self.__default_subprocer_run(command)
             if result is not None:
                 return result
@@ -410,7 +430,7 @@ class TestBuildImage(unittest.TestCase):
                 }
             }
 
-            mock_ecr = MagicMock(**mock_attrs)
+            mock_ecr = aws_fixtures.ecr_client(**mock_attrs)
             return mock_ecr
 
         with ExitStack() as stack:
@@ -448,10 +468,11 @@ class TestBuildImage(unittest.TestCase):
             mock_docker.images.push.assert_not_called()
 
     def test_when_dependency_not_updated_and_missing_tags(self):
-        """Should build and push to ECR
+        """Should tag on ECR without pulling and pushing
         """
 
-        def subprocer_run(command: str, **kwargs):
+        def subprocer_run(command: list, **kwargs):
+            command = ' '.join(command)
             result = self.__default_subprocer_run(command)
             if result is not None:
                 return result
@@ -481,14 +502,15 @@ class TestBuildImage(unittest.TestCase):
                 }
             }
 
-            mock_ecr = MagicMock(**mock_attrs)
+            mock_ecr = aws_fixtures.ecr_client(**mock_attrs)
             return mock_ecr
 
         with ExitStack() as stack:
             mock_docker = self.__build_mock_docker(stack)
 
+            mock_ecr = build_mock_boto3()
             stack.enter_context(mock.patch(
-                'boto3.client', return_value=build_mock_boto3()))
+                'boto3.client', return_value=mock_ecr))
 
             params = [
                 'deploy2ecs',
@@ -516,4 +538,8 @@ class TestBuildImage(unittest.TestCase):
             App().run()
 
             mock_docker.images.build.assert_not_called()
-            mock_docker.images.push.assert_called()
+            mock_docker.images.pull.assert_not_called()
+            mock_docker.images.push.assert_not_called()
+            self.assertEqual(
+                ['v1', 'v1.1', 'v1.1.1'],
+                [x[1]['imageTag'] for x in mock_ecr.put_image.call_args_list])
@@ -12,7 +12,10 @@ import mimesis
 
 from deploy2ecscli.app import App
 
+from tests.fixtures import git as git_fixtures
 
+
+@mock.patch('subprocess.Popen', new=git_fixtures.unsupported_process)
 class TestRegisterService(unittest.TestCase):
     DEFAULT_YAML = """
     integration:
@@ -366,7 +369,7 @@ class TestRegisterService(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__subprocer_run(x)
+                lambda x, **_: self.__subprocer_run(' '.join(x))
 
             stack.enter_context(mock.patch(
                 'deploy2ecscli.app.open', mock.mock_open(read_data=self.DEFAULT_YAML)))
@@ -447,7 +450,7 @@ class TestRegisterService(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__subprocer_run(x)
+                lambda x, **_: self.__subprocer_run(' '.join(x))
 
             stack.enter_context(mock.patch(
                 'deploy2ecscli.app.open', mock.mock_open(read_data=self.DEFAULT_YAML)))
@@ -539,7 +542,7 @@ class TestRegisterService(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__subprocer_run(x)
+                lambda x, **_: self.__subprocer_run(' '.join(x))
 
             stack.enter_context(mock.patch(
                 'deploy2ecscli.app.open', mock.mock_open(read_data=self.DEFAULT_YAML)))
@@ -632,7 +635,7 @@ class TestRegisterService(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__subprocer_run(x)
+                lambda x, **_: self.__subprocer_run(' '.join(x))
 
             stack.enter_context(mock.patch(
                 'deploy2ecscli.app.open', mock.mock_open(read_data=self.DEFAULT_YAML)))
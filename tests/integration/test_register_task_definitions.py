@@ -15,7 +15,10 @@ import mimesis
 from deploy2ecscli.app import App
 from deploy2ecscli.yaml import setup_loader
 
+from tests.fixtures import git as git_fixtures
 
+
+@mock.patch('subprocess.Popen', new=git_fixtures.unsupported_process)
 class TestRegisterTaskDefinitionUseCase(unittest.TestCase):
     DEFAULT_YAML = """
     integration:
@@ -469,7 +472,7 @@ class TestRegisterTaskDefinitionUseCase(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__default_subprocer_run(x, hash_mapping)
+                lambda x, **_: self.__default_subprocer_run(' '.join(x), hash_mapping)
 
             stack.enter_context(
                 mock.patch('deploy2ecscli.app.open', mock_open(read_data=self.DEFAULT_YAML)))
@@ -547,7 +550,7 @@ class TestRegisterTaskDefinitionUseCase(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__default_subprocer_run(x, hash_mapping)
+                lambda x, **_: self.__default_subprocer_run(' '.join(x), hash_mapping)
 
             stack.enter_context(
                 mock.patch('deploy2ecscli.app.open', mock_open(read_data=self.DEFAULT_YAML)))
@@ -613,7 +616,7 @@ class TestRegisterTaskDefinitionUseCase(unittest.TestCase):
             mock_subprocer = \
                 stack.enter_context(mock.patch('subprocess.run'))
             mock_subprocer.side_effect = \
-                lambda x, **_: self.__default_subprocer_run(x, hash_mapping)
+                lambda x, **_: self.__default_subprocer_run(' '.join(x), hash_mapping)
 
             stack.enter_context(
                 mock.patch('deploy2ecscli.app.open', mock_open(read_data=self.DEFAULT_YAML)))
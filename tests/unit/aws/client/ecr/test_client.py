@@ -20,3 +20,8 @@ class TestClient(unittest.TestCase):
     def test_repositories(self, mock_client):
         actual = Client(None)
         self.assertIsNotNone(actual.repositories)
+
+    @mock.patch('boto3.client')
+    def test_transfer(self, mock_client):
+        actual = Client(None)
+        self.assertIsNotNone(actual.transfer)
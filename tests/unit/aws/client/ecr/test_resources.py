@@ -1,14 +1,33 @@
+import io
+import os
+import json
+import hashlib
+import tempfile
 import unittest
 import base64
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 from unittest.mock import MagicMock
 
+from botocore.exceptions import ClientError
+
+import boto3
 import mimesis
 
+try:
+    import moto
+except ImportError:
+    moto = None
+
 from deploy2ecscli.aws.client.ecr.resources import AuthorizationToken
+from deploy2ecscli.aws.client.ecr.resources import ImageTransfer
 from deploy2ecscli.aws.client.ecr.resources import Repository
 from deploy2ecscli.aws.client.ecr.resources import RepositoryCollection
+from deploy2ecscli.aws.client.config import Config
 from deploy2ecscli.aws.models.ecr import ImageCollection
+from deploy2ecscli.cache import DiskCache
+
+from tests.fixtures import aws as fixtures
 
 
 class TestAuthorizationToken(unittest.TestCase):
@@ -43,6 +62,102 @@ class TestAuthorizationToken(unittest.TestCase):
 
         self.assertDictEqual(expext, actual)
 
+    def authorization_data(self, registry: str, expires_in: int = 3600):
+        credentials = {
+            'username': 'AWS',
+            'password': mimesis.Cryptographic().token_hex()
+        }
+        authorization_token = base64.b64encode(
+            '{username}:{password}'.format(**credentials).encode('utf8'))
+        expires_at = \
+            datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+
+        return (credentials, {
+            'authorizationToken': authorization_token,
+            'expiresAt': expires_at,
+            'proxyEndpoint': 'https://' + registry
+        })
+
+    def test_get_cached(self):
+        registries = [
+            '012345678910.dkr.ecr.us-east-1.amazonaws.com',
+            '109876543210.dkr.ecr.ap-northeast-1.amazonaws.com',
+        ]
+
+        with self.subTest('When not expiring'):
+            expect, data = self.authorization_data(registries[0])
+            mock_client = MagicMock()
+            mock_client.get_authorization_token.return_value = \
+                {'authorizationData': [data]}
+            subject = AuthorizationToken(mock_client, Config())
+
+            self.assertEqual(expect, subject.get(registries[0]))
+            self.assertEqual(expect, subject.get(registries[0]))
+            mock_client.get_authorization_token.assert_called_once_with(
+                registryIds=['012345678910'])
+
+        with self.subTest('When expiring'):
+            expect, data = self.authorization_data(registries[0], 60)
+            mock_client = MagicMock()
+            mock_client.get_authorization_token.return_value = \
+                {'authorizationData': [data]}
+            subject = AuthorizationToken(mock_client, Config())
+
+            subject.get(registries[0])
+            subject.get(registries[0])
+            self.assertEqual(2, mock_client.get_authorization_token.call_count)
+
+        with self.subTest('When multiple registries'):
+            tokens = [self.authorization_data(x) for x in registries]
+            mock_client = MagicMock()
+            mock_client.get_authorization_token.return_value = \
+                {'authorizationData': [x[1] for x in tokens]}
+            subject = AuthorizationToken(mock_client, Config())
+
+            self.assertEqual(tokens[1][0], subject.get(registries[1]))
+            self.assertEqual(tokens[0][0], subject.get(registries[0]))
+            mock_client.get_authorization_token.assert_called_once()
+
+    def test_get_disk_cached(self):
+        registry = '012345678910.dkr.ecr.us-east-1.amazonaws.com'
+        expect, data = self.authorization_data(registry)
+        mock_client = MagicMock()
+        mock_client.get_authorization_token.return_value = \
+            {'authorizationData': [data]}
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = DiskCache(directory.name)
+        self.addCleanup(cache.close)
+
+        key = mimesis.Cryptographic().token_hex()
+        with mock.patch.dict(os.environ, {AuthorizationToken.KEY_ENVIRONMENT: key}):
+            AuthorizationToken(mock_client, Config(cache=cache)).get(registry)
+
+            with self.subTest('When encrypted'):
+                value = cache.get('ecr', ['token', 1, '012345678910', 'us-east-1'])
+                self.assertIsNotNone(value)
+                self.assertNotIn(expect['password'], value)
+
+            with self.subTest('When next run'):
+                actual = AuthorizationToken(
+                    mock_client, Config(cache=cache)).get(registry)
+
+                self.assertEqual(expect, actual)
+                mock_client.get_authorization_token.assert_called_once()
+
+        with self.subTest('When key is changed'):
+            with mock.patch.dict(os.environ, {AuthorizationToken.KEY_ENVIRONMENT: key + 'x'}):
+                AuthorizationToken(mock_client, Config(cache=cache)).get(registry)
+
+            self.assertEqual(2, mock_client.get_authorization_token.call_count)
+
+        with self.subTest('When key is not given'):
+            with mock.patch.dict(os.environ, clear=True):
+                AuthorizationToken(mock_client, Config(cache=cache)).get(registry)
+
+            self.assertEqual(3, mock_client.get_authorization_token.call_count)
+
 
 class TestRepository(unittest.TestCase):
     def test_init(self):
@@ -81,12 +196,143 @@ class TestRepository(unittest.TestCase):
 
         mock_client = MagicMock(**mock_attrs)
         name = mimesis.File().file_name()
-        actual = Repository(mock_client, name).images
+        actual = Repository(mock_client, name).scan_images()
 
-        mock_client.list_images.assert_called_with(repositoryName=name)
+        mock_client.list_images.assert_called_with(
+            repositoryName=name, maxResults=Repository.PAGE_SIZE)
 
         self.assertEqual(ImageCollection(image_ids), actual)
 
+    def test_images_paginated(self):
+        pages = [
+            {
+                'imageIds': [{
+                    'imageTag': 'tag-%d' % x,
+                    'imageDigest': mimesis.Cryptographic.token_hex()
+                }],
+                'nextToken': 'token-%d' % x
+            }
+            for x in range(3)
+        ]
+        del pages[-1]['nextToken']
+
+        name = mimesis.File().file_name()
+        mock_client = MagicMock()
+        mock_client.list_images.side_effect = pages
+        subject = Repository(mock_client, name)
+
+        with self.subTest('When found in the first page'):
+            self.assertEqual('tag-0', subject.images.find_by_tag('tag-0').tag)
+            self.assertEqual(1, mock_client.list_images.call_count)
+            self.assertFalse(subject.images.complete)
+
+        with self.subTest('When found in the next page'):
+            self.assertEqual('tag-1', subject.images.find_by_tag('tag-1').tag)
+            mock_client.list_images.assert_called_with(
+                repositoryName=name,
+                maxResults=Repository.PAGE_SIZE,
+                nextToken='token-0')
+
+        with self.subTest('When not found'):
+            self.assertIsNone(subject.images.latest)
+            self.assertEqual(3, mock_client.list_images.call_count)
+            self.assertTrue(subject.images.complete)
+
+        with self.subTest('When scanned for the run'):
+            actual = subject.scan_images()
+
+            self.assertIs(subject.images, actual)
+            self.assertEqual(['tag-0', 'tag-1', 'tag-2'], [x.tag for x in actual])
+            self.assertEqual(3, mock_client.list_images.call_count)
+
+    def test_find_images(self):
+        latest_digest = mimesis.Cryptographic.token_hex()
+        image_ids = [fixtures.ecr_image() for x in range(5)] + [
+            fixtures.ecr_image(tag='latest', digest=latest_digest),
+            fixtures.ecr_image(digest=latest_digest),
+        ]
+        mock_client = fixtures.ecr_client(**{
+            'list_images.return_value': {'imageIds': image_ids}})
+        name = mimesis.File().file_name()
+        missing = mimesis.Cryptographic.token_hex()
+
+        with self.subTest('When found'):
+            actual = Repository(mock_client, name).find_images(
+                ['latest', image_ids[0]['imageTag'], missing, None])
+
+            self.assertEqual(
+                image_ids[0]['imageDigest'],
+                actual.find_by_tag(image_ids[0]['imageTag']).digest)
+            self.assertIsNone(actual.find_by_tag(missing))
+            self.assertEqual(
+                ['latest', image_ids[-1]['imageTag']],
+                [x.tag for x in actual.digest_is(latest_digest)])
+            self.assertEqual(1, mock_client.batch_get_image.call_count)
+            self.assertEqual(1, mock_client.describe_images.call_count)
+            mock_client.list_images.assert_not_called()
+
+        with self.subTest('When many tags'):
+            mock_client.batch_get_image.reset_mock()
+            tags = [mimesis.Cryptographic.token_hex() for x in range(250)]
+
+            Repository(mock_client, name).find_images(tags)
+
+            self.assertEqual(3, mock_client.batch_get_image.call_count)
+
+        with self.subTest('When deleted meanwhile'):
+            mock_client.describe_images.side_effect = ClientError(
+                {'Error': {'Code': 'ImageNotFoundException'}},
+                'DescribeImages')
+
+            actual = Repository(mock_client, name).find_images(['latest'])
+
+            self.assertEqual(latest_digest, actual.latest.digest)
+            mock_client.list_images.assert_called()
+
+
+    def test_put_tags(self):
+        image_ids = [fixtures.ecr_image(tag='latest')]
+        mock_client = fixtures.ecr_client(**{
+            'list_images.return_value': {'imageIds': image_ids}})
+        name = mimesis.File().file_name()
+        tags = [mimesis.Person().username() for x in range(3)]
+
+        with self.subTest('When found'):
+            subject = Repository(mock_client, name)
+            images = subject.images
+
+            actual = subject.put_tags('latest', tags)
+
+            self.assertEqual(tags, actual)
+            self.assertEqual(
+                ['latest'],
+                [x['imageTag'] for x in
+                 mock_client.batch_get_image.call_args[1]['imageIds']])
+            self.assertEqual(
+                [{'repositoryName': name, 'imageManifest': '{}', 'imageTag': x}
+                 for x in tags],
+                [x[1] for x in mock_client.put_image.call_args_list])
+            self.assertEqual(4, subject.request_count)
+            self.assertIsNot(images, subject.images)
+            mock_client.list_images.assert_not_called()
+
+        with self.subTest('When already tagged'):
+            mock_client.put_image.side_effect = ClientError(
+                {'Error': {'Code': 'ImageAlreadyExistsException'}},
+                'PutImage')
+
+            actual = Repository(mock_client, name).put_tags('latest', tags)
+
+            self.assertEqual(tags, actual)
+
+        with self.subTest('When not found'):
+            mock_client.put_image.reset_mock()
+
+            actual = Repository(mock_client, name).put_tags('v1', tags)
+
+            self.assertIsNone(actual)
+            mock_client.put_image.assert_not_called()
+
 
 class TestRepositoryCollection(unittest.TestCase):
     def test_init(self):
@@ -101,3 +347,209 @@ class TestRepositoryCollection(unittest.TestCase):
         self.assertIsNotNone(actual)
 
         self.assertIs(actual, repositories[name])
+
+    def test_find_images(self):
+        names = [mimesis.File().file_name() for x in range(3)]
+        image_ids = [fixtures.ecr_image(tag='latest')]
+        mock_client = fixtures.ecr_client(**{
+            'list_images.return_value': {'imageIds': image_ids}})
+
+        for count in [1, 3]:
+            with self.subTest(count=count):
+                tags = dict((x, ['latest']) for x in names[:count])
+
+                actual = RepositoryCollection(mock_client).find_images(tags)
+
+                self.assertEqual(names[:count], list(actual.keys()))
+                for images in actual.values():
+                    self.assertEqual(
+                        image_ids[0]['imageDigest'], images.latest.digest)
+
+                called = [x[1]['repositoryName']
+                          for x in mock_client.batch_get_image.call_args_list]
+                self.assertEqual(sorted(names[:count]), sorted(called))
+                mock_client.batch_get_image.reset_mock()
+
+    def test_invalidate(self):
+        name = mimesis.File().file_name()
+        image_ids = [fixtures.ecr_image(tag='latest'), fixtures.ecr_image()]
+        mock_client = fixtures.ecr_client(**{
+            'list_images.return_value': {'imageIds': image_ids}})
+        subject = RepositoryCollection(mock_client)
+
+        subject.find_images({name: ['latest']})
+        self.assertEqual(2, subject.request_count)
+
+        with self.subTest('When invalidated'):
+            images = subject[name].images
+            subject.invalidate(name)
+
+            self.assertIsNot(images, subject[name].images)
+
+        with self.subTest('When tagged'):
+            images = subject[name].images
+            subject.put_tags(name, 'latest', ['v2'])
+
+            self.assertIsNot(images, subject[name].images)
+            self.assertEqual('ECR: 4 requests', subject.summary())
+
+
+class TestImageTransfer(unittest.TestCase):
+    SOURCE_URI = '123456789012.dkr.ecr.us-east-1.amazonaws.com/staging/app'
+    DESTINATION_URIS = [
+        '123456789012.dkr.ecr.us-west-2.amazonaws.com/production/app',
+        '123456789012.dkr.ecr.us-east-1.amazonaws.com/production/app',
+    ]
+
+    def setUp(self):
+        environ = {
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+        }
+
+        patcher = mock.patch.dict(os.environ, environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Layers served by the download URLs of the registry stand-in
+        self.blobs = {}
+
+    def upload_layer(self, client, name: str, data: bytes) -> str:
+        upload = client.initiate_layer_upload(repositoryName=name)
+        client.upload_layer_part(
+            repositoryName=name,
+            uploadId=upload['uploadId'],
+            partFirstByte=0,
+            partLastByte=len(data) - 1,
+            layerPartBlob=data)
+
+        digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+        client.complete_layer_upload(
+            repositoryName=name,
+            uploadId=upload['uploadId'],
+            layerDigests=[digest])
+        self.blobs[digest] = data
+
+        return digest
+
+    def put_source_image(self, client, tag: str) -> list:
+        config = self.upload_layer(client, 'staging/app', os.urandom(16))
+        layers = [self.upload_layer(client, 'staging/app', os.urandom(64))
+                  for x in range(3)]
+        manifest = {
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+            'config': {'digest': config, 'size': 16},
+            'layers': [{'digest': x, 'size': 64} for x in layers],
+        }
+
+        client.put_image(
+            repositoryName='staging/app',
+            imageManifest=json.dumps(manifest),
+            imageTag=tag)
+
+        return [config] + layers
+
+    def source_client(self, client) -> MagicMock:
+        # Download URLs are not given by moto
+        source_client = MagicMock(wraps=client)
+        source_client.meta.region_name = 'us-east-1'
+        source_client.get_download_url_for_layer.side_effect = \
+            lambda layerDigest, **kwargs: {'downloadUrl': layerDigest}
+
+        return source_client
+
+    def open_blob(self, url: str):
+        return io.BytesIO(self.blobs[url])
+
+    @unittest.skipIf(moto is None, 'moto is not installed')
+    def test_copy_all_with_moto(self):
+        with moto.mock_aws():
+            client = boto3.client('ecr')
+            west_client = boto3.client('ecr', region_name='us-west-2')
+            client.create_repository(repositoryName='staging/app')
+            client.create_repository(repositoryName='production/app')
+            west_client.create_repository(repositoryName='production/app')
+
+            layers = self.put_source_image(client, 'abc123')
+            # Shared with a production image
+            self.upload_layer(
+                west_client, 'production/app', self.blobs[layers[1]])
+
+            with self.subTest('When dry run'):
+                subject = ImageTransfer(
+                    self.source_client(client),
+                    Config(dry_run=True),
+                    opener=self.open_blob)
+
+                copies = [(self.SOURCE_URI, 'abc123', x, ['abc123', 'latest'])
+                          for x in self.DESTINATION_URIS]
+                actual = subject.copy_all(copies)
+
+                self.assertIsNotNone(actual[0])
+                self.assertEqual(
+                    'ECR: 7 layers copied, 1 already in destinations',
+                    subject.summary())
+                self.assertEqual(
+                    [], west_client.list_images(
+                        repositoryName='production/app')['imageIds'])
+
+            with self.subTest('When copied'):
+                subject = ImageTransfer(
+                    self.source_client(client), opener=self.open_blob)
+
+                actual = subject.copy_all(copies)
+
+                # The same manifest in every destination
+                self.assertEqual(1, len(set(actual)))
+                self.assertEqual(
+                    'ECR: 7 layers copied, 1 already in destinations',
+                    subject.summary())
+                for destination_client in [west_client, client]:
+                    images = destination_client.list_images(
+                        repositoryName='production/app')['imageIds']
+                    self.assertEqual(
+                        ['abc123', 'latest'],
+                        sorted(x['imageTag'] for x in images))
+                    self.assertEqual(
+                        [], destination_client.batch_check_layer_availability(
+                            repositoryName='production/app',
+                            layerDigests=layers)['failures'])
+
+            with self.subTest('When copied again'):
+                subject = ImageTransfer(
+                    self.source_client(client), opener=self.open_blob)
+
+                subject.copy(
+                    self.SOURCE_URI, 'abc123', self.DESTINATION_URIS[0], ['v1'])
+
+                self.assertEqual(
+                    'ECR: 0 layers copied, 4 already in destinations',
+                    subject.summary())
+
+            with self.subTest('When not found'):
+                actual = subject.copy(
+                    self.SOURCE_URI, 'missing', self.DESTINATION_URIS[0], ['v1'])
+
+                self.assertIsNone(actual)
+
+    @unittest.skipIf(moto is None, 'moto is not installed')
+    def test_copy_when_download_is_corrupted(self):
+        with moto.mock_aws():
+            client = boto3.client('ecr')
+            client.create_repository(repositoryName='staging/app')
+            client.create_repository(repositoryName='production/app')
+            self.put_source_image(client, 'abc123')
+
+            subject = ImageTransfer(
+                self.source_client(client),
+                opener=lambda url: io.BytesIO(b'corrupted'))
+
+            with self.assertRaises(ValueError):
+                subject.copy(
+                    self.SOURCE_URI, 'abc123', self.DESTINATION_URIS[1], ['v1'])
+
+            self.assertEqual(
+                [], client.list_images(
+                    repositoryName='production/app')['imageIds'])
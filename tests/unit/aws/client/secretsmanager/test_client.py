@@ -0,0 +1,19 @@
+import unittest
+from unittest import mock
+
+from deploy2ecscli.aws.client.secretsmanager.client import Client
+
+from deploy2ecscli.aws.client.secretsmanager.resources import SecretCollection
+
+
+class TestClient(unittest.TestCase):
+    @mock.patch('boto3.client')
+    def test_init(self, mock_client):
+
+        Client(None)
+        mock_client.assert_called_with('secretsmanager')
+
+    @mock.patch('boto3.client')
+    def test_secrets(self, mock_client):
+        actual = Client(None)
+        self.assertIsInstance(actual.secrets, SecretCollection)
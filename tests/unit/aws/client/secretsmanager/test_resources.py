@@ -0,0 +1,80 @@
+import os
+import unittest
+from unittest import mock
+from unittest.mock import MagicMock
+
+import boto3
+import mimesis
+
+try:
+    import moto
+except ImportError:
+    moto = None
+
+from deploy2ecscli.aws.client.secretsmanager.resources import SecretCollection
+from deploy2ecscli.aws.client.secretsmanager.exceptions import SecretNotFoundException
+
+
+class TestSecretCollection(unittest.TestCase):
+    def test_get_all(self):
+        names = ['app/%d' % x for x in range(45)]
+        values = dict((x, mimesis.Cryptographic.token_hex()) for x in names)
+
+        def batch_get_secret_value(SecretIdList):
+            self.assertLessEqual(len(SecretIdList), 20)
+            ids = [x[len('arn:'):] if x.startswith('arn:') else x
+                   for x in SecretIdList]
+            secrets = [
+                {'Name': x, 'ARN': 'arn:' + x, 'SecretString': values[x]}
+                for x in ids if x in values]
+            errors = [
+                {'SecretId': x, 'ErrorCode': 'ResourceNotFoundException'}
+                for x in ids if x not in values]
+            return {'SecretValues': secrets, 'Errors': errors}
+
+        mock_client = MagicMock()
+        mock_client.batch_get_secret_value.side_effect = batch_get_secret_value
+
+        with self.subTest('When all found'):
+            with mock.patch(
+                    'deploy2ecscli.aws.client.secretsmanager.resources.log') \
+                    as mock_log:
+                actual = SecretCollection(mock_client).get_all(names)
+
+            self.assertEqual(values, actual)
+            self.assertEqual(3, mock_client.batch_get_secret_value.call_count)
+            self.assertEqual(
+                sorted(values.values()),
+                sorted(x[0][0] for x in mock_log.add_secret.call_args_list))
+
+        with self.subTest('When found by ARN'):
+            actual = SecretCollection(mock_client).get_all(['arn:app/0'])
+
+            self.assertEqual({'arn:app/0': values['app/0']}, actual)
+
+        with self.subTest('When not found'):
+            with self.assertRaises(SecretNotFoundException):
+                SecretCollection(mock_client).get_all(['app/0', 'missing'])
+
+    @unittest.skipIf(moto is None, 'moto is not installed')
+    def test_get_all_with_moto(self):
+        environ = {
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+        }
+
+        with mock.patch.dict(os.environ, environ), moto.mock_aws():
+            client = boto3.client('secretsmanager')
+            expect = {}
+            for index in range(3):
+                name = 'app/%d' % index
+                expect[name] = mimesis.Cryptographic.token_hex()
+                client.create_secret(Name=name, SecretString=expect[name])
+
+            actual = SecretCollection(client).get_all(expect.keys())
+
+            self.assertEqual(expect, actual)
+
+            with self.assertRaises(SecretNotFoundException):
+                SecretCollection(client).get_all(['app/0', 'missing'])
@@ -0,0 +1,19 @@
+import unittest
+from unittest import mock
+
+from deploy2ecscli.aws.client.ssm.client import Client
+
+from deploy2ecscli.aws.client.ssm.resources import ParameterCollection
+
+
+class TestClient(unittest.TestCase):
+    @mock.patch('boto3.client')
+    def test_init(self, mock_client):
+
+        Client(None)
+        mock_client.assert_called_with('ssm')
+
+    @mock.patch('boto3.client')
+    def test_parameters(self, mock_client):
+        actual = Client(None)
+        self.assertIsInstance(actual.parameters, ParameterCollection)
@@ -0,0 +1,109 @@
+import os
+import unittest
+from unittest import mock
+from unittest.mock import MagicMock
+
+import boto3
+import mimesis
+
+try:
+    import moto
+except ImportError:
+    moto = None
+
+from deploy2ecscli.aws.client.ssm.resources import ParameterCollection
+from deploy2ecscli.aws.client.ssm.exceptions import ParameterNotFoundException
+
+
+class TestParameterCollection(unittest.TestCase):
+    def test_get_all(self):
+        names = ['/app/%d' % x for x in range(25)]
+        values = dict((x, mimesis.Cryptographic.token_hex()) for x in names)
+
+        def get_parameters(Names, WithDecryption):
+            self.assertTrue(WithDecryption)
+            self.assertLessEqual(len(Names), 10)
+            parameters = [{'Name': x, 'Value': values[x]}
+                          for x in Names if x in values]
+            invalid = [x for x in Names if x not in values]
+            return {'Parameters': parameters, 'InvalidParameters': invalid}
+
+        mock_client = MagicMock()
+        mock_client.get_parameters.side_effect = get_parameters
+
+        with self.subTest('When all found'):
+            actual = ParameterCollection(mock_client).get_all(names + names)
+
+            self.assertEqual(values, actual)
+            self.assertEqual(3, mock_client.get_parameters.call_count)
+
+        with self.subTest('When not found'):
+            with self.assertRaises(ParameterNotFoundException) as cm:
+                ParameterCollection(mock_client).get_all(
+                    names[:2] + ['/missing'])
+
+            self.assertEqual(['/missing'], cm.exception.args[1])
+
+    def test_get_all_with_selector(self):
+        arn = 'arn:aws:ssm:us-east-1:123456789012:parameter/app/token'
+        mock_client = MagicMock()
+        mock_client.get_parameters.return_value = {
+            'Parameters': [
+                {'Name': '/app/token', 'Value': 'v1', 'Selector': ':1',
+                 'ARN': arn},
+                {'Name': '/app/token', 'Value': 'v2', 'ARN': arn},
+            ],
+            'InvalidParameters': []
+        }
+
+        actual = ParameterCollection(mock_client).get_all(
+            ['/app/token:1', '/app/token', arn])
+
+        self.assertEqual(
+            {'/app/token:1': 'v1', '/app/token': 'v2', arn: 'v2'}, actual)
+
+    def test_get_all_masks_secure_string(self):
+        secure = mimesis.Cryptographic.token_hex()
+        plain = mimesis.Cryptographic.token_hex()
+        mock_client = MagicMock()
+        mock_client.get_parameters.return_value = {
+            'Parameters': [
+                {'Name': '/app/token', 'Value': secure,
+                 'Type': 'SecureString'},
+                {'Name': '/app/name', 'Value': plain, 'Type': 'String'},
+                {'Name': '/app/hosts', 'Value': plain + ',' + plain,
+                 'Type': 'StringList'},
+            ],
+            'InvalidParameters': []
+        }
+
+        with mock.patch('deploy2ecscli.aws.client.ssm.resources.log') \
+                as mock_log:
+            ParameterCollection(mock_client).get_all(
+                ['/app/token', '/app/name', '/app/hosts'])
+
+        mock_log.add_secret.assert_called_once_with(secure)
+
+    @unittest.skipIf(moto is None, 'moto is not installed')
+    def test_get_all_with_moto(self):
+        environ = {
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+        }
+
+        with mock.patch.dict(os.environ, environ), moto.mock_aws():
+            client = boto3.client('ssm')
+            expect = {}
+            for index in range(12):
+                name = '/app/%d' % index
+                expect[name] = mimesis.Cryptographic.token_hex()
+                client.put_parameter(
+                    Name=name, Value=expect[name], Type='SecureString')
+
+            actual = ParameterCollection(client).get_all(expect.keys())
+
+            self.assertEqual(expect, actual)
+
+            with self.assertRaises(ParameterNotFoundException):
+                ParameterCollection(client).get_all(['/app/0', '/missing'])
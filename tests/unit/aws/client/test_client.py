@@ -19,3 +19,13 @@ class TestClient(unittest.TestCase):
     def test_ecs(self, mock_client):
         actual = Client(None)
         self.assertIsNotNone(actual.ecs)
+
+    @mock.patch('boto3.client')
+    def test_ssm(self, mock_client):
+        actual = Client(None)
+        self.assertIsNotNone(actual.ssm)
+
+    @mock.patch('boto3.client')
+    def test_secretsmanager(self, mock_client):
+        actual = Client(None)
+        self.assertIsNotNone(actual.secretsmanager)
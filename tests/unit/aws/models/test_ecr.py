@@ -1,3 +1,5 @@
+import copy
+import pickle
 import unittest
 import mimesis
 
@@ -126,6 +128,14 @@ class TestImageCollection(unittest.TestCase):
             actual = ImageCollection(json).find_by_tag(tag)
             self.assertIsNone(actual)
 
+        with self.subTest('When tag is duplicated'):
+            duplicate = fixtures.ecr_image(tag=expect['imageTag'])
+            json['imageIds'].append(duplicate)
+
+            actual = ImageCollection(json).find_by_tag(expect['imageTag'])
+
+            self.assertEqual(expect['imageDigest'], actual.digest)
+
     def test_digest_is(self):
         expect = fixtures.ecr_image()
 
@@ -149,6 +159,44 @@ class TestImageCollection(unittest.TestCase):
                 expect['imageDigest'] + 'x')
             self.assertIsNone(actual)
 
+        with self.subTest('When digest is shared'):
+            shared = fixtures.ecr_image(digest=expect['imageDigest'])
+            json['imageIds'].append(shared)
+            images = ImageCollection(json)
+
+            actual = images.digest_is(expect['imageDigest'])
+            actual.pop()
+
+            self.assertEqual(
+                [expect['imageTag'], shared['imageTag']],
+                [x.tag for x in images.digest_is(expect['imageDigest'])])
+
+    def test_pages(self):
+        pages = [{'imageIds': [fixtures.ecr_image()]} for x in range(3)]
+        digest = pages[0]['imageIds'][0]['imageDigest']
+        pages[2]['imageIds'].append(fixtures.ecr_image(digest=digest))
+
+        with self.subTest('When found'):
+            actual = ImageCollection(pages=iter(pages))
+            tag = pages[1]['imageIds'][0]['imageTag']
+
+            self.assertEqual(tag, actual.find_by_tag(tag).tag)
+            self.assertEqual(2, len(actual))
+            self.assertFalse(actual.complete)
+
+        with self.subTest('When not found'):
+            actual = ImageCollection(pages=iter(pages))
+
+            self.assertIsNone(actual.latest)
+            self.assertEqual(4, len(actual))
+            self.assertTrue(actual.complete)
+
+        with self.subTest('When digest is looked up'):
+            actual = ImageCollection(pages=iter(pages))
+
+            self.assertEqual(2, len(actual.digest_is(digest)))
+            self.assertTrue(actual.complete)
+
 
 class TestImage(unittest.TestCase):
     def test_init(self):
@@ -158,3 +206,10 @@ class TestImage(unittest.TestCase):
 
         self.assertEqual(json['imageTag'], actual.tag)
         self.assertEqual(json['imageDigest'], actual.digest)
+
+    def test_copy(self):
+        expect = Image(fixtures.ecr_image())
+
+        self.assertFalse(hasattr(expect, '__dict__'))
+        self.assertEqual(expect, copy.deepcopy(expect))
+        self.assertEqual(expect, pickle.loads(pickle.dumps(expect)))
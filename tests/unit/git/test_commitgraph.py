@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+import unittest
+
+from deploy2ecscli.git.commitgraph import CommitGraph
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class TestCommitGraph(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.git('init', '-q')
+        self.commits = [self.commit(x) for x in range(3)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def git(self, *args) -> str:
+        command = ['git', '-c', 'user.name=test',
+                   '-c', 'user.email=test@example.com']
+        proc = subprocess.run(
+            command + list(args),
+            cwd=self.directory.name,
+            stdout=subprocess.PIPE,
+            check=True)
+
+        return proc.stdout.decode('utf8').strip()
+
+    def commit(self, index: int) -> str:
+        path = os.path.join(self.directory.name, 'file.txt')
+        with open(path, 'w') as f:
+            f.write(str(index))
+
+        self.git('add', 'file.txt')
+        self.git('commit', '-q', '-m', str(index))
+
+        return self.git('rev-parse', 'HEAD')
+
+    @property
+    def info_directory(self) -> str:
+        return os.path.join(self.directory.name, '.git', 'objects', 'info')
+
+    def test_open_when_missing(self):
+        self.assertIsNone(CommitGraph.open(self.info_directory))
+
+    def test_open(self):
+        with self.subTest('When single file'):
+            self.git('commit-graph', 'write', '--reachable')
+            graph = CommitGraph.open(self.info_directory)
+
+            self.assertEqual(3, graph.commit_count)
+            self.assertFalse(graph.changed_paths)
+            for commit in self.commits:
+                self.assertTrue(graph.contains(commit))
+
+            graph.close()
+
+        with self.subTest('When split chain'):
+            stale = self.commit(3)
+            self.git('commit-graph', 'write', '--reachable',
+                     '--changed-paths', '--split')
+            head = self.commit(4)
+            graph = CommitGraph.open(self.info_directory)
+
+            self.assertEqual(4, graph.commit_count)
+            self.assertTrue(graph.contains(stale))
+            self.assertFalse(graph.contains(head))
+
+            graph.close()
+
+        with self.subTest('When changed paths are written'):
+            self.git('commit-graph', 'write', '--reachable',
+                     '--changed-paths', '--split=replace')
+            graph = CommitGraph.open(self.info_directory)
+
+            self.assertTrue(graph.changed_paths)
+            self.assertTrue(graph.contains(head))
+
+            graph.close()
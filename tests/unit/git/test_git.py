@@ -3,14 +3,18 @@
 # -*- coding: utf-8 -*-
 # vi: set ft=python :
 
+import io
 import subprocess
+import tempfile
 import dataclasses
 
 import unittest
 from unittest import mock
+from unittest.mock import MagicMock
 
 import mimesis
 
+from deploy2ecscli.cache import DiskCache
 from deploy2ecscli.git.git import Git
 from deploy2ecscli.git import exceptions
 
@@ -26,7 +30,6 @@ class TestGit(unittest.TestCase):
     """test class of git.py
     """
     RUN_OPTION = {
-        'shell': True,
         'stdout': subprocess.PIPE,
         'stderr': subprocess.PIPE,
     }
@@ -39,14 +42,22 @@ class TestGit(unittest.TestCase):
         self.mock_run = self.patcher.start()
         self.mock_run.return_value = StubProcess(stdout=b'true')
 
+        self.popen_patcher = mock.patch('subprocess.Popen')
+        self.mock_popen = self.popen_patcher.start()
+        self.mock_popen.return_value.poll.return_value = None
+
         self.git = Git()
 
     def tearDown(self):
+        self.popen_patcher.stop()
         self.patcher.stop()
 
     def test_init(self):
         with self.subTest('When return true'):
-            command = 'git rev-parse --is-inside-work-tree'
+            command = [
+                'git', 'rev-parse', '--is-inside-work-tree',
+                '--is-shallow-repository', '--show-toplevel',
+                '--show-prefix']
             self.mock_run.return_value = StubProcess(stdout=b'true')
 
             Git()
@@ -84,47 +95,130 @@ class TestGit(unittest.TestCase):
 
     def test_head_object(self):
         expect = mimesis.Cryptographic.token_hex()
-        self.mock_run.return_value = \
-            StubProcess(stdout=expect.encode('utf8'))
+        self.mock_popen.return_value.stdout.readline.return_value = \
+            ('%s commit 240\n' % expect).encode('utf8')
 
         actual = self.git.head_object
 
         self.assertEqual(expect, actual)
 
-        command = 'git --no-pager rev-parse HEAD'
-        self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+        command = ['git', 'cat-file', '--batch-check']
+        self.mock_popen.assert_called_once()
+        self.assertEqual(command, self.mock_popen.call_args[0][0])
+        self.mock_popen.return_value.stdin.write.assert_called_with(b'HEAD\n')
+
+    def test_resolve(self):
+        stdout = self.mock_popen.return_value.stdout
+
+        with self.subTest('When exists'):
+            expect = mimesis.Cryptographic.token_hex()
+            stdout.readline.return_value = \
+                ('%s tree 120\n' % expect).encode('utf8')
+
+            actual = self.git.resolve('HEAD:app')
+
+            self.assertEqual(expect, actual)
+            self.mock_popen.return_value.stdin.write.assert_called_with(
+                b'HEAD:app\n')
+
+        with self.subTest('When missing'):
+            stdout.readline.return_value = b'HEAD:app missing\n'
+
+            self.assertIsNone(self.git.resolve('HEAD:app'))
+
+        with self.subTest('When reuse process'):
+            self.git.resolve('HEAD')
+            self.git.resolve('HEAD~1')
+
+            self.mock_popen.assert_called_once()
+
+    def test_close(self):
+        stdout = self.mock_popen.return_value.stdout
+        stdout.readline.return_value = b'HEAD missing\n'
+
+        self.git.resolve('HEAD')
+        self.git.close()
+
+        self.mock_popen.return_value.stdin.close.assert_called()
+        self.mock_popen.return_value.wait.assert_called()
 
     def test_current_branch(self):
         expect = mimesis.Path().project_dir()
-        self.mock_run.return_value = \
-            StubProcess(stdout=expect.encode('utf8'))
+        symbolic_ref = ['git', 'symbolic-ref', '--short', '-q', 'HEAD']
+        name_rev = ['git', '--no-pager', 'name-rev', '--name-only', 'HEAD']
 
-        actual = self.git.current_branch
+        with self.subTest('When branch is checked out'), \
+                mock.patch.dict('os.environ', clear=True):
+            self.mock_run.return_value = \
+                StubProcess(stdout=expect.encode('utf8'))
 
-        self.assertEqual(expect, actual)
+            actual = self.git.current_branch
+
+            self.assertEqual(expect, actual)
+            self.mock_run.assert_called_with(symbolic_ref, **self.RUN_OPTION)
+
+        with self.subTest('When HEAD is detached'), \
+                mock.patch.dict('os.environ', clear=True):
+            def run(command, **kwargs):
+                if command == symbolic_ref:
+                    return StubProcess(returncode=1, stdout=b'', stderr=b'')
 
-        command = 'git --no-pager name-rev --name-only HEAD'
-        self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+                return StubProcess(stdout=expect.encode('utf8'))
+
+            self.mock_run.side_effect = run
+
+            actual = self.git.current_branch
+
+            self.assertEqual(expect, actual)
+            self.mock_run.assert_called_with(name_rev, **self.RUN_OPTION)
+            self.mock_run.side_effect = None
+
+        environments = [
+            ({'GITHUB_HEAD_REF': 'feature/x',
+              'GITHUB_REF': 'refs/pull/1/merge'}, 'feature/x'),
+            ({'GITHUB_HEAD_REF': '',
+              'GITHUB_REF': 'refs/heads/main'}, 'main'),
+            ({'CI_COMMIT_BRANCH': 'develop'}, 'develop'),
+            ({'CIRCLE_BRANCH': 'staging'}, 'staging'),
+            ({'GIT_BRANCH': 'origin/release'}, 'release'),
+            ({'CODEBUILD_WEBHOOK_HEAD_REF': 'refs/heads/main'}, 'main'),
+        ]
+
+        for environ, expect in environments:
+            with self.subTest(environ=environ), \
+                    mock.patch.dict('os.environ', environ, clear=True):
+                self.mock_run.reset_mock()
+
+                self.assertEqual(expect, self.git.current_branch)
+                self.mock_run.assert_not_called()
+
+        with self.subTest('When tag is built'), \
+                mock.patch.dict(
+                    'os.environ', {'GITHUB_REF': 'refs/tags/v1'}, clear=True):
+            self.mock_run.return_value = \
+                StubProcess(stdout=b'main')
+
+            self.assertEqual('main', self.git.current_branch)
+            self.mock_run.assert_called_with(symbolic_ref, **self.RUN_OPTION)
 
     def test_latest_object(self):
         expect = mimesis.Cryptographic.token_hex()
         log = '%s %s' % (expect, mimesis.Text().text())
         self.mock_run.return_value = \
             StubProcess(stdout=log.encode('utf8'))
+        base_command = \
+            ['git', '--no-pager', 'log', '-n', '1', '--pretty=oneline']
 
         with self.subTest('When files and excludes is none'):
-            command = 'git --no-pager log -n 1 --pretty=oneline'
-
             actual = self.git.latest_object()
 
             self.assertEqual(expect, actual)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+            self.mock_run.assert_called_with(base_command, **self.RUN_OPTION)
 
         with self.subTest('When files is str'):
             file = mimesis.File().file_name()
 
-            command = 'git --no-pager log -n 1 --pretty=oneline -- {0}'
-            command = command.format(file)
+            command = base_command + ['--', file]
 
             actual = self.git.latest_object(file)
 
@@ -134,8 +228,7 @@ class TestGit(unittest.TestCase):
         with self.subTest('When files is list'):
             files = [mimesis.File().file_name() for x in range(10)]
 
-            command = 'git --no-pager log -n 1 --pretty=oneline -- {0}'
-            command = command.format(' '.join(files))
+            command = base_command + ['--'] + files
 
             actual = self.git.latest_object(files)
 
@@ -145,8 +238,7 @@ class TestGit(unittest.TestCase):
         with self.subTest('When excludes is str'):
             exclude = mimesis.File().file_name()
 
-            command = 'git --no-pager log -n 1 --pretty=oneline ":(exclude){0}"'
-            command = command.format(exclude)
+            command = base_command + [':(exclude)%s' % exclude]
 
             actual = self.git.latest_object(excludes=exclude)
 
@@ -156,9 +248,8 @@ class TestGit(unittest.TestCase):
         with self.subTest('When excludes is list'):
             excludes = [mimesis.File().file_name() for x in range(10)]
 
-            git_excludes = ['":(exclude)%s"' % x for x in excludes]
-            command = 'git --no-pager log -n 1 --pretty=oneline {0}'
-            command = command.format(' '.join(git_excludes))
+            git_excludes = [':(exclude)%s' % x for x in excludes]
+            command = base_command + git_excludes
 
             actual = self.git.latest_object(excludes=excludes)
 
@@ -168,33 +259,222 @@ class TestGit(unittest.TestCase):
         with self.subTest('When files and excludes is list'):
             files = [mimesis.File().file_name() for x in range(10)]
             excludes = [mimesis.File().file_name() for x in range(10)]
-            git_excludes = ['":(exclude)%s"' % x for x in excludes]
-            command = 'git --no-pager log -n 1 --pretty=oneline -- {0} {1}'
-            command = command.format(' '.join(files), ' '.join(git_excludes))
+            git_excludes = [':(exclude)%s' % x for x in excludes]
+            command = base_command + ['--'] + files + git_excludes
 
             actual = self.git.latest_object(files, excludes)
 
             self.assertEqual(expect, actual)
             self.mock_run.assert_called_with(command, **self.RUN_OPTION)
 
+    def test_prefetch_latest_objects(self):
+        commits = [mimesis.Cryptographic.token_hex() for x in range(4)]
+        stdout = [
+            '\x01%s %s 1600000300' % (commits[0], commits[1]),
+            '',
+            'app/models/user.rb',
+            '\x01%s %s 1600000200' % (commits[1], commits[2]),
+            '',
+            'config/deploy.yml',
+            '\x01%s %s 1600000100' % (commits[2], commits[3]),
+            '',
+            'Dockerfile',
+            'config/database.yml',
+            '\x01%s  1600000000' % commits[3],
+            '',
+            'README.md',
+        ]
+        stdout = ('\n'.join(stdout) + '\n').encode('utf8')
+
+        def popen(command, **kwargs):
+            return MagicMock(
+                stdout=io.BytesIO(stdout),
+                returncode=0,
+                communicate=MagicMock(return_value=(b'', b'')))
+
+        self.mock_popen.side_effect = popen
+
+        pathspecs = [
+            (None, None),
+            ('app/', None),
+            (['config/', 'Dockerfile'], 'config/deploy.yml'),
+            ('*.md', None),
+            ('lib/', None),
+        ]
+
+        self.git.prefetch_latest_objects(pathspecs)
+        self.mock_run.reset_mock()
+
+        with self.subTest('When files and excludes is none'):
+            self.assertEqual(commits[0], self.git.latest_object())
+
+        with self.subTest('When files is str'):
+            self.assertEqual(commits[0], self.git.latest_object('app/'))
+
+        with self.subTest('When files and excludes'):
+            actual = self.git.latest_object(
+                ['config/', 'Dockerfile'], 'config/deploy.yml')
+            self.assertEqual(commits[2], actual)
+
+        with self.subTest('When files is glob'):
+            self.assertEqual(commits[3], self.git.latest_object('*.md'))
+
+        with self.subTest('When never modified'):
+            self.assertEqual('', self.git.latest_object('lib/'))
+
+        with self.subTest('Should walk history once'):
+            self.mock_popen.assert_called_once()
+            self.mock_run.assert_not_called()
+
+            command = self.mock_popen.call_args[0][0]
+            self.assertIn('--name-only', command)
+
+        with self.subTest('When walk failed'):
+            self.mock_popen.side_effect = None
+            self.mock_popen.return_value = MagicMock(
+                stdout=io.BytesIO(b''),
+                returncode=128,
+                communicate=MagicMock(return_value=(b'', b'fatal')))
+
+            self.git.prefetch_latest_objects([('db/', None)])
+
+            log = '%s %s' % (commits[1], mimesis.Text().text())
+            self.mock_run.return_value = \
+                StubProcess(stdout=log.encode('utf8'))
+
+            self.assertEqual(commits[1], self.git.latest_object('db/'))
+            self.mock_run.assert_called()
+
+    def test_tree_fingerprint(self):
+        objects = {
+            'HEAD:app': 'tree',
+            'HEAD:Dockerfile': 'blob',
+            'HEAD:config': 'tree',
+            'HEAD:config/database.yml': 'blob',
+        }
+        object_ids = {
+            x: mimesis.Cryptographic.token_hex() for x in objects.keys()}
+
+        def readline():
+            name = self.mock_popen.return_value.stdin.write.call_args[0][0]
+            name = name.decode('utf8').strip()
+            if name not in objects:
+                return ('%s missing\n' % name).encode('utf8')
+
+            result = '%s %s 10\n' % (object_ids[name], objects[name])
+            return result.encode('utf8')
+
+        self.mock_popen.return_value.stdout.readline.side_effect = readline
+
+        ls_tree = [
+            '100644 blob %s\tconfig/database.yml'
+            % object_ids['HEAD:config/database.yml'],
+            '100644 blob %s\tconfig/deploy.yml' % object_ids['HEAD:config'],
+        ]
+        self.mock_run.return_value = \
+            StubProcess(stdout='\n'.join(ls_tree).encode('utf8'))
+
+        with self.subTest('When resolve by object ids'):
+            actual = self.git.tree_fingerprint(['app/', 'Dockerfile'])
+
+            self.assertRegex(actual, r'^tree-[0-9a-f]{40}$')
+            self.assertEqual(
+                actual, self.git.tree_fingerprint(['Dockerfile', 'app']))
+            self.assertNotEqual(
+                actual, self.git.tree_fingerprint(['app/']))
+
+        with self.subTest('When missing'):
+            self.assertNotEqual(
+                self.git.tree_fingerprint(['lib/']),
+                self.git.tree_fingerprint(['db/']))
+
+        with self.subTest('When exclude inside dependency'):
+            self.mock_run.reset_mock()
+
+            actual = self.git.tree_fingerprint(
+                ['app/', 'config/'], ['config/deploy.yml'])
+
+            command = [
+                'git', '--no-pager', '-c', 'core.quotepath=off',
+                'ls-tree', '-r', '--full-tree', 'HEAD', '--', 'config']
+            self.mock_run.assert_called_once_with(command, **self.RUN_OPTION)
+
+            self.mock_run.return_value = \
+                StubProcess(stdout=ls_tree[0].encode('utf8'))
+            expect = self.git.tree_fingerprint(['app/', 'config/database.yml'])
+
+            self.assertEqual(expect, actual)
+
+    def test_cache(self):
+        head = mimesis.Cryptographic.token_hex()
+        self.mock_popen.return_value.stdout.readline.return_value = \
+            ('%s commit 240\n' % head).encode('utf8')
+
+        expect = mimesis.Cryptographic.token_hex()
+        log = '%s %s' % (expect, mimesis.Text().text())
+        diff = sorted('app/' + mimesis.File().file_name() for x in range(10))
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory)
+            git, other_git = Git(cache), Git(cache)
+
+            self.mock_run.return_value = \
+                StubProcess(stdout=log.encode('utf8'))
+            git.latest_object('app/', 'app/assets')
+            git.latest_log(expect)
+
+            self.mock_run.return_value = \
+                StubProcess(stdout='\n'.join(diff).encode('utf8'))
+            git.diff_files(expect, 'HEAD', 'app/')
+
+            with self.subTest('When same commit'):
+                self.mock_run.reset_mock()
+
+                self.assertEqual(
+                    expect, other_git.latest_object('app/', 'app/assets'))
+                self.assertEqual(log, other_git.latest_log(expect))
+                self.assertEqual(
+                    diff, other_git.diff_files(expect, 'HEAD', 'app/'))
+                self.mock_run.assert_not_called()
+
+            with self.subTest('When other pathspec'):
+                self.assertEqual(
+                    [], other_git.diff_files(expect, 'HEAD', 'lib/'))
+                self.mock_run.assert_not_called()
+
+            with self.subTest('When HEAD moved'):
+                self.mock_run.return_value = StubProcess(stdout=b'true')
+                moved_git = Git(cache)
+
+                self.mock_run.reset_mock()
+                self.mock_popen.return_value.stdout.readline.return_value = \
+                    ('%s commit 240\n' % expect).encode('utf8')
+                self.mock_run.return_value = \
+                    StubProcess(stdout=log.encode('utf8'))
+
+                moved_git.latest_object('app/', 'app/assets')
+                self.mock_run.assert_called_once()
+
+            self.assertEqual('git: 3 hits, 4 misses', cache.summary())
+            cache.close()
+
     def test_latest_log(self):
         git_object = mimesis.Cryptographic.token_hex()
         expect = '%s %s' % (git_object, mimesis.Text().text())
         self.mock_run.return_value = \
             StubProcess(stdout=expect.encode('utf8'))
+        base_command = ['git', '--no-pager', 'log', '-n', '1']
 
         with self.subTest('When files is none'):
-            command = 'git --no-pager log -n 1'
             actual = self.git.latest_log()
 
             self.assertEqual(expect, actual)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+            self.mock_run.assert_called_with(base_command, **self.RUN_OPTION)
 
         with self.subTest('When files is str'):
             file = mimesis.File().file_name()
 
-            command = 'git --no-pager log -n 1 {0}'
-            command = command.format(file)
+            command = base_command + [file]
 
             actual = self.git.latest_log(file)
 
@@ -204,8 +484,7 @@ class TestGit(unittest.TestCase):
         with self.subTest('When files is list'):
             files = [mimesis.File().file_name() for x in range(10)]
 
-            command = 'git --no-pager log -n 1 {0}'
-            command = command.format(' '.join(files))
+            command = base_command + files
 
             actual = self.git.latest_log(files)
 
@@ -215,90 +494,196 @@ class TestGit(unittest.TestCase):
     def test_diff(self):
         object_a = mimesis.Cryptographic.token_hex()
         object_b = mimesis.Cryptographic.token_hex()
-        expect = [mimesis.File().file_name() for x in range(10)]
+        changed_files = [
+            'app/models/user.rb',
+            'app/views/index.html',
+            'config/deploy.yml',
+            'config/database.yml',
+            'db/schema.rb',
+            'README.md',
+            '"doc/\\303\\251t\\303\\251.md"',
+        ]
 
         self.mock_run.return_value = \
-            StubProcess(stdout=('\n'.join(expect)).encode('utf8'))
-
-        with self.subTest('When files is str'):
-            file = mimesis.File().file_name()
-
-            actual = self.git.diff_files(object_a, object_b, file)
-            self.assertEqual(expect, actual)
-
-            command = 'git --no-pager diff --name-only {0}..{1} -- {2}'
-            command = command.format(object_a, object_b, file)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
-
-        with self.subTest('When files is list'):
-            files = [mimesis.File().file_name() for x in range(10)]
-
-            actual = self.git.diff_files(object_a, object_b, files)
-            self.assertEqual(expect, actual)
-
-            command = 'git --no-pager diff --name-only {0}..{1} -- {2}'
-            command = command.format(
-                object_a, object_b, ' '.join(files))
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
-
-        with self.subTest('When excludes is str'):
-            exclude = mimesis.File().file_name()
-            git_exclude = '":(exclude)%s"' % exclude
-            command = 'git --no-pager diff --name-only {0}..{1} {2}'
-            command = command.format(object_a, object_b, git_exclude)
+            StubProcess(stdout=('\n'.join(changed_files)).encode('utf8'))
+        command = [
+            'git', '--no-pager', 'diff', '--name-only', '--no-renames',
+            '{0}..{1}'.format(object_a, object_b)]
+
+        cases = [
+            ('When files is str', 'app/', None,
+             ['app/models/user.rb', 'app/views/index.html']),
+            ('When files is list', ['app/models', 'db/'], None,
+             ['app/models/user.rb', 'db/schema.rb']),
+            ('When files is glob', '*.rb', None,
+             ['app/models/user.rb', 'db/schema.rb']),
+            ('When files is quoted', 'doc', None, ['doc/\u00e9t\u00e9.md']),
+            ('When excludes is str', None, 'config/deploy.yml',
+             ['README.md', 'app/models/user.rb', 'app/views/index.html',
+              'config/database.yml', 'db/schema.rb', 'doc/\u00e9t\u00e9.md']),
+            ('When files and excludes is str', 'config/', 'config/deploy.yml',
+             ['config/database.yml']),
+            ('When files and excludes is list', ['app/', 'config/'],
+             ['app/views', ':(glob)config/*.yml'],
+             ['app/models/user.rb']),
+            ('When nothing matches', 'lib/', None, []),
+        ]
+
+        for name, files, excludes, expect in cases:
+            with self.subTest(name):
+                actual = self.git.diff_files(
+                    object_a, object_b, files, excludes)
+
+                self.assertEqual(expect, actual)
+
+        with self.subTest('When changed files are listed only once'):
+            calls = [x for x in self.mock_run.call_args_list
+                     if x == mock.call(command, **self.RUN_OPTION)]
+            self.assertEqual(1, len(calls))
+
+        with self.subTest('When pathspec is not supported'):
+            file = ':(attr:foo)app/'
+            expect = [mimesis.File().file_name() for x in range(10)]
+            self.mock_run.return_value = \
+                StubProcess(stdout=('\n'.join(expect)).encode('utf8'))
 
             actual = self.git.diff_files(
-                object_a, object_b, excludes=exclude)
+                object_a, object_b, file, 'app/views')
 
             self.assertEqual(expect, actual)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
-
-        with self.subTest('When excludes is list'):
-            excludes = [mimesis.File().file_name() for x in range(10)]
-            git_excludes = ['":(exclude)%s"' % x for x in excludes]
-            actual = self.git.diff_files(
-                object_a, object_b, excludes=excludes)
+            self.mock_run.assert_called_with(
+                ['git', '--no-pager', 'diff', '--name-only',
+                 '{0}..{1}'.format(object_a, object_b),
+                 '--', file, ':(exclude)app/views'],
+                **self.RUN_OPTION)
+
+    def test_deepen(self):
+        commit = mimesis.Cryptographic.token_hex()
+        found = ('%s commit 240\n' % commit).encode('utf8')
+        missing = ('%s^{commit} missing\n' % commit).encode('utf8')
+        readline = self.mock_popen.return_value.stdout.readline
+        fetch = ['git', 'fetch', '--quiet']
+        is_shallow = ['git', 'rev-parse', '--is-shallow-repository']
+
+        with self.subTest('When not shallow'):
+            readline.side_effect = [missing]
+
+            self.assertFalse(self.git.is_shallow)
+            self.assertFalse(self.git.deepen(commit, 100))
+
+        with self.subTest('When found after deepen'):
+            self.mock_run.return_value = StubProcess(stdout=b'true\ntrue')
+            git = Git()
+            self.assertTrue(git.is_shallow)
+
+            self.mock_run.reset_mock()
+            self.mock_run.return_value = StubProcess(stdout=b'true')
+            readline.side_effect = [missing, missing, found]
 
-            command = 'git --no-pager diff --name-only {0}..{1} {2}'
-            command = command.format(
-                object_a, object_b, ' '.join(git_excludes))
+            self.assertTrue(git.deepen(commit, 1000))
+            self.mock_run.assert_has_calls([
+                mock.call(fetch + ['--deepen=50'], **self.RUN_OPTION),
+                mock.call(is_shallow, **self.RUN_OPTION),
+                mock.call(fetch + ['--deepen=100'], **self.RUN_OPTION),
+                mock.call(is_shallow, **self.RUN_OPTION)])
 
-            self.assertEqual(expect, actual)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+        with self.subTest('When not found within limit'):
+            self.mock_run.return_value = StubProcess(stdout=b'true\ntrue')
+            git = Git()
 
-        with self.subTest('When files and excludes is str'):
-            file = mimesis.File().file_name()
-            exclude = mimesis.File().file_name()
+            self.mock_run.reset_mock()
+            self.mock_run.return_value = StubProcess(stdout=b'true')
+            readline.side_effect = [missing] * 3
 
-            command = 'git --no-pager diff --name-only {0}..{1} -- {2} ":(exclude){3}"'
-            command = command.format(
-                object_a,
-                object_b,
-                file,
-                exclude)
+            self.assertFalse(git.deepen(commit, 80))
+            self.mock_run.assert_has_calls([
+                mock.call(fetch + ['--deepen=50'], **self.RUN_OPTION),
+                mock.call(is_shallow, **self.RUN_OPTION),
+                mock.call(fetch + ['--deepen=30'], **self.RUN_OPTION),
+                mock.call(is_shallow, **self.RUN_OPTION)])
+            self.assertEqual(4, self.mock_run.call_count)
 
-            actual = self.git.diff_files(
-                object_a, object_b, file, exclude)
+        with self.subTest('When history is complete'):
+            self.mock_run.return_value = StubProcess(stdout=b'true\ntrue')
+            git = Git()
 
-            self.assertEqual(expect, actual)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+            self.mock_run.reset_mock()
+            self.mock_run.return_value = StubProcess(stdout=b'false')
+            readline.side_effect = [missing] * 2
 
-        with self.subTest('When files and excludes is list'):
-            files = [mimesis.File().file_name() for x in range(10)]
-            excludes = [mimesis.File().file_name() for x in range(10)]
-            git_excludes = ['":(exclude)%s"' % x for x in excludes]
-            actual = self.git.diff_files(
-                object_a, object_b, files, excludes)
-
-            command = 'git --no-pager diff --name-only {0}..{1} -- {2} {3}'
-            command = command.format(
-                object_a,
-                object_b,
-                ' '.join(files),
-                ' '.join(git_excludes))
+            self.assertFalse(git.deepen(commit, 1000))
+            self.assertFalse(git.is_shallow)
+            self.assertEqual(2, self.mock_run.call_count)
 
-            self.assertEqual(expect, actual)
-            self.mock_run.assert_called_with(command, **self.RUN_OPTION)
+    def test_diff_with_patch(self):
+        object_a = mimesis.Cryptographic.token_hex()
+        object_b = mimesis.Cryptographic.token_hex()
+        blob_a = mimesis.Cryptographic.token_hex()[:7]
+        blob_b = mimesis.Cryptographic.token_hex()[:7]
+        patch = '\n'.join([
+            'diff --git a/app/user.rb b/app/user.rb',
+            'index {0}..{1} 100644'.format(blob_a, blob_b),
+            '--- a/app/user.rb',
+            '+++ b/app/user.rb',
+            '@@ -1 +1 @@',
+            '-a',
+            '+b',
+        ])
+        raw = '\n'.join([
+            ':100644 100644 {0} {1} M\tapp/user.rb'.format(blob_a, blob_b),
+            ':000000 100644 0000000 {0} A\t"app/\\303\\251.rb"'.format(blob_b),
+        ])
+        command = [
+            'git', '--no-pager', '-c', 'core.quotepath=off', 'diff',
+            '--no-renames', '--patch-with-raw',
+            '{0}..{1}'.format(object_a, object_b),
+            '--', 'app/', ':(exclude)app/assets']
+
+        with self.subTest('When patch is not asked for'):
+            self.mock_run.reset_mock()
+            self.mock_run.return_value = \
+                StubProcess(stdout=b'app/user.rb\nREADME.md')
+
+            actual = self.git.diff(object_a, object_b, 'app/', 'app/assets')
+
+            self.assertEqual((['app/user.rb'], None), actual)
+            self.mock_run.assert_called_once_with(
+                ['git', '--no-pager', 'diff', '--name-only', '--no-renames',
+                 '{0}..{1}'.format(object_a, object_b)],
+                **self.RUN_OPTION)
+
+        with self.subTest('When patch is asked for'):
+            self.mock_run.reset_mock()
+            self.mock_run.return_value = \
+                StubProcess(stdout=(raw + '\n\n' + patch).encode('utf8'))
+
+            actual = self.git.diff(
+                object_a, object_b, 'app/', 'app/assets', patch=True)
+
+            self.assertEqual(
+                (['app/user.rb', 'app/\u00e9.rb'], patch), actual)
+            self.mock_run.assert_called_once_with(command, **self.RUN_OPTION)
+
+        with self.subTest('When nothing changed'):
+            self.mock_run.return_value = StubProcess(stdout=b'')
+
+            actual = self.git.diff(
+                object_a, object_b, 'app/', 'app/assets', patch=True)
+
+            self.assertEqual(([], ''), actual)
+
+        with self.subTest('When a file is not UTF-8'):
+            text = '\u65e5\u672c\u8a9e'
+            self.mock_run.return_value = StubProcess(
+                stdout=(raw + '\n\n').encode('utf8') +
+                patch.replace('+b', '+' + text).encode('shift_jis'))
+
+            actual = self.git.diff(
+                object_a, object_b, 'app/', 'app/assets', patch=True)
+
+            self.assertEqual(['app/user.rb', 'app/\u00e9.rb'], actual[0])
+            self.assertIn('\ufffd', actual[1])
+            self.assertNotIn(text, actual[1])
 
     def test_print_diff(self):
         object_a = mimesis.Cryptographic.token_hex()
@@ -307,12 +692,28 @@ class TestGit(unittest.TestCase):
 
         self.mock_run.return_value = \
             StubProcess(stdout=('\n'.join(expect)).encode('utf8'))
+        base_command = [
+            'git', '--no-pager', 'diff',
+            '{0}..{1}'.format(object_a, object_b)]
+
+        logger_patcher = mock.patch('deploy2ecscli.git.git.logger')
+        mock_logger = logger_patcher.start()
+        self.addCleanup(logger_patcher.stop)
+
+        with self.subTest('When not verbose'):
+            mock_logger.is_enabled.return_value = False
+            self.mock_run.reset_mock()
+
+            self.git.print_diff(object_a, object_b, 'app/')
+            self.mock_run.assert_not_called()
+            mock_logger.dump_diff.assert_not_called()
+
+        mock_logger.is_enabled.return_value = True
 
         with self.subTest('When files is str'):
             file = mimesis.File().file_name()
 
-            command = 'git --no-pager diff {0}..{1} -- {2}'
-            command = command.format(object_a, object_b, file)
+            command = base_command + ['--', file]
 
             self.git.print_diff(object_a, object_b, file)
             self.mock_run.assert_called_with(command, **self.RUN_OPTION)
@@ -320,18 +721,14 @@ class TestGit(unittest.TestCase):
         with self.subTest('When files is list'):
             files = [mimesis.File().file_name() for x in range(10)]
 
-            command = 'git --no-pager diff {0}..{1} -- {2}'
-            command = command.format(
-                object_a, object_b, ' '.join(files))
+            command = base_command + ['--'] + files
 
             self.git.print_diff(object_a, object_b, files)
             self.mock_run.assert_called_with(command, **self.RUN_OPTION)
 
         with self.subTest('When excludes is str'):
             exclude = mimesis.File().file_name()
-            git_exclude = '":(exclude)%s"' % exclude
-            command = 'git --no-pager diff {0}..{1} {2}'
-            command = command.format(object_a, object_b, git_exclude)
+            command = base_command + [':(exclude)%s' % exclude]
 
             self.git.print_diff(
                 object_a, object_b, excludes=exclude)
@@ -339,11 +736,9 @@ class TestGit(unittest.TestCase):
 
         with self.subTest('When excludes is list'):
             excludes = [mimesis.File().file_name() for x in range(10)]
-            git_excludes = ['":(exclude)%s"' % x for x in excludes]
+            git_excludes = [':(exclude)%s' % x for x in excludes]
 
-            command = 'git --no-pager diff {0}..{1} {2}'
-            command = command.format(
-                object_a, object_b, ' '.join(git_excludes))
+            command = base_command + git_excludes
 
             self.git.print_diff(
                 object_a, object_b, excludes=excludes)
@@ -353,12 +748,7 @@ class TestGit(unittest.TestCase):
             file = mimesis.File().file_name()
             exclude = mimesis.File().file_name()
 
-            command = 'git --no-pager diff {0}..{1} -- {2} ":(exclude){3}"'
-            command = command.format(
-                object_a,
-                object_b,
-                file,
-                exclude)
+            command = base_command + ['--', file, ':(exclude)%s' % exclude]
 
             self.git.print_diff(
                 object_a, object_b, file, exclude)
@@ -367,14 +757,9 @@ class TestGit(unittest.TestCase):
         with self.subTest('When files and excludes is list'):
             files = [mimesis.File().file_name() for x in range(10)]
             excludes = [mimesis.File().file_name() for x in range(10)]
-            git_excludes = ['":(exclude)%s"' % x for x in excludes]
-
-            command = 'git --no-pager diff {0}..{1} -- {2} {3}'
-            command = command.format(
-                object_a,
-                object_b,
-                ' '.join(files),
-                ' '.join(git_excludes))
+            git_excludes = [':(exclude)%s' % x for x in excludes]
+
+            command = base_command + ['--'] + files + git_excludes
 
             self.git.print_diff(
                 object_a, object_b, files, excludes)
@@ -0,0 +1,405 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+
+import unittest
+from unittest import mock
+
+from deploy2ecscli.git.git import Git
+from deploy2ecscli.git.native import Repository
+from deploy2ecscli.git.pathspec import Pathspec
+
+
+PATHS = [
+    'app/models/user.rb',
+    'app/models/post.rb',
+    'app/views/index.html',
+    'app/assets/app.js',
+    'application.rb',
+    'config/deploy.yml',
+    'config/database.yml',
+    'config/deploy/production.rb',
+    'lib/tasks/db.rake',
+    'lib/foo[1]/z.rb',
+    'doc/été.md',
+    'doc/with space.txt',
+    'Dockerfile',
+    'README.md',
+]
+
+PATHSPECS = [
+    ([], []),
+    (['app/'], []),
+    (['app'], []),
+    (['app/models/user.rb'], []),
+    (['app/'], ['app/assets']),
+    (['app/', 'config/'], ['config/deploy', 'config/deploy.yml']),
+    (['*.rb'], []),
+    ([':(glob)app/*/*.rb'], []),
+    (['config/*.yml'], []),
+    (['lib/', 'Dockerfile'], []),
+    (['lib/foo[1]'], []),
+    ([':(glob)lib/foo[1]/*'], []),
+    ([], ['lib/foo[1]']),
+    ([':(icase)readme.MD'], []),
+    (['doc/é*'], []),
+    (['vendor/sub'], []),
+    (['nothing/'], []),
+    ([], ['app', 'config']),
+]
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class TestRepository(unittest.TestCase):
+    '''Compare answers of the native reader with the git CLI on synthetic
+    repositories.
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        self.path = os.path.join(self.directory.name, 'origin')
+        os.makedirs(self.path)
+
+        self.git('init', '-q')
+        self.git('symbolic-ref', 'HEAD', 'refs/heads/main')
+        self.commits = self.build_history(random.Random(20200101), 60)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def git(self, *args, path: str = None, input: bytes = None, env=None) -> str:
+        environ = dict(os.environ)
+        environ.update(env or {})
+        environ.update({
+            'GIT_AUTHOR_NAME': 'test',
+            'GIT_AUTHOR_EMAIL': 'test@example.com',
+            'GIT_COMMITTER_NAME': 'test',
+            'GIT_COMMITTER_EMAIL': 'test@example.com',
+        })
+
+        proc = subprocess.run(
+            ['git'] + list(args),
+            cwd=path or self.path,
+            input=input,
+            env=environ,
+            stdout=subprocess.PIPE,
+            check=True)
+
+        return proc.stdout.decode('utf8').strip()
+
+    def build_history(self, rng: random.Random, count: int) -> list:
+        commits = []
+        trees = {}
+        current = None
+        date = 1600000000
+        for index in range(count):
+            if current is None:
+                self.git('read-tree', '--empty')
+            else:
+                self.git('read-tree', current)
+
+            for path in rng.sample(PATHS, rng.randint(1, 3)):
+                if rng.random() < 0.15:
+                    self.git('update-index', '--force-remove', path)
+                    continue
+
+                content = ('%s %d\n' % (path, rng.randint(0, 3))) * 20
+                blob = self.git('hash-object', '-w', '--stdin',
+                                input=content.encode('utf8'))
+                mode = '100755' if rng.random() < 0.1 else '100644'
+                self.git('update-index', '--add', '--cacheinfo',
+                         '%s,%s,%s' % (mode, blob, path))
+
+            if rng.random() < 0.1:
+                self.git('update-index', '--add', '--cacheinfo',
+                         '160000,%040x,vendor/sub' % rng.getrandbits(160))
+
+            tree = self.git('write-tree')
+            parents = [current] if current else []
+            if commits and rng.random() < 0.3:
+                other = rng.choice(commits)
+                if other not in parents:
+                    parents.append(other)
+                    # TREESAME to one side, or a resolution of both
+                    tree = rng.choice(
+                        [tree, trees[other], trees[parents[0]]])
+
+            # Clock skew and equal dates included
+            date += rng.choice([-120, 0, 60, 60, 60, 3600])
+            arguments = ['commit-tree', tree, '-m', str(index)]
+            for parent in parents:
+                arguments += ['-p', parent]
+
+            current = self.git(*arguments, env={
+                'GIT_AUTHOR_DATE': '%d +0000' % date,
+                'GIT_COMMITTER_DATE': '%d +0000' % date})
+            commits.append(current)
+            trees[current] = tree
+
+            if rng.random() < 0.2:
+                # Continue from an older commit, leaving a branch behind
+                self.git('update-ref', 'refs/heads/b%d' % index, current)
+                current = rng.choice(commits)
+
+        self.git('update-ref', 'refs/heads/main', current)
+        self.git('tag', '-a', 'v1', '-m', 'v1', commits[count // 2])
+
+        return commits
+
+    def open(self, path: str = None) -> Repository:
+        path = path or self.path
+        git_directory = os.path.join(path, '.git')
+        repository = Repository(git_directory, git_directory)
+        self.addCleanup(repository.close)
+
+        return repository
+
+    def assert_same_as_cli(self, path: str = None) -> None:
+        path = path or self.path
+        repository = self.open(path)
+        self.assertTrue(repository.supported)
+
+        for files, excludes in PATHSPECS:
+            with self.subTest(files=files, excludes=excludes):
+                pathspec = Pathspec(files, excludes) \
+                    if files or excludes else None
+                arguments = ['log', '-n', '1', '--pretty=%H']
+                if files or excludes:
+                    arguments += ['--'] + files + \
+                        [':(exclude)%s' % x for x in excludes]
+
+                expect = self.git(*arguments, path=path)
+                self.assertEqual(expect, repository.latest_commit(pathspec))
+
+        heads = self.git('rev-list', '--all', path=path).splitlines()
+        names = ['HEAD', 'HEAD^{commit}', 'HEAD^{tree}', 'HEAD:', 'HEAD:app',
+                 'HEAD:app/models/user.rb', 'HEAD:vendor/sub',
+                 'HEAD:missing', 'refs/heads/main', 'refs/tags/v1',
+                 'refs/tags/v1^{commit}', 'refs/tags/v1^{}', '0' * 40]
+        names += heads[:10] + ['%s:config' % x for x in heads[:10]]
+
+        proc = subprocess.run(
+            ['git', 'cat-file', '--batch-check'],
+            cwd=path,
+            input='\n'.join(names).encode('utf8') + b'\n',
+            stdout=subprocess.PIPE,
+            check=True)
+        for name, line in zip(names, proc.stdout.decode('utf8').splitlines()):
+            with self.subTest(name=name):
+                expect = None
+                if not line.endswith(' missing'):
+                    expect = tuple(line.split()[:2])
+
+                self.assertEqual(expect, repository.resolve(name))
+
+        os.chdir(path)
+        native_git, cli_git = Git(native=True), Git()
+        self.addCleanup(native_git.close)
+        self.addCleanup(cli_git.close)
+        for files, excludes in PATHSPECS:
+            with self.subTest('tree_fingerprint', files=files, excludes=excludes):
+                self.assertEqual(
+                    cli_git.tree_fingerprint(files, excludes),
+                    native_git.tree_fingerprint(files, excludes))
+                self.assertEqual(
+                    cli_git.latest_object(files, excludes),
+                    native_git.latest_object(files, excludes))
+
+        # Answered by the single history walk, not by `git log -n 1`
+        prefetch_git = Git()
+        self.addCleanup(prefetch_git.close)
+        prefetch_git.prefetch_latest_objects(PATHSPECS)
+        with mock.patch.object(
+                prefetch_git, '_Git__log_latest_object',
+                side_effect=AssertionError('Not prefetched')):
+            for files, excludes in PATHSPECS:
+                with self.subTest('prefetch_latest_objects',
+                                  files=files, excludes=excludes):
+                    self.assertEqual(
+                        cli_git.latest_object(files, excludes),
+                        prefetch_git.latest_object(files, excludes))
+
+    def test_loose_objects(self):
+        self.assert_same_as_cli()
+
+    def test_packed_objects(self):
+        self.git('repack', '-a', '-d', '-f', '--depth=50', '--window=50', '-q')
+        self.git('pack-refs', '--all')
+        self.git('prune-packed')
+
+        self.assert_same_as_cli()
+
+    def test_commit_graph(self):
+        self.git('repack', '-a', '-d', '-q')
+
+        with self.subTest('When single file'):
+            self.git('commit-graph', 'write', '--reachable')
+            self.assert_same_as_cli()
+
+        with self.subTest('When split chain'):
+            self.git('update-ref', 'refs/heads/main', self.commits[-1])
+            self.git('commit-graph', 'write', '--reachable', '--split',
+                     '--size-multiple=1000')
+            self.assert_same_as_cli()
+
+    def test_corrupt_objects(self):
+        with self.subTest('When packed object has unknown type'):
+            self.git('repack', '-a', '-d', '-q')
+            self.git('prune-packed')
+
+            head = self.git('rev-parse', 'HEAD')
+            pack_directory = os.path.join(self.path, '.git', 'objects', 'pack')
+            name = next(x for x in os.listdir(pack_directory)
+                        if x.endswith('.idx'))
+            with open(os.path.join(pack_directory, name), 'rb') as f:
+                entries = self.git('show-index', input=f.read()).splitlines()
+
+            offset = next(int(x.split()[0]) for x in entries if head in x)
+            path = os.path.join(pack_directory, name[:-len('.idx')] + '.pack')
+            os.chmod(path, 0o644)
+            with open(path, 'r+b') as f:
+                f.seek(offset)
+                byte = f.read(1)[0]
+                f.seek(offset)
+                # Type 5 is reserved
+                f.write(bytes([(byte & 0x8f) | (5 << 4)]))
+
+            with self.assertRaises(ValueError):
+                self.open().resolve('HEAD^{tree}')
+
+        with self.subTest('When loose object is not zlib'):
+            tree = self.git('write-tree')
+            head = self.git('commit-tree', tree, '-m', 'loose')
+            self.git('update-ref', 'refs/heads/main', head)
+
+            path = os.path.join(self.path, '.git', 'objects', head[:2], head[2:])
+            os.chmod(path, 0o644)
+            with open(path, 'wb') as f:
+                f.write(b'not zlib')
+
+            with self.assertRaises(ValueError):
+                self.open().resolve('HEAD^{tree}')
+
+    def test_shallow_clone(self):
+        path = os.path.join(self.directory.name, 'shallow')
+        self.git('clone', '-q', '--no-checkout', '--depth', '5',
+                 'file://' + self.path, path, path=self.directory.name)
+
+        self.assert_same_as_cli(path)
+
+    def test_merge_resolving_conflict(self):
+        self.git('read-tree', '--empty')
+        base = self.commit({'app/a.rb': 'base', 'lib/b.rb': 'base'}, [], 1)
+        side = self.commit({'app/a.rb': 'side', 'lib/b.rb': 'base'}, [base], 2)
+        main = self.commit({'app/a.rb': 'main', 'lib/b.rb': 'main'}, [base], 3)
+        # Resolved inside app/, lib/ taken from main
+        merge = self.commit(
+            {'app/a.rb': 'resolved', 'lib/b.rb': 'main'}, [main, side], 4)
+        self.git('update-ref', 'refs/heads/main', merge)
+
+        os.chdir(self.path)
+        git = Git()
+        self.addCleanup(git.close)
+        git.prefetch_latest_objects([('app/', None), ('lib/', None)])
+
+        self.assertEqual(merge, git.latest_object('app/'))
+        self.assertEqual(main, git.latest_object('lib/'))
+
+        self.assert_same_as_cli()
+
+    def test_many_merges(self):
+        head = self.commit({'app/a.rb': '0', 'lib/b.rb': '0'}, [], 0)
+        for index in range(1, 41):
+            files = {'app/a.rb': '0', 'lib/b.rb': '0'}
+            files['lib/%d.rb' % index] = str(index)
+            side = self.commit(files, [head], index * 2)
+            head = self.commit(files, [head, side], index * 2 + 1)
+        self.git('update-ref', 'refs/heads/main', head)
+
+        os.chdir(self.path)
+        git = Git()
+        self.addCleanup(git.close)
+        pathspecs = [('app/', None), ('lib/3.rb', None), (None, 'lib')]
+        expect = [
+            self.git('log', '-n', '1', '--pretty=%H', '--', 'app/'),
+            self.git('log', '-n', '1', '--pretty=%H', '--', 'lib/3.rb'),
+            self.git('log', '-n', '1', '--pretty=%H', '--', ':(exclude)lib'),
+        ]
+
+        with mock.patch('subprocess.run', side_effect=AssertionError), \
+                mock.patch('subprocess.Popen', wraps=subprocess.Popen) \
+                as mock_popen:
+            git.prefetch_latest_objects(pathspecs)
+
+            self.assertEqual(
+                expect, [git.latest_object(*x) for x in pathspecs])
+            # A history stream and a single diff-tree for every merge
+            self.assertEqual(2, mock_popen.call_count)
+
+    def test_absolute_paths(self):
+        os.makedirs(os.path.join(self.path, 'app'), exist_ok=True)
+        os.chdir(os.path.join(self.path, 'app'))
+        pathspecs = [
+            ([os.path.join(self.path, 'app') + '/'], []),
+            ([os.path.join(self.path, 'config')],
+             [os.path.join(self.path, 'config/deploy')]),
+            ([self.path], [os.path.join(self.path, 'lib')]),
+        ]
+
+        native_git, cli_git = Git(native=True), Git()
+        self.addCleanup(native_git.close)
+        self.addCleanup(cli_git.close)
+        cli_git.prefetch_latest_objects(pathspecs)
+        for files, excludes in pathspecs:
+            with self.subTest(files=files, excludes=excludes):
+                expect = self.git(
+                    'log', '-n', '1', '--pretty=%H', '--', *files,
+                    *[':(exclude)%s' % x for x in excludes])
+
+                self.assertNotEqual('', expect)
+                self.assertEqual(expect, cli_git.latest_object(files, excludes))
+                self.assertEqual(
+                    expect, native_git.latest_object(files, excludes))
+
+                expect = self.git(
+                    '-c', 'core.quotepath=off', 'diff', '--name-only',
+                    '%s..HEAD' % self.commits[0],
+                    '--', *files, *[':(exclude)%s' % x for x in excludes])
+                self.assertEqual(
+                    expect.splitlines(),
+                    cli_git.diff_files(
+                        self.commits[0], 'HEAD', files, excludes))
+
+    def commit(self, files: dict, parents: list, date: int) -> str:
+        self.git('read-tree', '--empty')
+        for path, content in files.items():
+            blob = self.git('hash-object', '-w', '--stdin',
+                            input=content.encode('utf8'))
+            self.git('update-index', '--add', '--cacheinfo',
+                     '100644,%s,%s' % (blob, path))
+
+        arguments = ['commit-tree', self.git('write-tree'), '-m', str(date)]
+        for parent in parents:
+            arguments += ['-p', parent]
+
+        date = '%d +0000' % (1700000000 + date * 60)
+        return self.git(*arguments, env={
+            'GIT_AUTHOR_DATE': date, 'GIT_COMMITTER_DATE': date})
+
+    def test_unsupported(self):
+        self.git('replace', self.commits[-1], self.commits[-2])
+
+        repository = self.open()
+
+        self.assertFalse(repository.supported)
+        self.assertIsNone(repository.resolve('HEAD'))
+        self.assertIsNone(repository.latest_commit(Pathspec('app/')))
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- mode: python -*-
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+
+import unittest
+
+from deploy2ecscli.git.pathspec import Pathspec
+from deploy2ecscli.git.pathspec import PathspecItem
+from deploy2ecscli.git.pathspec import PathTrie
+
+
+class TestPathspecItem(unittest.TestCase):
+    def test_match(self):
+        test_cases = [
+            ('app', 'app', True),
+            ('app', 'app/models/user.rb', True),
+            ('app', 'application.rb', False),
+            ('app/', 'app/models/user.rb', True),
+            ('app/', 'app', False),
+            ('./app', 'app/models/user.rb', True),
+            ('.', 'app/models/user.rb', True),
+            ('*.rb', 'app/models/user.rb', True),
+            ('app/*.rb', 'app/models/user.rb', True),
+            ('app/?', 'app/x/user.rb', False),
+            ('app/[mc]odels*', 'app/models/user.rb', True),
+            ('app/[mc]odels', 'app/models/user.rb', False),
+            ('app/[mc]odels', 'app/[mc]odels/user.rb', True),
+            ('app/[mc]odels', 'app/[mc]odels', True),
+            (':(glob)app/*', 'app/*/user.rb', True),
+            ('app/[mc]odels/*', 'app/[mc]odels/user.rb', True),
+            ('app/[mc]odels/*', 'app/[mc]odels/x/user.rb', False),
+            ('*.rb', 'Gemfile', False),
+            (':(glob)app/*.rb', 'app/models/user.rb', False),
+            (':(glob)app/*.rb', 'app/user.rb', True),
+            (':(glob)app/**/*.rb', 'app/models/user.rb', True),
+            (':(glob)**/user.rb', 'app/models/user.rb', True),
+            (':(literal)app/*.rb', 'app/*.rb', True),
+            (':(literal)app/*.rb', 'app/user.rb', False),
+            (':(icase)APP', 'app/models/user.rb', True),
+        ]
+
+        for pattern, path, expect in test_cases:
+            with self.subTest('When %s matches %s' % (pattern, path)):
+                self.assertEqual(expect, PathspecItem(pattern).match(path))
+
+    def test_exclude(self):
+        for pattern in [':(exclude)app', ':!app', ':^app']:
+            with self.subTest('When %s' % pattern):
+                item = PathspecItem(pattern)
+                self.assertTrue(item.exclude)
+                self.assertTrue(item.match('app/models/user.rb'))
+
+    def test_prefix(self):
+        with self.subTest('When relative'):
+            item = PathspecItem('models', prefix='app/')
+            self.assertTrue(item.match('app/models/user.rb'))
+            self.assertFalse(item.match('models/user.rb'))
+
+        with self.subTest('When parent directory'):
+            item = PathspecItem('../lib', prefix='app/')
+            self.assertTrue(item.match('lib/tasks/db.rake'))
+
+        with self.subTest('When top'):
+            item = PathspecItem(':/lib', prefix='app/')
+            self.assertTrue(item.match('lib/tasks/db.rake'))
+
+        with self.subTest('When outside repository'):
+            with self.assertRaises(ValueError):
+                PathspecItem('../../lib', prefix='app/')
+
+        with self.subTest('When absolute'):
+            item = PathspecItem('/repo/lib/', prefix='app/', top='/repo')
+            self.assertEqual('lib', item.pattern)
+            self.assertTrue(item.directory)
+            self.assertTrue(item.match('lib/tasks/db.rake'))
+            self.assertEqual('', PathspecItem('/repo', top='/repo').pattern)
+
+        with self.subTest('When absolute outside repository'):
+            for top in ['/repo', None]:
+                with self.assertRaises(ValueError):
+                    PathspecItem('/other/lib', top=top)
+
+    def test_unsupported_magic(self):
+        with self.assertRaises(ValueError):
+            PathspecItem(':(attr:foo)app')
+
+
+class TestPathspec(unittest.TestCase):
+    def test_match(self):
+        pathspec = Pathspec(
+            ['app/', 'config/', 'Dockerfile'],
+            ['config/deploy', 'config/deploy.yml'])
+
+        self.assertTrue(pathspec.match('app/models/user.rb'))
+        self.assertTrue(pathspec.match('config/database.yml'))
+        self.assertTrue(pathspec.match('Dockerfile'))
+        self.assertFalse(pathspec.match('config/deploy.yml'))
+        self.assertFalse(pathspec.match('config/deploy/production.rb'))
+        self.assertFalse(pathspec.match('README.md'))
+
+    def test_match_when_only_excludes(self):
+        pathspec = Pathspec(excludes='docs')
+
+        self.assertTrue(pathspec.match('app/models/user.rb'))
+        self.assertFalse(pathspec.match('docs/index.md'))
+
+    def test_match_any(self):
+        pathspec = Pathspec('app/')
+
+        self.assertEqual(
+            'app/models/user.rb',
+            pathspec.match_any(['README.md', 'app/models/user.rb']))
+        self.assertIsNone(pathspec.match_any(['README.md']))
+
+    def test_filter(self):
+        paths = [
+            'Dockerfile',
+            'README.md',
+            'app/models/user.rb',
+            'app/views/index.html',
+            'application.rb',
+            'config/database.yml',
+            'config/deploy.yml',
+            'config/deploy/production.rb',
+        ]
+
+        cases = [
+            (['app/', 'Dockerfile'], ['app/views'],
+             ['Dockerfile', 'app/models/user.rb']),
+            ('app', None,
+             ['app/models/user.rb', 'app/views/index.html']),
+            ('app*', None,
+             ['app/models/user.rb', 'app/views/index.html', 'application.rb']),
+            ('config/*.yml', 'config/deploy*',
+             ['config/database.yml']),
+            (':(icase)readme.MD', None, ['README.md']),
+            (None, ['app', 'config'],
+             ['Dockerfile', 'README.md', 'application.rb']),
+            ('lib/', None, []),
+        ]
+
+        trie = PathTrie(paths)
+        for files, excludes, expect in cases:
+            with self.subTest(files=files, excludes=excludes):
+                pathspec = Pathspec(files, excludes)
+
+                self.assertEqual(expect, pathspec.filter(trie))
+                self.assertEqual(expect, pathspec.filter(paths))
+                self.assertEqual(
+                    expect, [x for x in paths if pathspec.match(x)])
+
+    def test_may_match_under(self):
+        pathspec = Pathspec(
+            ['app/', 'lib/mo*', ':(icase)Doc'],
+            ['app/assets', 'config'])
+
+        self.assertTrue(pathspec.may_match_under('app'))
+        self.assertTrue(pathspec.may_match_under('app/models'))
+        self.assertFalse(pathspec.may_match_under('app/assets'))
+        self.assertFalse(pathspec.may_match_under('app/assets/images'))
+        self.assertTrue(pathspec.may_match_under('lib'))
+        self.assertTrue(pathspec.may_match_under('lib/models'))
+        self.assertTrue(pathspec.may_match_under('lib/mo'))
+        self.assertTrue(pathspec.may_match_under('DOC'))
+        self.assertFalse(pathspec.may_match_under('config'))
+        self.assertFalse(Pathspec('app/').may_match_under('lib'))
+        self.assertFalse(Pathspec('lib/mo*').may_match_under('lib/views'))
+        self.assertTrue(Pathspec(excludes='app').may_match_under('lib'))
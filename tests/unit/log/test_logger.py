@@ -297,6 +297,38 @@ class TestLogger(unittest.TestCase):
                 logger.dump_aws_request('ecs', 'image-list', response={ 'key': 'name', 'list': [1, 2, 3, 4, 5] })
                 mock_cprint.assert_called()
 
+    def test_add_secret(self):
+        secret = mimesis.Cryptographic.token_hex() + '"'
+        logger = Logger(LogLevel.VERBOSE)
+        logger.add_secret(secret)
+        logger.add_secret('')
+
+        with mock.patch('deploy2ecscli.log.logger.cprint') as mock_cprint:
+            logger.info('token is %s' % secret)
+            logger.dump_json({'token': secret})
+            logger.dump_diff('+token: %s' % secret)
+            logger.dump_aws_request('ecs', 'run-task', body={'token': secret})
+
+        printed = ' '.join(str(x) for x in mock_cprint.call_args_list)
+        self.assertIn(Logger.MASK, printed)
+        self.assertNotIn(secret[:-1], printed)
+
+        with self.subTest('When value is short'):
+            logger = Logger(LogLevel.VERBOSE)
+            logger.add_secret('1')
+            logger.add_secret('ab"')
+
+            with mock.patch('deploy2ecscli.log.logger.cprint') as mock_cprint:
+                logger.info('build 1 of 10, password=1')
+                logger.dump_json({'token': 'ab"', 'id': 'abc'})
+
+            printed = ' '.join(str(x) for x in mock_cprint.call_args_list)
+            self.assertIn(
+                'build %s of 10, password=%s' % (Logger.MASK, Logger.MASK),
+                printed)
+            self.assertNotIn('ab\\\\"', printed)
+            self.assertIn('abc', printed)
+
     def __test_cprint(self, logger_level: LogLevel, should_print: bool, func: str):
         logger = Logger(logger_level)
         color = None
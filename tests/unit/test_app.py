@@ -1,4 +1,5 @@
 import sys
+import yaml
 import argparse
 import contextlib
 import unittest
@@ -9,24 +10,30 @@ from contextlib import ExitStack
 
 import mimesis
 
+from botocore.exceptions import NoRegionError
+
 from deploy2ecscli.app import App
 
 import deploy2ecscli.app
+from deploy2ecscli.exceptions import PreflightFailedException
 from deploy2ecscli.log.logger import Level as LogLevel
 
 
 class TestApp(unittest.TestCase):
     def setup_default_mocks(self, stack):
         stack.enter_context(mock.patch('deploy2ecscli.app.logger'))
-        stack.enter_context(mock.patch('deploy2ecscli.app.open'))
         stack.enter_context(mock.patch('deploy2ecscli.app.AwsClient'))
 
         git = stack.enter_context(mock.patch('deploy2ecscli.app.Git'))
         git = git.return_value
         git.current_branch = mimesis.Person().username()
 
-        mock_yaml_load = stack.enter_context(mock.patch('yaml.load'))
-        mock_yaml_load.return_value = {}
+        self.setup_config_file(stack, {})
+
+    def setup_config_file(self, stack, configs):
+        stack.enter_context(mock.patch(
+            'deploy2ecscli.app.open',
+            mock.mock_open(read_data=yaml.dump(configs))))
 
     def setup_usecase_mocks(self, stack):
         mock_build_image = \
@@ -41,6 +48,15 @@ class TestApp(unittest.TestCase):
 
         return (mock_build_image, mock_register_task_definition, mock_register_service)
 
+    def setup_config(self, stack):
+        self.setup_config_file(stack, {
+            '.*': {
+                'images': [],
+                'task_definitions': [],
+                'services': []
+            }
+        })
+
     def test_run(self):
         exec_prog = sys.argv[0]
 
@@ -147,6 +163,256 @@ class TestApp(unittest.TestCase):
                 mock_register_task_definition.return_value.execute.assert_not_called()
                 mock_register_service.return_value.execute.assert_not_called()
 
+        with self.subTest('When use cache'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                cache_dir = mimesis.Path().project_dir()
+                test_args = [
+                    exec_prog,
+                    '--config', mimesis.File().file_name(),
+                    '--cache-dir', cache_dir]
+
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                mock_disk_cache = stack.enter_context(
+                    mock.patch('deploy2ecscli.app.DiskCache'))
+                git = stack.enter_context(mock.patch('deploy2ecscli.app.Git'))
+                git.return_value.current_branch = mimesis.Person().username()
+                mock_loader = stack.enter_context(
+                    mock.patch('deploy2ecscli.app.ApplicationLoader'))
+                mock_loader.return_value.load.return_value = None
+
+                App().run()
+
+                mock_disk_cache.assert_called_with(cache_dir)
+                git.assert_called_with(mock_disk_cache.return_value, native=False)
+                mock_loader.assert_called_with(mock_disk_cache.return_value)
+                mock_loader.return_value.load.assert_called_with(
+                    mock.ANY, git.return_value.current_branch)
+                git.return_value.close.assert_called()
+                mock_disk_cache.return_value.close.assert_called()
+
+        with self.subTest('When config is a directory'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                config_dir = mimesis.Path().project_dir()
+                paths = [mimesis.File().file_name() for x in range(3)]
+                test_args = [exec_prog, '--config', config_dir]
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                mock_loader = stack.enter_context(
+                    mock.patch('deploy2ecscli.app.ApplicationLoader'))
+                mock_loader.find.return_value = paths
+                mock_loader.return_value.load_all.return_value = None
+
+                App().run()
+
+                mock_loader.find.assert_called_with(config_dir)
+                mock_loader.return_value.load_all.assert_called_with(
+                    paths, deploy2ecscli.app.Git.return_value.current_branch)
+                mock_loader.return_value.load.assert_not_called()
+
+        with self.subTest('When config directory has no config files'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                config_dir = mimesis.Path().project_dir()
+                test_args = [exec_prog, '--config', config_dir]
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                mock_loader = stack.enter_context(
+                    mock.patch('deploy2ecscli.app.ApplicationLoader'))
+                mock_loader.find.return_value = []
+                mock_sys = stack.enter_context(
+                    mock.patch.object(argparse, '_sys'))
+                mock_sys.argv = test_args
+                mock_sys.exit = sys.exit
+
+                with self.assertRaises(SystemExit) as cm:
+                    App().run()
+
+                self.assertEqual(2, cm.exception.code)
+                self.assertIn(
+                    'no config files match %s' % config_dir,
+                    str(mock_sys.stderr.write.call_args_list))
+                mock_loader.return_value.load_all.assert_not_called()
+
+        with self.subTest('When use native git'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                test_args = [
+                    exec_prog,
+                    '--config', mimesis.File().file_name(),
+                    '--native-git']
+
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                git = stack.enter_context(mock.patch('deploy2ecscli.app.Git'))
+                git.return_value.current_branch = mimesis.Person().username()
+
+                App().run()
+
+                git.assert_called_with(None, native=True)
+
+        with self.subTest('When jobs are given'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                test_args = [
+                    exec_prog,
+                    'build-image',
+                    '--config', mimesis.File().file_name(),
+                    '--jobs', '4']
+
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                mock_build_image, _, _ = self.setup_usecase_mocks(stack)
+                self.setup_config(stack)
+
+                App().run()
+
+                self.assertEqual(4, mock_build_image.call_args[0][-1])
+
+        with self.subTest('When branch is given'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                branch = mimesis.Person().username()
+                test_args = [
+                    exec_prog,
+                    '--config', mimesis.File().file_name(),
+                    '--branch', branch]
+
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                mock_build_image, _, _ = self.setup_usecase_mocks(stack)
+
+                self.setup_config_file(stack, {
+                    branch: {
+                        'images': [],
+                        'task_definitions': [],
+                        'services': []
+                    }
+                })
+
+                App().run()
+
+                mock_build_image.return_value.execute.assert_called()
+
+        for args in [[], ['prepare-repo']]:
+            with self.subTest('When no region is configured %s' % args):
+                with ExitStack() as stack:
+                    self.setup_default_mocks(stack)
+
+                    test_args = [exec_prog] + args + \
+                        ['-c', mimesis.File().file_name()]
+                    stack.enter_context(
+                        mock.patch.object(sys, 'argv', test_args))
+
+                    mock_aws_client = stack.enter_context(
+                        mock.patch('deploy2ecscli.app.AwsClient'))
+                    mock_aws_client.side_effect = NoRegionError()
+                    stack.enter_context(mock.patch(
+                        'deploy2ecscli.app.usecases.PrepareRepositoryUseCase'))
+                    if args:
+                        self.setup_config(stack)
+
+                    App().run()
+
+                    mock_aws_client.assert_not_called()
+
+        config_file = mimesis.File().file_name()
+        prepare_repo_args_set = [
+            (True, ['prepare-repo', '-c', config_file], [False, False, False]),
+            (True, ['build-image', '-c', config_file, '--prepare-repo'],
+             [True, False, False]),
+            (True, ['-c', config_file, '--prepare-repo'], [True, True, True]),
+            (False, ['register-service', '-c', config_file, '--prepare-repo'],
+             [False, False, True]),
+            (False, ['-c', config_file], [True, True, True]),
+        ]
+
+        for prepare_repo, args, executed in prepare_repo_args_set:
+            with self.subTest('When %s' % args):
+                with ExitStack() as stack:
+                    self.setup_default_mocks(stack)
+
+                    test_args = [exec_prog] + args
+                    stack.enter_context(
+                        mock.patch.object(sys, 'argv', test_args))
+
+                    mock_prepare_repository = \
+                        stack.enter_context(mock.patch(
+                            'deploy2ecscli.app.usecases.PrepareRepositoryUseCase'))
+                    usecase_mocks = self.setup_usecase_mocks(stack)
+                    self.setup_config(stack)
+
+                    App().run()
+
+                    self.assertEqual(
+                        prepare_repo,
+                        mock_prepare_repository.return_value.execute.called)
+                    self.assertEqual(
+                        executed,
+                        [x.return_value.execute.called for x in usecase_mocks])
+
+        preflight_args_set = [
+            (['prepare-repo'], None),
+            (['build-image'], (True, False)),
+            (['register-task-definition'], (False, True)),
+            (['register-service'], (False, True)),
+            ([], (True, True)),
+        ]
+
+        for args, flags in preflight_args_set:
+            with self.subTest('When preflight %s' % args):
+                with ExitStack() as stack:
+                    self.setup_default_mocks(stack)
+
+                    test_args = [exec_prog] + args + ['-c', config_file]
+                    stack.enter_context(
+                        mock.patch.object(sys, 'argv', test_args))
+
+                    stack.enter_context(mock.patch(
+                        'deploy2ecscli.app.usecases.PrepareRepositoryUseCase'))
+                    self.setup_usecase_mocks(stack)
+                    self.setup_config(stack)
+                    mock_preflight = stack.enter_context(mock.patch(
+                        'deploy2ecscli.app.usecases.PreflightUseCase'))
+
+                    App().run()
+
+                    self.assertEqual(
+                        flags is not None,
+                        mock_preflight.return_value.execute.called)
+                    if flags is not None:
+                        self.assertEqual(
+                            flags, mock_preflight.call_args[0][1:])
+                    self.assertIsNotNone(deploy2ecscli.app.Resolver.default)
+
+        with self.subTest('When preflight failed'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                test_args = [exec_prog, '-c', config_file]
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                usecase_mocks = self.setup_usecase_mocks(stack)
+                self.setup_config(stack)
+                mock_preflight = stack.enter_context(mock.patch(
+                    'deploy2ecscli.app.usecases.PreflightUseCase'))
+                mock_preflight.return_value.execute.side_effect = \
+                    PreflightFailedException(['Template is not found'])
+
+                with self.assertRaises(PreflightFailedException):
+                    App().run()
+
+                for usecase_mock in usecase_mocks:
+                    usecase_mock.assert_not_called()
+
         with self.subTest('When match config run all'):
             with ExitStack() as stack:
                 self.setup_default_mocks(stack)
@@ -164,14 +430,13 @@ class TestApp(unittest.TestCase):
                 git = stack.enter_context(mock.patch('deploy2ecscli.app.Git'))
                 git.return_value.current_branch = mimesis.Person().username()
 
-                mock_yaml_load = stack.enter_context(mock.patch('yaml.load'))
-                mock_yaml_load.return_value = {
+                self.setup_config_file(stack, {
                     '.*': {
                         'images': [],
                         'task_definitions': [],
                         'services': []
                     }
-                }
+                })
 
                 App().run()
 
@@ -197,14 +462,13 @@ class TestApp(unittest.TestCase):
                 git = stack.enter_context(mock.patch('deploy2ecscli.app.Git'))
                 git.return_value.current_branch = mimesis.Person().username()
 
-                mock_yaml_load = stack.enter_context(mock.patch('yaml.load'))
-                mock_yaml_load.return_value = {
+                self.setup_config_file(stack, {
                     '.*': {
                         'images': [],
                         'task_definitions': [],
                         'services': []
                     }
-                }
+                })
 
                 App().run()
 
@@ -227,14 +491,13 @@ class TestApp(unittest.TestCase):
                 mock_build_image, mock_register_task_definition, mock_register_service = \
                     self.setup_usecase_mocks(stack)
 
-                mock_yaml_load = stack.enter_context(mock.patch('yaml.load'))
-                mock_yaml_load.return_value = {
+                self.setup_config_file(stack, {
                     '.*': {
                         'images': [],
                         'task_definitions': [],
                         'services': []
                     }
-                }
+                })
 
                 App().run()
 
@@ -257,17 +520,44 @@ class TestApp(unittest.TestCase):
                 mock_build_image, mock_register_task_definition, mock_register_service = \
                     self.setup_usecase_mocks(stack)
 
-                mock_yaml_load = stack.enter_context(mock.patch('yaml.load'))
-                mock_yaml_load.return_value = {
+                self.setup_config_file(stack, {
                     '.*': {
                         'images': [],
                         'task_definitions': [],
                         'services': []
                     }
-                }
+                })
 
                 App().run()
 
                 mock_build_image.return_value.execute.assert_not_called()
                 mock_register_task_definition.return_value.execute.assert_not_called()
                 mock_register_service.return_value.execute.assert_called()
+
+        with self.subTest('When match config run promote-image'):
+            with ExitStack() as stack:
+                self.setup_default_mocks(stack)
+
+                test_args = [
+                    exec_prog,
+                    'promote-image',
+                    '--config', mimesis.File().file_name(),
+                    '--tags', 'v1']
+
+                stack.enter_context(mock.patch.object(sys, 'argv', test_args))
+
+                mock_build_image, mock_register_task_definition, mock_register_service = \
+                    self.setup_usecase_mocks(stack)
+                mock_promote_image = stack.enter_context(mock.patch(
+                    'deploy2ecscli.app.usecases.PromoteImageUseCase'))
+
+                self.setup_config(stack)
+
+                App().run()
+
+                mock_promote_image.return_value.execute.assert_called()
+                self.assertEqual(
+                    (False, ['v1']), mock_promote_image.call_args[0][3:])
+                mock_build_image.return_value.execute.assert_not_called()
+                mock_register_task_definition.return_value.execute.assert_not_called()
+                mock_register_service.return_value.execute.assert_not_called()
@@ -0,0 +1,112 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import unittest
+
+from unittest import mock
+
+import mimesis
+
+from deploy2ecscli.cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get(self):
+        cache = DiskCache(self.directory.name)
+        key = ['diff_files', mimesis.Cryptographic.token_hex()]
+        expect = [mimesis.File().file_name() for x in range(10)]
+
+        with self.subTest('When not cached'):
+            self.assertIsNone(cache.get('git', key))
+            self.assertEqual(
+                expect, cache.get('git', key, default=expect))
+
+        with self.subTest('When cached'):
+            cache.set('git', key, expect)
+
+            self.assertEqual(expect, cache.get('git', key))
+
+        with self.subTest('When other namespace'):
+            self.assertIsNone(cache.get('config', key))
+
+        with self.subTest('When deleted'):
+            cache.delete('git', key)
+
+            self.assertIsNone(cache.get('git', key))
+
+        cache.close()
+
+    def test_persistent(self):
+        key = ['latest_object', mimesis.Cryptographic.token_hex()]
+        expect = mimesis.Cryptographic.token_hex()
+
+        cache = DiskCache(self.directory.name)
+        cache.set('git', key, expect)
+        cache.close()
+
+        cache = DiskCache(self.directory.name)
+        self.assertEqual(expect, cache.get('git', key))
+        cache.close()
+
+    def test_evict(self):
+        cache = DiskCache(self.directory.name, max_entries=3)
+
+        for key in range(3):
+            cache.set('git', key, key)
+
+        # Refresh the oldest entry, then overflow
+        cache.get('git', 0)
+        cache.set('git', 3, 3)
+
+        self.assertEqual(0, cache.get('git', 0))
+        self.assertIsNone(cache.get('git', 1))
+        self.assertEqual(2, cache.get('git', 2))
+        self.assertEqual(3, cache.get('git', 3))
+
+        cache.close()
+
+    def test_summary(self):
+        cache = DiskCache(self.directory.name)
+
+        with self.subTest('When not used'):
+            self.assertIsNone(cache.summary())
+
+        with self.subTest('When used'):
+            cache.set('git', 'a', 'a')
+            cache.get('git', 'a')
+            cache.get('git', 'a')
+            cache.get('git', 'b')
+
+            self.assertEqual('git: 2 hits, 1 misses', cache.summary())
+
+        cache.close()
+
+    def test_not_json(self):
+        key = ['latest_object', mimesis.Cryptographic.token_hex()]
+        cache = DiskCache(self.directory.name)
+        cache.set('git', key, 'a')
+
+        # Any pickle payload, which must not be loaded
+        connection = sqlite3.connect(
+            os.path.join(self.directory.name, DiskCache.FILE_NAME))
+        connection.execute(
+            'UPDATE entries SET value = ?',
+            (pickle.dumps(mock.sentinel.value),))
+        connection.commit()
+        connection.close()
+
+        with mock.patch('pickle.loads') as mock_loads:
+            self.assertIsNone(cache.get('git', key))
+            self.assertIsNone(cache.get('git', key))
+
+        mock_loads.assert_not_called()
+        self.assertEqual('git: 0 hits, 2 misses', cache.summary())
+
+        cache.close()
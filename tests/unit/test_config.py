@@ -1,4 +1,7 @@
+import io
 import os
+import tempfile
+import textwrap
 import dataclasses
 import json as json_parser
 import unittest
@@ -17,6 +20,13 @@ from deploy2ecscli.config import BeforeDeploy
 from deploy2ecscli.config import Service
 from deploy2ecscli.config import TaskDefinition
 from deploy2ecscli.config import Application
+from deploy2ecscli.config import ApplicationLoader
+from deploy2ecscli.config import parse_fragment
+from deploy2ecscli.config import TemplateCache
+from deploy2ecscli.cache import DiskCache
+from deploy2ecscli.exceptions import UnknownImageException
+from deploy2ecscli.exceptions import UnresolvedVariableException
+from deploy2ecscli.yaml import Resolver, SectionReader
 
 from tests.fixtures import config_params as fixtures
 
@@ -53,6 +63,50 @@ def task_definitions_parameterize(task_definitions):
     return result
 
 
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'template.yml')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, content, mtime):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def test_get(self):
+        subject = TemplateCache()
+        self.write('family: !Ref TASK_FAMILY', 1000000000)
+
+        with self.subTest('When not modified'):
+            template = subject.get(self.path)
+
+            self.assertIs(template, subject.get(self.path))
+            self.assertEqual(
+                {'family': 'app'},
+                subject.render(self.path, {'TASK_FAMILY': 'app'}))
+
+        with self.subTest('When modified'):
+            self.write('name: !Ref TASK_FAMILY', 2000000000)
+
+            self.assertIsNot(template, subject.get(self.path))
+            self.assertEqual(
+                {'name': 'app'},
+                subject.render(self.path, {'TASK_FAMILY': 'app'}))
+
+        with self.subTest('When file can not be stat'):
+            path = mimesis.File().file_name()
+            config_open = mock_open(read_data='family: !Ref TASK_FAMILY')
+            with patch('deploy2ecscli.config.open', config_open):
+                subject.get(path)
+                subject.get(path)
+
+            self.assertEqual(2, config_open.call_count)
+
+
 class TestBindableVariableCollection(unittest.TestCase):
     def test_init(self):
         expect = fixtures.bind_variables()
@@ -339,3 +393,331 @@ class TestApplication(unittest.TestCase):
                     image['docker_file'].split('/')[-1]
 
         self.assertDictEqual(expect, dataclasses.asdict(actual))
+
+    def test_init_when_unknown_image(self):
+        images = [fixtures.image() for x in range(2)]
+        task_definitions = [fixtures.task_definition(images[:1])]
+        task_definitions = task_definitions_parameterize(task_definitions)
+        task_definitions[0]['images'][0]['name'] = images[1]['name'] + '-x'
+
+        with self.assertRaises(UnknownImageException) as e:
+            Application(
+                images=images_parameterize(images),
+                task_definitions=task_definitions)
+
+        self.assertEqual(images[1]['name'] + '-x', e.exception.args[1])
+
+    def test_templates(self):
+        images = [fixtures.image() for x in range(2)]
+        task_definitions = [fixtures.task_definition(images) for x in range(2)]
+        services = [fixtures.service() for x in range(2)]
+        services[1]['template'] = services[0]['template']
+        services[1]['before_deploy'] = {'tasks': [fixtures.task()]}
+
+        actual = Application(
+            images=images_parameterize(images),
+            task_definitions=task_definitions_parameterize(task_definitions),
+            services=services)
+
+        self.assertEqual(
+            [x['template'] for x in task_definitions] +
+            [services[0]['template'],
+             services[1]['before_deploy']['tasks'][0]['template']],
+            actual.templates)
+
+
+class TestApplicationLoader(unittest.TestCase):
+    CONFIG = textwrap.dedent("""
+        master:
+            images:
+                -   name: app
+                    repository_uri: !Ref APP_REPOSITORY_URI
+                    context: .
+                    docker_file: ./Dockerfile
+                    dependencies:
+                        -   app/
+        feature/.*:
+            images:
+                -   name: app
+                    repository_uri: !Sub ${FEATURE_REGISTRY}/app
+                    context: .
+                    docker_file: ./Dockerfile
+                    dependencies: []
+        release/.*:
+            images:
+                -   name: app
+                    repository_uri: registry/app
+                    context: .
+                    docker_file: ./Dockerfile
+                    dependencies: []
+        """)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(self.directory.name)
+
+        self.environ_patcher = mock.patch.dict(os.environ, {
+            'APP_REPOSITORY_URI': 'registry/' + mimesis.Person().username(),
+            'FEATURE_REGISTRY': 'feature',
+        })
+        self.environ_patcher.start()
+
+        self.load_patcher = mock.patch(
+            'deploy2ecscli.config.SectionReader', wraps=SectionReader)
+        self.mock_load = self.load_patcher.start()
+
+    def tearDown(self):
+        self.load_patcher.stop()
+        self.environ_patcher.stop()
+        self.cache.close()
+        self.directory.cleanup()
+
+    def load(self, branch, content=None, cache=True):
+        subject = ApplicationLoader(self.cache if cache else None)
+        return subject.load(io.StringIO(content or self.CONFIG), branch)
+
+    def test_load(self):
+        with self.subTest('When without cache'):
+            actual = self.load('master', cache=False)
+
+            self.assertEqual(
+                os.environ['APP_REPOSITORY_URI'],
+                actual.images[0].repository_uri)
+            self.assertIsNone(self.load('develop', cache=False))
+
+        with self.subTest('When not cached'):
+            self.mock_load.reset_mock()
+
+            expect = self.load('release/1.0', cache=False)
+            actual = self.load('release/1.0')
+
+            self.assertEqual(expect, actual)
+            self.assertEqual(2, self.mock_load.call_count)
+
+        with self.subTest('When cached'):
+            self.mock_load.reset_mock()
+
+            actual = self.load('RELEASE/1.0')
+
+            self.assertEqual(expect, actual)
+            self.mock_load.assert_not_called()
+
+        with self.subTest('When no pattern matches'):
+            self.mock_load.reset_mock()
+
+            self.assertIsNone(self.load('develop'))
+            self.mock_load.assert_not_called()
+
+        with self.subTest('When section refers to environment'):
+            self.mock_load.reset_mock()
+            for value in ['feature', 'other']:
+                os.environ['FEATURE_REGISTRY'] = value
+
+                actual = self.load('feature/login')
+
+                self.assertEqual(
+                    value + '/app', actual.images[0].repository_uri)
+
+            # Compiled once, resolved on each load
+            self.mock_load.assert_called_once()
+
+        with self.subTest('When file changed'):
+            self.mock_load.reset_mock()
+            content = self.CONFIG.replace('./Dockerfile', './Dockerfile.dev')
+
+            actual = self.load('release/1.0', content)
+
+            self.assertEqual('./Dockerfile.dev', actual.images[0].docker_file)
+            self.mock_load.assert_called_once()
+
+        with self.subTest('When persisted'):
+            self.mock_load.reset_mock()
+            self.cache.close()
+            self.cache = DiskCache(self.directory.name)
+
+            self.assertEqual(expect, self.load('release/1.0'))
+            self.mock_load.assert_not_called()
+
+    def test_load_only_section_of_branch(self):
+        content = self.CONFIG.replace(
+            '${FEATURE_REGISTRY}', '${MISSING_REGISTRY}')
+        os.environ.pop('MISSING_REGISTRY', None)
+
+        for cache in [False, True]:
+            with self.subTest(cache=cache):
+                actual = self.load('master', content, cache)
+
+                self.assertEqual(
+                    os.environ['APP_REPOSITORY_URI'],
+                    actual.images[0].repository_uri)
+
+                with self.assertRaises(UnresolvedVariableException) as e:
+                    self.load('feature/login', content, cache)
+
+                self.assertEqual('MISSING_REGISTRY', e.exception.name)
+
+    def test_load_with_remote_references(self):
+        token = mimesis.Cryptographic.token_hex()
+        fetcher = MagicMock(return_value={'/app/token': token})
+        content = self.CONFIG.replace(
+            'dependencies:\n                -   app/',
+            'dependencies: []\n'
+            '            buildargs:\n'
+            '                TOKEN: !SSM /app/token')
+
+        for _ in range(2):
+            resolver = Resolver({'!SSM': fetcher})
+            with mock.patch.object(Resolver, 'default', resolver):
+                actual = self.load('master', content)
+
+                self.assertEqual({'TOKEN': token}, actual.images[0].buildargs)
+
+        # Fetched on each run, never written to the cache
+        self.assertEqual(2, fetcher.call_count)
+        self.mock_load.assert_called_once()
+        self.cache.close()
+        path = os.path.join(self.directory.name, DiskCache.FILE_NAME)
+        with open(path, 'rb') as f:
+            self.assertNotIn(token.encode('utf8'), f.read())
+
+    def write_fragments(self, fragments):
+        directory = os.path.join(self.directory.name, 'config')
+        paths = []
+        for name, content in fragments:
+            path = os.path.join(directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(textwrap.dedent(content))
+
+            paths.append(path)
+
+        return directory, paths
+
+    def test_find(self):
+        directory, paths = self.write_fragments([
+            ('a.yml', 'master: {}'),
+            ('services/b.yaml', 'master: {}'),
+            ('README.md', ''),
+        ])
+
+        with self.subTest('When directory'):
+            self.assertEqual(
+                sorted(paths[:2]), ApplicationLoader.find(directory))
+
+        with self.subTest('When glob'):
+            self.assertEqual(
+                [paths[1]],
+                ApplicationLoader.find(os.path.join(directory, '*/*.yaml')))
+
+        with self.subTest('When file'):
+            self.assertIsNone(ApplicationLoader.find(paths[0]))
+
+    def test_load_all(self):
+        fragments = [
+            ('images.yml', """
+                master:
+                    images:
+                        -   name: app
+                            repository_uri: !Ref APP_REPOSITORY_URI
+                            context: .
+                            docker_file: ./Dockerfile
+                            dependencies: []
+                .*:
+                    images: []
+                """),
+            ('services/app.yml', """
+                .*:
+                    task_definitions:
+                        -   template: ./task_definition.yml
+                            images:
+                                -   name: app
+                                    bind_variable: APP_IMAGE
+                    services:
+                        -   name: app
+                            task_family: app
+                            cluster: default
+                            template: ./service.yml
+                """),
+            ('services/worker.yml', """
+                feature/.*:
+                    services:
+                        -   name: worker
+                            task_family: worker
+                            cluster: !Sub ${MISSING_CLUSTER}
+                            template: ./service.yml
+                """),
+        ]
+        directory, paths = self.write_fragments(fragments)
+        paths = ApplicationLoader.find(directory)
+
+        with self.subTest('When without cache'):
+            actual = ApplicationLoader().load_all(paths, 'master')
+
+            self.assertEqual(['app'], [x.name for x in actual.images])
+            self.assertEqual(['app'], [x.name for x in actual.services])
+            self.assertEqual(
+                os.environ['APP_REPOSITORY_URI'],
+                actual.task_definitions[0].images[0].repository_uri)
+
+        with self.subTest('When no pattern matches'):
+            self.assertIsNone(ApplicationLoader().load_all(paths[2:], 'master'))
+
+        with self.subTest('When not cached'):
+            expect = actual
+            actual = ApplicationLoader(self.cache).load_all(paths, 'master')
+
+            self.assertEqual(expect, actual)
+
+        with self.subTest('When cached'):
+            with mock.patch('deploy2ecscli.config.parse_fragment') as mock_parse:
+                actual = ApplicationLoader(self.cache).load_all(paths, 'master')
+
+            self.assertEqual(expect, actual)
+            mock_parse.assert_not_called()
+
+        with self.subTest('When referred environment variable changed'):
+            os.environ['APP_REPOSITORY_URI'] = 'registry/other'
+            with mock.patch('deploy2ecscli.config.parse_fragment') as mock_parse:
+                actual = ApplicationLoader(self.cache).load_all(paths, 'master')
+
+            self.assertEqual(
+                'registry/other',
+                actual.task_definitions[0].images[0].repository_uri)
+            mock_parse.assert_not_called()
+            os.environ['APP_REPOSITORY_URI'] = expect.images[0].repository_uri
+
+        with self.subTest('When a file changed'):
+            with open(paths[0], 'a') as f:
+                f.write('# comment\n')
+
+            with mock.patch('deploy2ecscli.config.parse_fragment',
+                            wraps=parse_fragment) as mock_parse:
+                actual = ApplicationLoader(self.cache).load_all(paths, 'master')
+
+            self.assertEqual(expect, actual)
+            mock_parse.assert_called_once_with(mock.ANY, 'master')
+
+    def test_environment_is_not_cached(self):
+        secret = mimesis.Cryptographic.token_hex()
+        os.environ['APP_REPOSITORY_URI'] = secret
+        content = self.CONFIG.replace(
+            'repository_uri: !Ref APP_REPOSITORY_URI',
+            'repository_uri: registry/app\n'
+            '            buildargs:\n'
+            '                TOKEN: !Ref APP_REPOSITORY_URI')
+        directory, paths = self.write_fragments([('app.yml', content)])
+
+        for _ in range(2):
+            actual = self.load('master', content)
+            self.assertEqual({'TOKEN': secret}, actual.images[0].buildargs)
+
+            actual = ApplicationLoader(self.cache).load_all(paths, 'master')
+            self.assertEqual({'TOKEN': secret}, actual.images[0].buildargs)
+
+        # Cached compiled, resolved on each load
+        self.mock_load.assert_called_once()
+        self.cache.close()
+
+        path = os.path.join(self.directory.name, DiskCache.FILE_NAME)
+        with open(path, 'rb') as f:
+            self.assertNotIn(secret.encode('utf8'), f.read())
@@ -1,4 +1,8 @@
 
+import os
+import tempfile
+import threading
+import textwrap
 import dataclasses
 from contextlib import ExitStack
 from typing import Tuple
@@ -7,6 +11,7 @@ import unittest
 from unittest import mock
 from unittest.mock import MagicMock
 
+import docker
 import mimesis
 
 from deploy2ecscli.aws.models.ecr import ImageCollection
@@ -14,18 +19,215 @@ from deploy2ecscli.aws.models.ecs import Task
 from deploy2ecscli.aws.models.ecs import TaskDefinition
 from deploy2ecscli.aws.models.ecs import Service
 from deploy2ecscli.exceptions import TaskFailedException
+from deploy2ecscli.exceptions import PreflightFailedException
+from deploy2ecscli.exceptions import ImageNotFoundException
 from deploy2ecscli.usecases import RunTaskUseCase
+from deploy2ecscli.usecases import PreflightUseCase
 from deploy2ecscli.usecases import BuildImageUseCase
+from deploy2ecscli.usecases import PromoteImageUseCase
+from deploy2ecscli.usecases import PrepareRepositoryUseCase
 from deploy2ecscli.usecases import RegisterTaskDefinitionUseCase
 from deploy2ecscli.usecases import RegisterServiceUseCase
 
 from deploy2ecscli.git import Git
+from deploy2ecscli.log import Level as LogLevel
 from deploy2ecscli.config import Application as ApplicationConfig
 
 from tests.fixtures import config as config_fixtures
 from tests.fixtures import aws as aws_fixtures
 
 
+class TestPreflightUseCase(unittest.TestCase):
+    TASK_DEFINITION = """
+    family: app
+    containerDefinitions:
+        -   name: app
+            image: !Ref APP_IMAGE
+    tags:
+        -   key: JSON_COMMIT_HASH
+            value: !Ref JSON_COMMIT_HASH
+    """
+
+    SERVICE = """
+    serviceName: !Ref SERVICE_NAME
+    taskDefinition: !Sub ${TASK_DEFINITION_ARN}
+    desiredCount: 1
+    """
+
+    TASK = """
+    taskDefinition: !Sub ${TASK_FAMILY}
+    cluster: !Ref CLUSTER_NAME
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        self.write('app/Dockerfile', 'FROM scratch')
+        self.write('task_definition.yml', self.TASK_DEFINITION)
+        self.write('service.yml', self.SERVICE)
+        self.write('task.yml', self.TASK)
+
+        patcher = mock.patch('deploy2ecscli.usecases.log')
+        self.log = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, path: str, content: str) -> None:
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent(content))
+
+    def config(self, **replaces) -> ApplicationConfig:
+        def path(name):
+            return os.path.join(self.directory, replaces.get(name, name))
+
+        image = {
+            'name': 'app',
+            'repository_uri': mimesis.Internet().home_page() + '/app',
+            'context': path('app'),
+            'docker_file': path('app/Dockerfile'),
+            'dependencies': ['app/'],
+        }
+
+        return ApplicationConfig(
+            images=[image],
+            task_definitions=[{
+                'template': path('task_definition.yml'),
+                'images': [{'name': 'app', 'bind_variable': 'APP_IMAGE'}],
+            }],
+            services=[{
+                'name': 'app',
+                'task_family': 'app',
+                'cluster': 'cluster',
+                'template': path('service.yml'),
+                'before_deploy': {'tasks': [{
+                    'task_family': 'migrate',
+                    'cluster': 'cluster',
+                    'template': path('task.yml'),
+                }]},
+            }])
+
+    def test_execute(self):
+        PreflightUseCase(self.config()).execute()
+
+        self.log.error.assert_not_called()
+
+    def test_execute_when_files_not_found(self):
+        names = ['app/Dockerfile', 'app', 'task_definition.yml',
+                 'service.yml', 'task.yml']
+
+        for name in names:
+            with self.subTest(name=name):
+                config = self.config(**{name: 'missing'})
+
+                with self.assertRaises(PreflightFailedException) as e:
+                    PreflightUseCase(config).execute()
+
+                problems = e.exception.args[1]
+                self.assertEqual(1, len(problems))
+                self.assertIn('missing', problems[0])
+
+    def test_execute_when_images_not_checked(self):
+        config = self.config(app='missing')
+
+        PreflightUseCase(config, False, True).execute()
+
+    def test_execute_when_images_promoted(self):
+        # Promoted images are copied, not built
+        config = self.config(app='missing')
+        config.images[0] = dataclasses.replace(
+            config.images[0], promote_from=config.images[0].repository_uri)
+
+        PreflightUseCase(config).execute()
+
+    def test_execute_when_variables_not_resolved(self):
+        self.write('service.yml', self.SERVICE.replace(
+            'TASK_DEFINITION_ARN', 'TASK_DEFINITION'))
+        self.write('task.yml', self.TASK.replace('TASK_FAMILY', 'FAMILY'))
+
+        with self.subTest('When render templates'):
+            with self.assertRaises(PreflightFailedException) as e:
+                PreflightUseCase(self.config()).execute()
+
+            self.assertEqual(2, len(e.exception.args[1]))
+            self.assertIn('${FAMILY}', e.exception.args[1][0])
+            self.assertIn('${TASK_DEFINITION}', e.exception.args[1][1])
+            self.log.error.assert_called()
+
+        with self.subTest('When not render templates'):
+            PreflightUseCase(self.config(), True, False).execute()
+
+    def test_execute_when_template_is_invalid(self):
+        self.write('task_definition.yml',
+                   self.TASK_DEFINITION.replace('family', 'name'))
+        self.write('service.yml', 'serviceName: [')
+
+        with self.assertRaises(PreflightFailedException) as e:
+            PreflightUseCase(self.config()).execute()
+
+        problems = e.exception.args[1]
+        self.assertEqual(2, len(problems))
+        self.assertIn('service.yml', problems[0])
+        self.assertIn("'family' is missing", problems[1])
+
+
+class TestPrepareRepositoryUseCase(unittest.TestCase):
+    def setUp(self):
+        self.image_config = config_fixtures.image()
+        self.config = MagicMock()
+        self.config.images = [self.image_config]
+
+        self.git_client = MagicMock()
+        self.git_client.time_latest_objects.return_value = 0.5
+        self.graph = self.git_client.commit_graph
+        self.graph.changed_paths = True
+        self.graph.contains.return_value = True
+
+    def test_execute_when_commit_graph_is_fresh(self):
+        PrepareRepositoryUseCase(self.config, self.git_client).execute()
+
+        self.graph.contains.assert_called_with(self.git_client.head_object)
+        self.graph.close.assert_called()
+        self.git_client.write_commit_graph.assert_not_called()
+        self.git_client.time_latest_objects.assert_not_called()
+
+    def test_execute_when_commit_graph_should_be_written(self):
+        def missing(git_client):
+            git_client.commit_graph = None
+
+        def unreadable(git_client):
+            type(git_client).commit_graph = \
+                mock.PropertyMock(side_effect=ValueError())
+
+        def missing_graph_file(git_client):
+            type(git_client).commit_graph = \
+                mock.PropertyMock(side_effect=FileNotFoundError())
+
+        def without_changed_paths(git_client):
+            git_client.commit_graph.changed_paths = False
+
+        def stale(git_client):
+            git_client.commit_graph.contains.return_value = False
+
+        for setup in [missing, unreadable, missing_graph_file,
+                      without_changed_paths, stale]:
+            with self.subTest(setup.__name__):
+                git_client = MagicMock()
+                git_client.time_latest_objects.return_value = 0.5
+                setup(git_client)
+
+                PrepareRepositoryUseCase(self.config, git_client).execute()
+
+                git_client.write_commit_graph.assert_called_once()
+                self.assertEqual(2, git_client.time_latest_objects.call_count)
+                git_client.time_latest_objects.assert_called_with([
+                    (None, None),
+                    (self.image_config.dependencies,
+                     self.image_config.excludes)])
+
+
 class TestBuildImageUseCase(unittest.TestCase):
     def test_init(self):
         config = MagicMock()
@@ -57,21 +259,28 @@ class TestBuildImageUseCase(unittest.TestCase):
         if type(digest_is) == str:
             digest_is = [MagicMock(digest=digest_is, tag=digest_is)]
 
-        if type(find_by_tag) == str:
-            find_by_tag = MagicMock(digest=find_by_tag)
-
         mock_image_collection = \
-            aws_client.ecr.repositories.__getitem__.return_value.images
-        mock_image_collection.find_by_tag.return_value = find_by_tag
+            aws_client.ecr.repositories.find_images.return_value.__getitem__.return_value
+        if type(find_by_tag) == str:
+            # Only the tag is found, like an image collection
+            image = MagicMock(digest=find_by_tag, tag=find_by_tag)
+            mock_image_collection.find_by_tag.side_effect = \
+                lambda tag: image if tag == image.tag else None
+        else:
+            mock_image_collection.find_by_tag.return_value = find_by_tag
         mock_image_collection.digest_is.return_value = digest_is
         mock_image_collection.latest = latest
 
         return (aws_client, auth_config)
 
     def __find_by_tag(self, latest_build_at):
+        image = MagicMock(
+            tag=latest_build_at,
+            digest=mimesis.Cryptographic().token_hex())
+
         def f(tag):
             if latest_build_at == tag:
-                return MagicMock(tag=tag, digest=mimesis.Cryptographic().token_hex())
+                return image
             else:
                 return None
 
@@ -108,6 +317,10 @@ class TestBuildImageUseCase(unittest.TestCase):
         mock_docker.images.build.assert_not_called()
         mock_docker.images.push.assert_not_called()
 
+        ######################################################################
+        # Should not fetch a token nothing uses
+        aws_client.ecr.authorization_token.get.assert_not_called()
+
     def test_execute_when_image_already_builded(self):
         with ExitStack() as stack:
             latest_object = mimesis.Cryptographic().token_hex()
@@ -151,13 +364,13 @@ class TestBuildImageUseCase(unittest.TestCase):
                 digest_is=latest_build_at)
 
             mock_image_collection = \
-                aws_client.ecr.repositories.__getitem__.return_value.images
+                aws_client.ecr.repositories.find_images.return_value.__getitem__.return_value
             mock_image_collection.find_by_tag.side_effect = \
                 self.__find_by_tag(latest_build_at)
 
             git_client = MagicMock()
             git_client.latest_object.return_value = latest_build_at
-            git_client.diff_files.return_value = []
+            git_client.diff.return_value = ([], None)
 
             mock_docker, _ = self.__setup_mock_docker(stack)
 
@@ -350,6 +563,60 @@ class TestBuildImageUseCase(unittest.TestCase):
 
         mock_docker.images.push.assert_has_calls(expect_call_push)
 
+    def test_execute_when_hash_missing_in_shallow_clone(self):
+        for reachable in [True, False]:
+            with self.subTest(reachable=reachable), ExitStack() as stack:
+                latest_object = mimesis.Cryptographic().token_hex()
+                latest_image_commit = mimesis.Cryptographic().token_hex()
+                image_config = config_fixtures.image()
+
+                config = MagicMock()
+                config.images = [image_config]
+
+                aws_client, _ = self.__setup_aws_client(
+                    stack,
+                    latest=latest_image_commit,
+                    digest_is=latest_image_commit)
+
+                mock_image_collection = \
+                    aws_client.ecr.repositories.find_images.return_value.__getitem__.return_value
+                mock_image_collection.find_by_tag.side_effect = \
+                    self.__find_by_tag(latest_image_commit)
+
+                git_client = MagicMock()
+                git_client.is_shallow = True
+                git_client.deepen.return_value = reachable
+                git_client.latest_object.return_value = latest_object
+                git_client.latest_log.side_effect = [Exception(), '']
+                git_client.diff.return_value = ([], None)
+
+                mock_docker, _ = self.__setup_mock_docker(stack)
+
+                subject = \
+                    BuildImageUseCase(
+                        config,
+                        aws_client,
+                        git_client,
+                        False,
+                        False,
+                        [],
+                        deepen_limit=100)
+                subject.execute()
+
+                git_client.deepen.assert_called_once_with(
+                    latest_image_commit, 100)
+
+                if reachable:
+                    ##########################################################
+                    # Should not build, because commit is found after deepen
+                    git_client.diff.assert_called_once()
+                    mock_docker.images.build.assert_not_called()
+                else:
+                    ##########################################################
+                    # Should build, because commit is not found within limit
+                    git_client.diff.assert_not_called()
+                    mock_docker.images.build.assert_called_once()
+
     def test_execute_when_dependencies_modified(self):
         with ExitStack() as stack:
             latest_object = mimesis.Cryptographic().token_hex()
@@ -365,9 +632,8 @@ class TestBuildImageUseCase(unittest.TestCase):
 
             git_client = MagicMock()
             git_client.latest_object.return_value = latest_object
-            git_client.diff_files.return_value = \
-                [mimesis.File().file_name() for x in range(10)]
-            git_client.print_diff = Exception()
+            git_client.diff.return_value = (
+                [mimesis.File().file_name() for x in range(10)], None)
 
             mock_docker, docker_image = self.__setup_mock_docker(stack)
 
@@ -412,6 +678,193 @@ class TestBuildImageUseCase(unittest.TestCase):
 
         mock_docker.images.push.assert_has_calls(expect_call_push)
 
+    def test_execute_when_dependencies_modified_verbose(self):
+        for verbose in [True, False]:
+            with self.subTest(verbose=verbose), ExitStack() as stack:
+                latest_object = mimesis.Cryptographic().token_hex()
+                latest_image_commit = mimesis.Cryptographic().token_hex()
+                patch = mimesis.Text().text()
+                image_config = config_fixtures.image()
+
+                config = MagicMock()
+                config.images = [image_config]
+
+                aws_client, _ = self.__setup_aws_client(
+                    stack,
+                    latest=latest_object,
+                    digest_is=latest_image_commit)
+
+                git_client = MagicMock()
+                git_client.latest_object.return_value = latest_object
+                git_client.diff.return_value = \
+                    ([mimesis.File().file_name()], patch if verbose else None)
+
+                mock_log = stack.enter_context(
+                    mock.patch('deploy2ecscli.usecases.log'))
+                mock_log.is_enabled.return_value = verbose
+
+                self.__setup_mock_docker(stack)
+
+                subject = \
+                    BuildImageUseCase(
+                        config,
+                        aws_client,
+                        git_client,
+                        False,
+                        False,
+                        [])
+
+                subject.execute()
+
+                ##############################################################
+                # Should generate the patch only when verbose
+                git_client.diff.assert_called_once_with(
+                    latest_image_commit,
+                    latest_object,
+                    image_config.dependencies,
+                    image_config.excludes,
+                    patch=verbose)
+                git_client.print_diff.assert_not_called()
+
+                if verbose:
+                    mock_log.dump_diff.assert_called_once_with(
+                        patch, level=LogLevel.VERBOSE)
+                else:
+                    mock_log.dump_diff.assert_not_called()
+
+    def test_execute_finds_images_of_all_repositories(self):
+        with ExitStack() as stack:
+            latest_object = mimesis.Cryptographic().token_hex()
+            tags = [mimesis.Person().username() for x in range(2)]
+            image_configs = [config_fixtures.image() for x in range(2)]
+            image_configs.append(dataclasses.replace(image_configs[0]))
+
+            config = MagicMock()
+            config.images = image_configs
+
+            aws_client, _ = self.__setup_aws_client(
+                stack,
+                find_by_tag=latest_object)
+
+            git_client = MagicMock()
+            git_client.latest_object.return_value = latest_object
+
+            self.__setup_mock_docker(stack)
+
+            BuildImageUseCase(
+                config, aws_client, git_client, False, False, tags).execute()
+
+        ######################################################################
+        # Should look up tags of all repositories at once
+        wanted = [latest_object, 'latest'] + tags
+        aws_client.ecr.repositories.find_images.assert_called_once_with({
+            image_configs[0].repository_name: wanted + wanted,
+            image_configs[1].repository_name: wanted,
+        })
+        aws_client.ecr.repositories.__getitem__.assert_not_called()
+
+    def test_execute_with_jobs(self):
+        with ExitStack() as stack:
+            image_configs = [config_fixtures.image() for x in range(3)]
+
+            config = MagicMock()
+            config.images = image_configs
+
+            aws_client, auth_config = self.__setup_aws_client(stack)
+
+            git_client = MagicMock()
+            git_client.latest_object.return_value = \
+                mimesis.Cryptographic().token_hex()
+
+            mock_docker, docker_image = self.__setup_mock_docker(stack)
+
+            # Every build waits for the others, they must run at once
+            barrier = threading.Barrier(3, timeout=10)
+
+            def build(**kwargs):
+                barrier.wait()
+                return (docker_image, [])
+
+            mock_docker.images.build.side_effect = build
+
+            BuildImageUseCase(
+                config, aws_client, git_client, True, False, [],
+                jobs=4).execute()
+
+            ##################################################################
+            # Should build with a connection per worker
+            self.assertEqual(3, mock_docker.images.build.call_count)
+            self.assertLessEqual(1 + 3, docker.from_env.call_count)
+            mock_docker.close.assert_called()
+
+        ######################################################################
+        # Should push all images
+        expect_call_push = [
+            mock.call(x.tagged_uri('latest'), auth_config=auth_config)
+            for x in image_configs
+        ]
+        mock_docker.images.push.assert_has_calls(expect_call_push, any_order=True)
+
+    def test_execute_with_jobs_when_build_failed(self):
+        with ExitStack() as stack:
+            image_configs = [config_fixtures.image() for x in range(4)]
+
+            config = MagicMock()
+            config.images = image_configs
+
+            aws_client, _ = self.__setup_aws_client(stack)
+
+            git_client = MagicMock()
+            git_client.latest_object.return_value = \
+                mimesis.Cryptographic().token_hex()
+
+            mock_docker, docker_image = self.__setup_mock_docker(stack)
+
+            def build(path, **kwargs):
+                if path == image_configs[0].context:
+                    raise docker.errors.BuildError('failed', [])
+
+                return (docker_image, [])
+
+            mock_docker.images.build.side_effect = build
+
+            subject = BuildImageUseCase(
+                config, aws_client, git_client, True, False, [], jobs=2)
+
+            with self.assertRaises(docker.errors.BuildError):
+                subject.execute()
+
+        ######################################################################
+        # Should not push any image
+        mock_docker.images.push.assert_not_called()
+        aws_client.ecr.repositories.invalidate.assert_not_called()
+        mock_docker.close.assert_called()
+
+    def test_execute_when_image_is_promoted(self):
+        with ExitStack() as stack:
+            image_config = config_fixtures.image(
+                promote_from=mimesis.Cryptographic().token_hex() + '/staging')
+
+            config = MagicMock()
+            config.images = [image_config]
+
+            aws_client, _ = self.__setup_aws_client(stack)
+
+            git_client = MagicMock()
+            git_client.latest_object.return_value = \
+                mimesis.Cryptographic().token_hex()
+
+            mock_docker, _ = self.__setup_mock_docker(stack)
+
+            BuildImageUseCase(
+                config, aws_client, git_client, False, False, []).execute()
+
+        ######################################################################
+        # Should not look up nor build promoted images
+        aws_client.ecr.repositories.find_images.assert_called_once_with({})
+        mock_docker.images.build.assert_not_called()
+        mock_docker.images.push.assert_not_called()
+
     def test_execute_when_force_update(self):
         with ExitStack() as stack:
             latest_object = mimesis.Cryptographic().token_hex()
@@ -466,6 +919,14 @@ class TestBuildImageUseCase(unittest.TestCase):
         self.assertEqual(2, mock_docker.images.push.call_count)
         mock_docker.images.push.assert_has_calls(expect_call_push)
 
+        aws_client.ecr.authorization_token.get.assert_called_with(
+            image_config.repository_uri.split('/')[0])
+
+        ######################################################################
+        # Should forget images of the pushed repository
+        aws_client.ecr.repositories.invalidate.assert_called_once_with(
+            image_config.repository_name)
+
     def test_execute_when_use_buildargs(self):
         with ExitStack() as stack:
             buildargs = {
@@ -484,9 +945,8 @@ class TestBuildImageUseCase(unittest.TestCase):
 
             git_client = MagicMock()
             git_client.latest_object.return_value = latest_object
-            git_client.diff_files.return_value = \
-                [mimesis.File().file_name() for x in range(10)]
-            git_client.print_diff = Exception()
+            git_client.diff.return_value = (
+                [mimesis.File().file_name() for x in range(10)], None)
 
             mock_docker, docker_image = self.__setup_mock_docker(stack)
 
@@ -561,30 +1021,16 @@ class TestBuildImageUseCase(unittest.TestCase):
         mock_docker.images.build.assert_not_called()
 
         ######################################################################
-        # Should pull git hash image
-        mock_docker.images.pull.assert_called_with(
-            image_config.tagged_uri(latest_object),
-            auth_config=auth_config)
-
-        ######################################################################
-        # Should add missing tags
-        expect_call_tag = [
-            mock.call(image_config.tagged_uri(x)) for x in tags
-        ]
-        self.assertEqual(10, docker_image.tag.call_count)
-        docker_image.tag.assert_has_calls(expect_call_tag)
+        # Should tag git hash image on ECR
+        aws_client.ecr.repositories.put_tags.assert_called_once_with(
+            image_config.repository_name, latest_object, tags)
 
         ######################################################################
-        # Should push missing tags
-        expect_call_push = [
-            mock.call(
-                image_config.tagged_uri(x),
-                auth_config=auth_config)
-            for x in tags
-        ]
-
-        self.assertEqual(10, mock_docker.images.push.call_count)
-        mock_docker.images.push.assert_has_calls(expect_call_push)
+        # Should not pull nor push
+        mock_docker.images.pull.assert_not_called()
+        docker_image.tag.assert_not_called()
+        mock_docker.images.push.assert_not_called()
+        aws_client.ecr.authorization_token.get.assert_not_called()
 
     def test_execute_when_builed_image_does_not_have_a_custom_tag(self):
         with ExitStack() as stack:
@@ -601,12 +1047,15 @@ class TestBuildImageUseCase(unittest.TestCase):
                 digest_is=latest_build_at)
 
             mock_image_collection = \
-                aws_client.ecr.repositories.__getitem__.return_value.images
+                aws_client.ecr.repositories.find_images.return_value.__getitem__.return_value
             mock_image_collection.find_by_tag.side_effect = \
                 self.__find_by_tag(latest_build_at)
+            # Deleted meanwhile
+            aws_client.ecr.repositories.put_tags.return_value = None
 
             git_client = MagicMock()
             git_client.latest_object.return_value = mimesis.Cryptographic().token_hex()
+            git_client.diff.return_value = ([], None)
 
             mock_docker, docker_image = self.__setup_mock_docker(stack)
 
@@ -625,7 +1074,7 @@ class TestBuildImageUseCase(unittest.TestCase):
         mock_docker.images.build.assert_not_called()
 
         ######################################################################
-        # Should pull git hash image
+        # Should pull git hash image, when it is not found on ECR
         mock_docker.images.pull.assert_called_with(
             image_config.tagged_uri(latest_build_at),
             auth_config=auth_config)
@@ -665,9 +1114,8 @@ class TestBuildImageUseCase(unittest.TestCase):
 
             git_client = MagicMock()
             git_client.latest_object.return_value = latest_object
-            git_client.diff_files.return_value = \
-                [mimesis.File().file_name() for x in range(10)]
-            git_client.print_diff = Exception()
+            git_client.diff.return_value = (
+                [mimesis.File().file_name() for x in range(10)], None)
 
             mock_docker, docker_image = self.__setup_mock_docker(stack)
 
@@ -686,6 +1134,7 @@ class TestBuildImageUseCase(unittest.TestCase):
         mock_docker.images.build.assert_not_called()
         docker_image.tag.assert_not_called()
         mock_docker.images.push.assert_not_called()
+        aws_client.ecr.repositories.invalidate.assert_not_called()
 
     def test_execute_when_dry_run_missing_tag(self):
         with ExitStack() as stack:
@@ -716,17 +1165,198 @@ class TestBuildImageUseCase(unittest.TestCase):
             subject.execute()
 
         ######################################################################
-        # Should pull git hash image
-        mock_docker.images.pull.assert_called_with(
-            image_config.tagged_uri(latest_object),
-            auth_config=auth_config)
+        # Should no tag, build and push
+        aws_client.ecr.repositories.put_tags.assert_not_called()
+        mock_docker.images.pull.assert_not_called()
+        mock_docker.images.build.assert_not_called()
+        docker_image.tag.assert_not_called()
+        mock_docker.images.push.assert_not_called()
+
+
+    def test_execute_when_fingerprint_already_builded(self):
+        with ExitStack() as stack:
+            latest_object = mimesis.Cryptographic().token_hex()
+            fingerprint = 'tree-' + mimesis.Cryptographic().token_hex()
+            image_config = config_fixtures.image()
+
+            config = MagicMock()
+            config.images = [image_config]
+
+            aws_client, auth_config = self.__setup_aws_client(
+                stack,
+                digest_is=[MagicMock(tag=fingerprint)])
+
+            mock_image_collection = \
+                aws_client.ecr.repositories.find_images.return_value.__getitem__.return_value
+            mock_image_collection.find_by_tag.side_effect = \
+                self.__find_by_tag(fingerprint)
+
+            git_client = MagicMock()
+            git_client.latest_object.return_value = latest_object
+            git_client.tree_fingerprint.return_value = fingerprint
+
+            mock_docker, docker_image = self.__setup_mock_docker(stack)
+
+            subject = \
+                BuildImageUseCase(
+                    config,
+                    aws_client,
+                    git_client,
+                    False,
+                    False,
+                    [],
+                    fingerprint=True)
+            subject.execute()
 
         ######################################################################
-        # Should no build and push
+        # Should not compare history
+        git_client.tree_fingerprint.assert_called_with(
+            image_config.dependencies,
+            image_config.excludes)
+        git_client.latest_log.assert_not_called()
+        git_client.diff.assert_not_called()
+
+        ######################################################################
+        # Should not build
         mock_docker.images.build.assert_not_called()
-        docker_image.tag.assert_not_called()
+
+        ######################################################################
+        # Should add missing commit tag to fingerprint image
+        aws_client.ecr.repositories.put_tags.assert_called_once_with(
+            image_config.repository_name, fingerprint, [latest_object])
+        mock_docker.images.pull.assert_not_called()
         mock_docker.images.push.assert_not_called()
 
+    def test_execute_when_fingerprint_not_builded(self):
+        with ExitStack() as stack:
+            latest_object = mimesis.Cryptographic().token_hex()
+            fingerprint = 'tree-' + mimesis.Cryptographic().token_hex()
+            image_config = config_fixtures.image()
+
+            config = MagicMock()
+            config.images = [image_config]
+
+            aws_client, auth_config = self.__setup_aws_client(stack)
+
+            git_client = MagicMock()
+            git_client.latest_object.return_value = latest_object
+            git_client.tree_fingerprint.return_value = fingerprint
+
+            mock_docker, docker_image = self.__setup_mock_docker(stack)
+
+            subject = \
+                BuildImageUseCase(
+                    config,
+                    aws_client,
+                    git_client,
+                    False,
+                    False,
+                    [],
+                    fingerprint=True)
+            subject.execute()
+
+        ######################################################################
+        # Should build and tag fingerprint
+        mock_docker.images.build.assert_called()
+        docker_image.tag.assert_has_calls([
+            mock.call(image_config.tagged_uri(latest_object)),
+            mock.call(image_config.tagged_uri(fingerprint))
+        ])
+
+        ######################################################################
+        # Should push latest tag, commit hash tag and fingerprint tag
+        expect_call_push = [
+            mock.call(
+                image_config.tagged_uri(x),
+                auth_config=auth_config)
+            for x in ['latest', latest_object, fingerprint]
+        ]
+
+        self.assertEqual(3, mock_docker.images.push.call_count)
+        mock_docker.images.push.assert_has_calls(expect_call_push)
+
+class TestPromoteImageUseCase(unittest.TestCase):
+    def test_init(self):
+        config = MagicMock()
+        aws_client = MagicMock()
+        git_client = MagicMock()
+
+        PromoteImageUseCase(config, aws_client, git_client, False, [])
+
+    def __setup(self, digests):
+        source_uri = mimesis.Cryptographic().token_hex() + '/staging'
+        image_configs = [
+            config_fixtures.image(promote_from=source_uri) for x in range(2)]
+
+        config = MagicMock()
+        config.images = [config_fixtures.image()] + image_configs
+
+        aws_client = MagicMock()
+        aws_client.ecr.transfer.copy_all.return_value = digests
+
+        latest_object = mimesis.Cryptographic().token_hex()
+        git_client = MagicMock()
+        git_client.latest_object.return_value = latest_object
+
+        return (config, aws_client, git_client, image_configs, latest_object)
+
+    def test_execute(self):
+        tags = [mimesis.Person().username() for x in range(2)]
+        config, aws_client, git_client, image_configs, latest_object = \
+            self.__setup(['sha256:0', 'sha256:0'])
+
+        PromoteImageUseCase(
+            config, aws_client, git_client, False, tags).execute()
+
+        ######################################################################
+        # Should copy images of the dependency commit
+        aws_client.ecr.transfer.copy_all.assert_called_once_with([
+            (x.promote_from, latest_object, x.repository_uri,
+             [latest_object, 'latest'] + tags)
+            for x in image_configs
+        ])
+
+        ######################################################################
+        # Should forget images of destinations
+        aws_client.ecr.repositories.invalidate.assert_has_calls(
+            [mock.call(x.repository_name) for x in image_configs])
+
+    def test_execute_when_dry_run(self):
+        config, aws_client, git_client, _, _ = \
+            self.__setup(['sha256:0', 'sha256:0'])
+
+        PromoteImageUseCase(
+            config, aws_client, git_client, True, []).execute()
+
+        aws_client.ecr.transfer.copy_all.assert_called_once()
+        aws_client.ecr.repositories.invalidate.assert_not_called()
+
+    def test_execute_when_not_promoted(self):
+        config = MagicMock()
+        config.images = [config_fixtures.image()]
+        aws_client = MagicMock()
+        git_client = MagicMock()
+
+        PromoteImageUseCase(
+            config, aws_client, git_client, False, []).execute()
+
+        aws_client.ecr.transfer.copy_all.assert_not_called()
+        git_client.latest_object.assert_not_called()
+
+    def test_execute_when_source_image_not_found(self):
+        config, aws_client, git_client, image_configs, latest_object = \
+            self.__setup(['sha256:0', None])
+
+        with self.assertRaises(ImageNotFoundException) as cm:
+            PromoteImageUseCase(
+                config, aws_client, git_client, False, []).execute()
+
+        self.assertEqual(
+            '{0}:{1}'.format(image_configs[1].promote_from, latest_object),
+            cm.exception.args[1])
+        aws_client.ecr.repositories.invalidate.assert_called_once_with(
+            image_configs[0].repository_name)
+
 
 class TestRegisterTaskDefinitionUseCase(unittest.TestCase):
     def test_init(self):
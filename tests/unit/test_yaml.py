@@ -1,5 +1,7 @@
 import yaml
 import os
+import json
+import pickle
 import unittest
 import textwrap
 
@@ -10,7 +12,8 @@ from unittest.mock import MagicMock, mock_open
 
 import mimesis
 
-from deploy2ecscli.yaml import setup_loader
+from deploy2ecscli.exceptions import UnresolvedVariableException
+from deploy2ecscli.yaml import Resolver, SectionReader, Template, setup_loader
 
 
 class TestSetupLoader(unittest.TestCase):
@@ -181,3 +184,276 @@ class TestSetupLoader(unittest.TestCase):
         actual = actual['value']
 
         self.assertEqual(expect, actual)
+
+
+    @unittest.skipUnless(yaml.__with_libyaml__, 'libyaml is not available')
+    def test_libyaml(self):
+        self.assertTrue(issubclass(setup_loader(), yaml.CSafeLoader))
+
+class TestSectionReader(unittest.TestCase):
+    def test_section(self):
+        token = mimesis.Cryptographic.token_hex()
+        template = textwrap.dedent("""
+        defaults: &defaults
+            user: !Ref USER_NAME
+        master:
+            <<: *defaults
+            token: !Sub token=${TOKEN}
+        develop:
+            token: !Sub token=${MISSING_TOKEN}
+        """)
+
+        with mock.patch.dict(os.environ, {'TOKEN': token, 'USER_NAME': 'x'}):
+            subject = SectionReader(template)
+
+            with self.subTest('When only the top level is read'):
+                self.assertEqual(['defaults', 'master', 'develop'], subject.keys)
+                self.assertEqual(set(), subject.references)
+
+            with self.subTest('When section is constructed'):
+                actual = subject.section('master')
+
+                self.assertEqual(
+                    {'user': 'x', 'token': 'token=' + token}, actual)
+                self.assertEqual({'TOKEN', 'USER_NAME'}, subject.references)
+
+            with self.subTest('When section is unknown'):
+                with self.assertRaises(KeyError):
+                    subject.section('feature')
+
+    def test_compile(self):
+        template = textwrap.dedent("""
+        defaults: &defaults
+            user: !Ref USER_NAME
+        master:
+            <<: *defaults
+            token: !Sub token=${TOKEN}
+            hosts: !Split [',', !Ref HOSTS]
+        develop:
+            token: !Sub token=${MISSING_TOKEN}
+        """)
+
+        # Nothing is resolved, the compiled section can be kept
+        compiled = pickle.dumps(SectionReader(template).compile('master'))
+
+        for token in [mimesis.Cryptographic.token_hex() for _ in range(2)]:
+            environ = {'TOKEN': token, 'USER_NAME': 'x', 'HOSTS': 'a, b'}
+            with mock.patch.dict(os.environ, environ):
+                actual = pickle.loads(compiled).render()
+
+            self.assertEqual(
+                {'user': 'x', 'token': 'token=' + token, 'hosts': ['a', 'b']},
+                actual)
+            self.assertNotIn(token.encode('utf8'), compiled)
+
+    def test_init(self):
+        with self.subTest('When empty'):
+            self.assertEqual([], SectionReader('').keys)
+
+        with self.subTest('When not a mapping'):
+            with self.assertRaises(yaml.constructor.ConstructorError):
+                SectionReader('- master')
+
+
+class TestTemplate(unittest.TestCase):
+    TEMPLATE = textwrap.dedent("""
+    family: !Ref TASK_FAMILY
+    image: !Sub ${REGISTRY}/app:${ TAG }
+    plain: !Sub no placeholder
+    command: !Split [' ', !Sub 'run --env ${ENVIRONMENT}']
+    empty: !Split [',', !Ref MISSING]
+    url: !Join
+        -   ';'
+        -   -   region=xxxxx
+            -   !Sub token=${TOKEN}
+    containers:
+        -   &container
+            name: !Ref TASK_FAMILY
+            ports: [80, 443]
+        -   *container
+    """)
+
+    def params(self):
+        return {
+            'TASK_FAMILY': mimesis.Person().username(),
+            'REGISTRY': mimesis.Internet().home_page(),
+            'TAG ': mimesis.Cryptographic.token_hex(),
+            'ENVIRONMENT': mimesis.Person().username(),
+            'TOKEN': mimesis.Cryptographic.token_hex(),
+        }
+
+    def test_render(self):
+        subject = Template(self.TEMPLATE)
+
+        for index in range(3):
+            with self.subTest('When rendered %d times' % index):
+                params = self.params()
+                expect = yaml.load(self.TEMPLATE, Loader=setup_loader(params))
+
+                actual = subject.render(params)
+
+                self.assertEqual(expect, actual)
+
+    def test_render_returns_copy(self):
+        subject = Template(self.TEMPLATE)
+        params = self.params()
+
+        actual = subject.render(params)
+        actual['containers'][0]['ports'].append(8080)
+        actual.pop('family')
+
+        self.assertEqual(
+            yaml.load(self.TEMPLATE, Loader=setup_loader(params)),
+            subject.render(params))
+
+    def test_render_with_environment(self):
+        token = mimesis.Cryptographic.token_hex()
+        subject = Template('value: !Sub token=${TOKEN}')
+
+        with mock.patch.dict(os.environ, {'TOKEN': token}):
+            self.assertEqual({'value': 'token=' + token}, subject.render())
+
+        with self.subTest('When bind variables take precedence'):
+            with mock.patch.dict(os.environ, {'TOKEN': token}):
+                self.assertEqual(
+                    {'value': 'token=x'}, subject.render({'TOKEN': 'x'}))
+
+        with self.subTest('When not found'):
+            with mock.patch.dict(os.environ, clear=True):
+                with self.assertRaises(UnresolvedVariableException) as e:
+                    subject.render()
+
+                self.assertEqual('TOKEN', e.exception.name)
+
+    def test_json(self):
+        content = json.dumps({
+            'family': '${TASK_FAMILY}',
+            'containers': [{'name': 'app', 'ports': [80, 443]}],
+        })
+
+        with self.subTest('When json'):
+            with mock.patch('yaml.load') as mock_load:
+                subject = Template(content, is_json=True)
+
+            mock_load.assert_not_called()
+            self.assertEqual(json.loads(content), subject.render())
+
+        with self.subTest('When yaml in json file'):
+            subject = Template('family: !Ref TASK_FAMILY', is_json=True)
+
+            self.assertEqual(
+                {'family': 'app'}, subject.render({'TASK_FAMILY': 'app'}))
+
+
+    def test_dump(self):
+        subject = Template(self.TEMPLATE + textwrap.dedent("""
+        ? !Ref TASK_FAMILY
+        : mapping
+        1: !!set {a, b}
+        expression: {expression: [!Ref TASK_FAMILY]}
+        secret: !SSM /app/token
+        """))
+
+        # Kept as JSON, nothing is resolved
+        actual = Template.load(json.loads(json.dumps(subject.dump())))
+
+        for _ in range(2):
+            params = self.params()
+            with mock.patch.object(Resolver, 'default', Resolver({
+                    '!SSM': lambda names: {'/app/token': params['TOKEN']}})):
+                self.assertEqual(subject.render(params), actual.render(params))
+
+            self.assertNotIn(params['TOKEN'], json.dumps(subject.dump()))
+
+        self.assertEqual({('!SSM', '/app/token')}, actual.remote_references)
+
+        with self.subTest('When not JSON'):
+            with self.assertRaises(TypeError):
+                Template('date: 2001-01-01').dump()
+
+
+class TestResolver(unittest.TestCase):
+    def setUp(self):
+        self.values = {
+            '!SSM': dict(('/app/%d' % x, mimesis.Cryptographic.token_hex())
+                         for x in range(3)),
+            '!Secret': {'app/database': mimesis.Cryptographic.token_hex()},
+        }
+        self.fetchers = {
+            '!SSM': MagicMock(side_effect=lambda names: dict(
+                (x, self.values['!SSM'][x]) for x in names)),
+            '!Secret': MagicMock(side_effect=lambda names: dict(
+                (x, self.values['!Secret'][x]) for x in names)),
+        }
+
+        self.patcher = mock.patch.object(
+            Resolver, 'default', Resolver(self.fetchers))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_prefetch(self):
+        references = [('!SSM', x) for x in self.values['!SSM']]
+        references += [('!Secret', 'app/database')]
+
+        Resolver.default.prefetch(references)
+        Resolver.default.prefetch(references)
+
+        self.fetchers['!SSM'].assert_called_once_with(
+            sorted(self.values['!SSM']))
+        self.fetchers['!Secret'].assert_called_once_with(['app/database'])
+        self.assertEqual(
+            self.values['!SSM']['/app/0'],
+            Resolver.default.get('!SSM', '/app/0'))
+
+    def test_section(self):
+        template = textwrap.dedent("""
+        master:
+            token: !SSM /app/0
+            database: !Secret app/database
+            values: !Join [',', [!SSM /app/1, !SSM /app/2]]
+        develop:
+            token: !SSM /app/missing
+        """)
+
+        subject = SectionReader(template)
+        actual = subject.section('master')
+
+        self.assertEqual({
+            'token': self.values['!SSM']['/app/0'],
+            'database': self.values['!Secret']['app/database'],
+            'values': ','.join(
+                [self.values['!SSM']['/app/1'], self.values['!SSM']['/app/2']]),
+        }, actual)
+        self.fetchers['!SSM'].assert_called_once_with(
+            ['/app/0', '/app/1', '/app/2'])
+        self.assertEqual(
+            {('!SSM', '/app/0'), ('!SSM', '/app/1'), ('!SSM', '/app/2'),
+             ('!Secret', 'app/database')},
+            subject.remote_references)
+
+    def test_template(self):
+        subject = Template(textwrap.dedent("""
+        secrets:
+            -   !SSM /app/0
+            -   !Secret app/database
+        """))
+
+        self.fetchers['!SSM'].assert_not_called()
+
+        for _ in range(2):
+            actual = subject.render()
+
+            self.assertEqual({'secrets': [
+                self.values['!SSM']['/app/0'],
+                self.values['!Secret']['app/database'],
+            ]}, actual)
+
+        self.fetchers['!SSM'].assert_called_once_with(['/app/0'])
+        self.fetchers['!Secret'].assert_called_once_with(['app/database'])
+
+    def test_without_resolver(self):
+        with mock.patch.object(Resolver, 'default', None):
+            with self.assertRaises(ValueError):
+                yaml.load('token: !SSM /app/0', Loader=setup_loader())